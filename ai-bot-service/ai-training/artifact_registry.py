@@ -0,0 +1,272 @@
+#!/usr/bin/env python3
+"""
+Veterinary AI Artifact Registry
+Versioned, immutable model exports. Every export becomes
+<root>/versions/<version_id>/ with the model files, the inference config,
+a manifest (content hash, training config, results) and optional backend
+variants. A CURRENT pointer file selects the version that is served, so a
+rollback is just moving the pointer.
+
+    python artifact_registry.py <root> list
+    python artifact_registry.py <root> promote <version_id>
+    python artifact_registry.py <root> rollback [<version_id>]
+"""
+
+import os
+import sys
+import json
+import stat
+import uuid
+import shutil
+import hashlib
+import argparse
+import logging
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+# Files a Trainer/tokenizer save_pretrained leaves behind that belong to the model itself
+ARTIFACT_PATTERNS = [
+    "config.json",
+    "generation_config.json",
+    "adapter_config.json",
+    "*.safetensors",
+    "pytorch_model*.bin",
+    "adapter_model.bin",
+    "tokenizer*",
+    "vocab.json",
+    "merges.txt",
+    "special_tokens_map.json",
+    "added_tokens.json",
+    "*.model",
+]
+
+def hash_directory(path: Path) -> str:
+    """sha256 over every file's relative path and contents, in a stable order"""
+    digest = hashlib.sha256()
+    for file in sorted(p for p in path.rglob("*") if p.is_file()):
+        digest.update(file.relative_to(path).as_posix().encode())
+        with open(file, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                digest.update(chunk)
+    return digest.hexdigest()
+
+def make_read_only(path: Path):
+    for file in path.rglob("*"):
+        if file.is_file():
+            file.chmod(stat.S_IRUSR | stat.S_IRGRP | stat.S_IROTH)
+
+class ArtifactRegistry:
+    """Immutable model versions under <root>/versions plus a CURRENT pointer"""
+
+    POINTER = "CURRENT"
+    HISTORY = "history.jsonl"
+
+    def __init__(self, root):
+        self.root = Path(root)
+        self.versions_dir = self.root / "versions"
+
+    @classmethod
+    def exists(cls, root) -> bool:
+        """True if root has a CURRENT pointer naming a version (an empty pointer file does not count)"""
+        return cls(root).current() is not None
+
+    def version_dir(self, version_id: str) -> Path:
+        return self.versions_dir / version_id
+
+    def manifest(self, version_id: str) -> Dict:
+        with open(self.version_dir(version_id) / "manifest.json", 'r') as f:
+            return json.load(f)
+
+    def list_versions(self) -> List[Dict]:
+        """Manifests of all versions, oldest first"""
+        if not self.versions_dir.exists():
+            return []
+        manifests = [
+            self.manifest(d.name) for d in self.versions_dir.iterdir()
+            if d.is_dir() and (d / "manifest.json").exists()
+        ]
+        return sorted(manifests, key=lambda m: m['created_at'])
+
+    def current(self) -> Optional[str]:
+        pointer = self.root / self.POINTER
+        if not pointer.exists():
+            return None
+        return pointer.read_text().strip() or None
+
+    def publish(self, source_dir, inference_config: Dict, training_config: Dict,
+                variants: Optional[Dict[str, Callable[[Path], None]]] = None,
+                reports: Optional[Dict[str, Path]] = None, promote: bool = True) -> str:
+        """Stage the model files of source_dir as a new immutable version and return its id.
+
+        variants maps a name to a function that writes that backend variant into the
+        directory it is given (including its own inference/config.json).
+        Publishing content that already exists reuses the existing version.
+        """
+        source_dir = Path(source_dir)
+        self.versions_dir.mkdir(parents=True, exist_ok=True)
+        staging = self.versions_dir / f".staging-{uuid.uuid4().hex}"
+        staging.mkdir()
+
+        try:
+            for pattern in ARTIFACT_PATTERNS:
+                for file in source_dir.glob(pattern):
+                    if file.is_file():
+                        shutil.copy2(file, staging / file.name)
+
+            # Paths are relative to the version directory so versions can be moved or copied
+            inference_dir = staging / "inference"
+            inference_dir.mkdir()
+            with open(inference_dir / "config.json", 'w') as f:
+                json.dump({**inference_config, "model_path": ".", "tokenizer_path": "."}, f, indent=2)
+
+            for name, build in (variants or {}).items():
+                variant_dir = staging / "variants" / name
+                variant_dir.mkdir(parents=True)
+                try:
+                    build(variant_dir)
+                except Exception as e:
+                    logger.warning(f"⚠️ Skipping '{name}' variant: {e}")
+                    shutil.rmtree(variant_dir)
+
+            content_hash = hash_directory(staging)
+            version_id = next(
+                (m['version'] for m in self.list_versions() if m['content_hash'] == content_hash), None
+            )
+            if version_id:
+                logger.info(f"📦 Identical export already registered as {version_id}")
+                shutil.rmtree(staging)
+            else:
+                version_id = f"{datetime.now():%Y%m%d-%H%M%S}-{content_hash[:12]}"
+                variants_dir = staging / "variants"
+                manifest = {
+                    "version": version_id,
+                    "created_at": datetime.now().isoformat(),
+                    "content_hash": content_hash,
+                    "source_dir": str(source_dir),
+                    "parent": self.current(),
+                    "variants": sorted(d.name for d in variants_dir.iterdir()) if variants_dir.exists() else [],
+                    "training_config": training_config,
+                    "inference_config": inference_config,
+                }
+                with open(staging / "manifest.json", 'w') as f:
+                    json.dump(manifest, f, indent=2, default=str)
+
+                make_read_only(staging)
+                staging.rename(self.version_dir(version_id))
+                logger.info(f"📦 Registered version {version_id} ({len(manifest['variants'])} variants)")
+        except BaseException:
+            shutil.rmtree(staging, ignore_errors=True)
+            raise
+
+        # Reports are results about a version, not part of its content hash, so a reused version gets them too
+        for name, path in (reports or {}).items():
+            if Path(path).exists():
+                with open(path, 'r', encoding='utf-8') as f:
+                    self.attach_report(version_id, name, json.load(f))
+                logger.info(f"📝 Attached {name} report to {version_id}")
+
+        if promote:
+            self.promote(version_id)
+        return version_id
+
+    def attach_report(self, version_id: str, name: str, report: Dict):
+        """Store an eval/benchmark result next to a version"""
+        reports_dir = self.version_dir(version_id) / "reports"
+        reports_dir.mkdir(exist_ok=True)
+        with open(reports_dir / f"{name}.json", 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+
+    def promote(self, version_id: str, action: str = "promote"):
+        """Atomically point CURRENT at a version"""
+        if not (self.version_dir(version_id) / "manifest.json").exists():
+            raise ValueError(f"Unknown version {version_id}")
+
+        previous = self.current()
+        tmp = self.root / f".{self.POINTER}.tmp"
+        tmp.write_text(version_id + "\n")
+        os.replace(tmp, self.root / self.POINTER)
+
+        with open(self.root / self.HISTORY, 'a') as f:
+            f.write(json.dumps({
+                "timestamp": datetime.now().isoformat(),
+                "from": previous,
+                "to": version_id,
+                "action": action,
+            }) + "\n")
+        logger.info(f"🔀 CURRENT -> {version_id} (was {previous})")
+
+    def served_versions(self) -> List[str]:
+        """Versions CURRENT went through that a rollback can return to, oldest first.
+
+        Promotions push onto the chain, a rollback pops back to the version it restored.
+        """
+        history_path = self.root / self.HISTORY
+        chain = []
+        if history_path.exists():
+            with open(history_path, 'r') as f:
+                for line in f:
+                    if not line.strip():
+                        continue
+                    entry = json.loads(line)
+                    target = entry['to']
+                    if entry.get('action') == 'rollback' and target in chain:
+                        del chain[len(chain) - chain[::-1].index(target):]
+                    elif not chain or chain[-1] != target:
+                        chain.append(target)
+
+        # CURRENT may have been edited by hand
+        current = self.current()
+        if current in chain:
+            del chain[len(chain) - chain[::-1].index(current):]
+        elif current:
+            chain.append(current)
+        return chain
+
+    def rollback(self, version_id: Optional[str] = None) -> str:
+        """Point CURRENT back at the version served before it, or at an earlier served version_id"""
+        chain = self.served_versions()
+        earlier = chain[:-1]
+        if version_id is None:
+            if not earlier:
+                raise ValueError(f"No earlier version to roll back to from {self.current()}")
+            version_id = earlier[-1]
+        elif version_id not in earlier:
+            raise ValueError(f"{version_id} was not served before {self.current()}")
+
+        self.promote(version_id, action="rollback")
+        return version_id
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Manage exported veterinary AI model versions")
+    parser.add_argument('root', help="Model directory holding versions/ and CURRENT")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    subparsers.add_parser('list', help="List registered versions")
+    promote = subparsers.add_parser('promote', help="Serve a specific version")
+    promote.add_argument('version')
+    rollback = subparsers.add_parser('rollback', help="Serve the previously served version again")
+    rollback.add_argument('version', nargs='?', help="Roll back further, to this earlier served version")
+    args = parser.parse_args()
+
+    registry = ArtifactRegistry(args.root)
+    try:
+        if args.command == 'list':
+            current = registry.current()
+            for manifest in registry.list_versions():
+                marker = "*" if manifest['version'] == current else " "
+                reports_dir = registry.version_dir(manifest['version']) / "reports"
+                reports = sorted(p.stem for p in reports_dir.glob("*.json")) if reports_dir.exists() else []
+                print(f"{marker} {manifest['version']}  variants={manifest['variants']}  reports={reports}")
+        elif args.command == 'promote':
+            registry.promote(args.version)
+        else:
+            registry.rollback(args.version)
+    except ValueError as e:
+        print(f"❌ {e}", file=sys.stderr)
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,784 @@
+#!/usr/bin/env python3
+"""
+Veterinary AI Benchmarks
+Reproducible performance measurements for the Python side of the bot.
+
+    python benchmark.py inference <model_path> [--mode protocol|direct] [--concurrency N]
+    python benchmark.py data-pipeline [--sizes 10000 100000 1000000] [--workers 0 2]
+    python benchmark.py extraction [--documents 20000]
+    python benchmark.py storage [--entries 100000]
+
+The inference benchmark drives the exported model either through the same
+JSON-lines stdin/stdout protocol the Node.js service uses (``protocol``) or by
+calling VeterinaryAIInferenceServer in-process (``direct``, which can also
+measure time-to-first-token).
+
+The data-pipeline benchmark generates synthetic veterinary JSONL corpora and
+times model_trainer.py's data path (load, tokenize, pack, collate and one
+DataLoader epoch) under each padding, packing and worker setting.
+
+The extraction benchmark runs data_collector.py's single-pass KeywordExtractor
+and the per-field regex extraction it replaced over the same synthetic
+documents, reporting docs/sec for both and any document where they disagree.
+
+The storage benchmark writes synthetic knowledge entries and their training
+pairs through the collector's batched SQLite path (100k entries is about 1.1M
+rows), first into an empty database and then again as changed documents that
+replace the stored ones, and reports rows/sec for both passes plus the time
+to export the training JSONL and to compute the collection statistics.
+
+Results are written as JSON so every change can be compared on the same numbers.
+"""
+
+import os
+import sys
+import json
+import time
+import queue
+import random
+import logging
+import argparse
+import resource
+import threading
+import subprocess
+from pathlib import Path
+from typing import Dict, List, Optional
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+import psutil
+
+from evaluation import latency_summary
+from artifact_registry import ArtifactRegistry
+
+# Setup logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Fixed prompt set covering the species and languages the bot serves
+BENCHMARK_PROMPTS = [
+    {"query": "My dog is vomiting and has diarrhea. What should I do?", "species": "dog", "language": "en"},
+    {"query": "My cat has not eaten for two days. Is this serious?", "species": "cat", "language": "en"},
+    {"query": "My parrot is plucking its feathers. What could be wrong?", "species": "bird", "language": "en"},
+    {"query": "How often should I feed my rabbit?", "species": "rabbit", "language": "en"},
+    {"query": "My hamster is sneezing a lot. Should I worry?", "species": "hamster", "language": "en"},
+    {"query": "My goldfish is floating on its side.", "species": "fish", "language": "en"},
+    {"query": "My gecko is not shedding properly.", "species": "reptile", "language": "en"},
+    {"query": "What are the signs of hip dysplasia?", "species": "general", "language": "en"},
+    {"query": "Manam sunim ir caureja un vemšana. Ko darīt?", "species": "dog", "language": "lv"},
+    {"query": "Mans kaķis neēd jau divas dienas.", "species": "cat", "language": "lv"},
+    {"query": "Mans trusis ir letarģisks un neēd.", "species": "rabbit", "language": "lv"},
+    {"query": "У моей собаки рвота и понос. Что делать?", "species": "dog", "language": "ru"},
+    {"query": "Моя кошка не ест уже два дня. Это опасно?", "species": "cat", "language": "ru"},
+    {"query": "Мой попугай выщипывает перья. В чём причина?", "species": "bird", "language": "ru"},
+    {"query": "Как часто нужно кормить хомяка?", "species": "hamster", "language": "ru"},
+]
+
+def build_requests(num_requests: int, seed: int) -> List[Dict]:
+    """Cycle through the prompt set in a seeded order so every run sends the same requests"""
+    prompts = list(BENCHMARK_PROMPTS)
+    random.Random(seed).shuffle(prompts)
+    return [dict(prompts[i % len(prompts)], context='') for i in range(num_requests)]
+
+class PeakMemorySampler:
+    """Polls the RSS of a process (and its children) in the background and keeps the maximum"""
+
+    def __init__(self, pid: int, interval: float = 0.05):
+        self.process = psutil.Process(pid)
+        self.interval = interval
+        self.peak_rss = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                rss = self.process.memory_info().rss
+                rss += sum(child.memory_info().rss for child in self.process.children(recursive=True))
+                self.peak_rss = max(self.peak_rss, rss)
+            except psutil.Error:
+                pass
+            self._stop.wait(self.interval)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self) -> float:
+        self._stop.set()
+        self._thread.join()
+        return self.peak_rss / (1024 * 1024)
+
+class FirstTokenTimer:
+    """Minimal generate() streamer that records when the first new token is produced"""
+
+    def __init__(self):
+        self.prompt_seen = False
+        self.first_token_time = None
+
+    def put(self, value):
+        # The first call carries the prompt ids, the next one the first generated token
+        if not self.prompt_seen:
+            self.prompt_seen = True
+        elif self.first_token_time is None:
+            self.first_token_time = time.perf_counter()
+
+    def end(self):
+        pass
+
+def run_direct(model_path: str, requests: List[Dict], warmup: List[Dict], concurrency: int, seed: int) -> Dict:
+    """Benchmark VeterinaryAIInferenceServer in-process"""
+    import torch
+    from inference_server import VeterinaryAIInferenceServer
+
+    torch.manual_seed(seed)
+    sampler = PeakMemorySampler(os.getpid()).start()
+
+    start = time.perf_counter()
+    server = VeterinaryAIInferenceServer(model_path)
+    cold_start = time.perf_counter() - start
+
+    for request in warmup:
+        server.generate_response(request)
+
+    def timed_request(request):
+        timer = FirstTokenTimer()
+        request_start = time.perf_counter()
+        response = server.generate_response(request, streamer=timer)
+        latency = time.perf_counter() - request_start
+        ttft = timer.first_token_time - request_start if timer.first_token_time else None
+        return request, response, latency, ttft
+
+    run_start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(timed_request, requests))
+    wall_time = time.perf_counter() - run_start
+
+    return {
+        'cold_start_seconds': cold_start,
+        'wall_seconds': wall_time,
+        'peak_rss_mb': sampler.stop(),
+        'results': results,
+    }
+
+def run_protocol(model_path: str, requests: List[Dict], warmup: List[Dict], concurrency: int,
+                 startup_timeout: float = 300.0) -> Dict:
+    """Benchmark inference_server.py over the JSON-lines stdin/stdout protocol"""
+    script = Path(__file__).parent / "inference_server.py"
+
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, str(script), model_path],
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+        text=True,
+        encoding='utf-8',
+        bufsize=1
+    )
+    sampler = PeakMemorySampler(process.pid).start()
+
+    # One thread owns stdout, so waiting for a line can time out even when the server writes nothing
+    lines = queue.Queue()
+
+    def read_stdout():
+        for line in process.stdout:
+            lines.put(line)
+        lines.put(None)
+
+    threading.Thread(target=read_stdout, daemon=True).start()
+
+    def send(request):
+        process.stdin.write(json.dumps(request, ensure_ascii=False) + '\n')
+        process.stdin.flush()
+
+    def receive() -> Dict:
+        line = lines.get()
+        if line is None:
+            raise RuntimeError("Inference server closed its output")
+        return json.loads(line)
+
+    try:
+        # Same readiness signal LocalAIProvider waits for
+        while True:
+            try:
+                line = lines.get(timeout=max(0.0, startup_timeout - (time.perf_counter() - start)))
+            except queue.Empty:
+                raise RuntimeError("Timeout waiting for inference server to start") from None
+            if line is None:
+                raise RuntimeError("Inference server exited before it was ready")
+            if "Model loaded successfully" in line:
+                break
+        cold_start = time.perf_counter() - start
+
+        for request in warmup:
+            send(request)
+            receive()
+
+        # The server answers in FIFO order, so keep up to `concurrency` requests in flight
+        in_flight = threading.Semaphore(concurrency)
+        pending = queue.Queue()
+        results = []
+
+        def reader():
+            for _ in requests:
+                request, sent_at = pending.get()
+                response = receive()
+                results.append((request, response, time.perf_counter() - sent_at, None))
+                in_flight.release()
+
+        reader_thread = threading.Thread(target=reader, daemon=True)
+        run_start = time.perf_counter()
+        reader_thread.start()
+
+        for request in requests:
+            in_flight.acquire()
+            pending.put((request, time.perf_counter()))
+            send(request)
+
+        reader_thread.join()
+        wall_time = time.perf_counter() - run_start
+    finally:
+        peak_rss = sampler.stop()
+        process.stdin.close()
+        process.terminate()
+        process.wait()
+
+    return {
+        'cold_start_seconds': cold_start,
+        'wall_seconds': wall_time,
+        'peak_rss_mb': peak_rss,
+        'results': results,
+    }
+
+def summarize(mode: str, model_path: str, concurrency: int, run: Dict) -> Dict:
+    """Turn raw per-request timings into the machine-readable report"""
+    per_request = []
+    completion_tokens = 0
+    for request, response, latency, ttft in run['results']:
+        tokens = response.get('usage', {}).get('completion_tokens', 0)
+        completion_tokens += tokens
+        per_request.append({
+            'species': request['species'],
+            'language': request['language'],
+            'latency_seconds': latency,
+            'ttft_seconds': ttft,
+            'completion_tokens': tokens,
+            'tokens_per_second': tokens / latency if latency else 0.0,
+            'error': response.get('error'),
+        })
+
+    ttfts = [r['ttft_seconds'] for r in per_request if r['ttft_seconds'] is not None]
+    wall = run['wall_seconds']
+    return {
+        'timestamp': datetime.now().isoformat(),
+        'benchmark': 'inference',
+        'mode': mode,
+        'model_path': model_path,
+        'concurrency': concurrency,
+        'num_requests': len(per_request),
+        'errors': sum(1 for r in per_request if r['error']),
+        'cold_start_seconds': run['cold_start_seconds'],
+        'latency_seconds': latency_summary([r['latency_seconds'] for r in per_request]),
+        # The stdin/stdout protocol only returns whole answers, so TTFT needs direct mode
+        'ttft_seconds': latency_summary(ttfts) if ttfts else None,
+        'requests_per_second': len(per_request) / wall if wall else 0.0,
+        'tokens_per_second': completion_tokens / wall if wall else 0.0,
+        'per_request_tokens_per_second': latency_summary([r['tokens_per_second'] for r in per_request]),
+        'peak_rss_mb': run['peak_rss_mb'],
+        'per_request': per_request,
+    }
+
+def write_results(results: Dict, output: Optional[str]) -> Path:
+    """Write a benchmark report, by default into benchmarks/<name>_<timestamp>.json"""
+    if output:
+        path = Path(output)
+    else:
+        stamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        path = Path("benchmarks") / f"{results['benchmark']}_{stamp}.json"
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2, ensure_ascii=False)
+    return path
+
+def benchmark_inference(args):
+    requests = build_requests(args.num_requests + args.warmup, args.seed)
+    warmup, measured = requests[:args.warmup], requests[args.warmup:]
+
+    logger.info(
+        f"🏁 Inference benchmark: {args.mode} mode, {len(measured)} requests, "
+        f"concurrency {args.concurrency}, {len(warmup)} warmup"
+    )
+    if args.mode == 'direct':
+        run = run_direct(args.model_path, measured, warmup, args.concurrency, args.seed)
+    else:
+        run = run_protocol(args.model_path, measured, warmup, args.concurrency)
+
+    results = summarize(args.mode, args.model_path, args.concurrency, run)
+    path = write_results(results, args.output)
+
+    # Keep the numbers with the version they were measured on
+    if ArtifactRegistry.exists(args.model_path):
+        registry = ArtifactRegistry(args.model_path)
+        registry.attach_report(registry.current(), f"benchmark_{args.mode}", results)
+
+    latency = results['latency_seconds']
+    logger.info(
+        f"✅ cold start {results['cold_start_seconds']:.1f}s, p50 {latency.get('p50', 0):.2f}s, "
+        f"p95 {latency.get('p95', 0):.2f}s, p99 {latency.get('p99', 0):.2f}s, "
+        f"{results['tokens_per_second']:.1f} tokens/s, peak RSS {results['peak_rss_mb']:.0f} MB"
+    )
+    logger.info(f"📄 Results written to {path}")
+
+SYNTHETIC_SPECIES = ['dog', 'cat', 'bird', 'rabbit', 'hamster', 'guinea_pig', 'fish', 'reptile']
+SYNTHETIC_SYMPTOMS = [
+    'vomiting', 'diarrhea', 'coughing', 'sneezing', 'lethargy', 'fever', 'loss of appetite',
+    'limping', 'itching', 'hair loss', 'swelling', 'seizure', 'difficulty breathing'
+]
+SYNTHETIC_CATEGORIES = [
+    'digestive', 'respiratory', 'skin', 'orthopedic', 'neurological', 'nutrition',
+    'infectious', 'emergency', 'urinary', 'general'
+]
+SYNTHETIC_QUESTIONS = [
+    "My {species} has {symptom}, what could it be?",
+    "What causes {symptom} in a {species}?",
+    "How do I treat {symptom} in my {species}?",
+    "Is {symptom} an emergency for a {species}?",
+    "What are {category} problems in a {species}?",
+]
+SYNTHETIC_SENTENCES = [
+    "{Symptom} in a {species} can have many causes, from mild dietary upsets to serious {category} disease.",
+    "Monitor your {species} closely for the next 24 hours and note any change in appetite or behaviour.",
+    "Make sure fresh water is always available and keep the environment calm and warm.",
+    "If {symptom} lasts more than a day or is accompanied by lethargy, contact a veterinarian.",
+    "Your veterinarian may recommend blood tests, imaging or a physical examination to find the cause.",
+    "Treatment options may include fluid therapy, dietary change, anti-inflammatory medication or rest.",
+    "Never give human medications to a {species} without veterinary advice, many are toxic to animals.",
+    "Young, old and chronically ill animals are at higher risk and should be seen sooner.",
+    "Keep a short diary of symptoms, food and medications to help your veterinarian.",
+    "Always consult with a qualified veterinarian for proper diagnosis and treatment.",
+]
+
+def generate_synthetic_corpus(path: Path, rows: int, seed: int = 42):
+    """Write a seeded synthetic corpus in the export_training_data JSONL format"""
+    rng = random.Random(seed)
+    path.parent.mkdir(parents=True, exist_ok=True)
+
+    with open(path, 'w', encoding='utf-8') as f:
+        for _ in range(rows):
+            values = {
+                'species': rng.choice(SYNTHETIC_SPECIES),
+                'symptom': rng.choice(SYNTHETIC_SYMPTOMS),
+                'category': rng.choice(SYNTHETIC_CATEGORIES),
+            }
+            values['Symptom'] = values['symptom'].capitalize()
+            # Vary answer length so padding and packing settings actually differ
+            sentences = rng.sample(SYNTHETIC_SENTENCES, rng.randint(1, len(SYNTHETIC_SENTENCES)))
+            example = {
+                "instruction": "You are a veterinary AI assistant. Provide helpful and accurate veterinary advice.",
+                "input": rng.choice(SYNTHETIC_QUESTIONS).format(**values),
+                "output": " ".join(sentence.format(**values) for sentence in sentences),
+                "metadata": {
+                    "species": [values['species']],
+                    "category": values['category'],
+                    "language": "en",
+                    "confidence": round(rng.uniform(0.6, 1.0), 3)
+                }
+            }
+            f.write(json.dumps(example, ensure_ascii=False) + '\n')
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is reported in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def time_collator(collator, dataset, batch_size: int, max_batches: int) -> Dict:
+    """Collate pre-fetched batches in-process to isolate collation cost"""
+    limit = min(len(dataset), batch_size * max_batches)
+    features = dataset.select(range(limit)).to_list()
+    batches = [features[i:i + batch_size] for i in range(0, len(features), batch_size)]
+
+    start = time.perf_counter()
+    for batch in batches:
+        collator(batch)
+    elapsed = time.perf_counter() - start
+
+    return {
+        'batches': len(batches),
+        'seconds': elapsed,
+        'batches_per_second': len(batches) / elapsed if elapsed else 0.0,
+        'samples_per_second': len(features) / elapsed if elapsed else 0.0,
+    }
+
+def time_epoch(collator, dataset, batch_size: int, num_workers: int, seed: int) -> Dict:
+    """One full shuffled DataLoader epoch, the way the Trainer iterates the training set"""
+    import torch
+    from torch.utils.data import DataLoader
+
+    loader = DataLoader(
+        dataset,
+        batch_size=batch_size,
+        shuffle=True,
+        num_workers=num_workers,
+        collate_fn=collator,
+        generator=torch.Generator().manual_seed(seed)
+    )
+
+    samples = 0
+    tokens = 0
+    padded_tokens = 0
+    start = time.perf_counter()
+    for batch in loader:
+        samples += batch['input_ids'].shape[0]
+        padded_tokens += batch['input_ids'].numel()
+        tokens += int(batch['attention_mask'].sum())
+    elapsed = time.perf_counter() - start
+
+    return {
+        'seconds': elapsed,
+        'samples_per_second': samples / elapsed if elapsed else 0.0,
+        'tokens_per_second': tokens / elapsed if elapsed else 0.0,
+        'padding_ratio': 1 - tokens / padded_tokens if padded_tokens else 0.0,
+    }
+
+def benchmark_data_pipeline(args):
+    import pandas as pd
+    from datasets import Dataset
+    from model_trainer import ModelConfig, VeterinaryModelTrainer
+
+    data_dir = Path(args.data_dir)
+    results = {
+        'timestamp': datetime.now().isoformat(),
+        'benchmark': 'data_pipeline',
+        'tokenizer': args.base_model,
+        'model_max_length': args.max_length,
+        'batch_size': args.batch_size,
+        'runs': [],
+    }
+
+    for rows in args.sizes:
+        corpus = data_dir / f"synthetic_{rows}.jsonl"
+        if not corpus.exists():
+            logger.info(f"📝 Generating synthetic corpus with {rows} rows at {corpus}")
+            generate_synthetic_corpus(corpus, rows, args.seed)
+
+        config = ModelConfig(
+            base_model_name=args.base_model,
+            model_max_length=args.max_length,
+            train_data_path=str(corpus),
+            output_dir=str(data_dir / "trainer"),
+            max_samples=None
+        )
+        trainer = VeterinaryModelTrainer(config)
+        trainer.load_tokenizer()
+
+        start = time.perf_counter()
+        dataset = Dataset.from_pandas(pd.DataFrame(trainer.load_raw_examples()))
+        load_seconds = time.perf_counter() - start
+        logger.info(f"📚 {rows} rows loaded in {load_seconds:.1f}s")
+
+        for workers in args.workers:
+            config.preprocessing_num_workers = workers or None
+            config.dataloader_num_workers = workers
+
+            start = time.perf_counter()
+            tokenized = trainer.tokenize_dataset(dataset)
+            tokenize_seconds = time.perf_counter() - start
+
+            for pack in args.packing:
+                start = time.perf_counter()
+                prepared = trainer.pack_dataset(tokenized) if pack else tokenized
+                pack_seconds = time.perf_counter() - start
+
+                for padding in args.padding:
+                    config.padding = padding
+                    collator = trainer.build_data_collator()
+
+                    run = {
+                        'rows': rows,
+                        'workers': workers,
+                        'packing': pack,
+                        'padding': padding,
+                        'training_sequences': len(prepared),
+                        'load': {'seconds': load_seconds, 'rows_per_second': rows / load_seconds if load_seconds else 0.0},
+                        'tokenize': {'seconds': tokenize_seconds, 'rows_per_second': rows / tokenize_seconds if tokenize_seconds else 0.0},
+                        'pack_seconds': pack_seconds,
+                        'collate': time_collator(collator, prepared, args.batch_size, args.collate_batches),
+                        'epoch': time_epoch(collator, prepared, args.batch_size, workers, args.seed),
+                        'peak_rss_mb': peak_rss_mb(),
+                    }
+                    results['runs'].append(run)
+
+                    logger.info(
+                        f"⏱️ rows={rows} workers={workers} packing={pack} padding={padding}: "
+                        f"tokenize {run['tokenize']['rows_per_second']:.0f} rows/s, "
+                        f"epoch {run['epoch']['samples_per_second']:.0f} samples/s, "
+                        f"padding {run['epoch']['padding_ratio']:.0%}"
+                    )
+
+        trainer.writer.close()
+
+    path = write_results(results, args.output)
+    logger.info(f"📄 Results written to {path}")
+
+def synthetic_documents(count: int, seed: int) -> List[tuple]:
+    """Seeded (title, content) pairs shaped like collected articles"""
+    rng = random.Random(seed)
+    documents = []
+    for _ in range(count):
+        values = {
+            'species': rng.choice(SYNTHETIC_SPECIES).replace('_', ' '),
+            'symptom': rng.choice(SYNTHETIC_SYMPTOMS),
+            'category': rng.choice(SYNTHETIC_CATEGORIES),
+        }
+        values['Symptom'] = values['symptom'].capitalize()
+        sentences = rng.choices(SYNTHETIC_SENTENCES, k=rng.randint(2, 4 * len(SYNTHETIC_SENTENCES)))
+        title = rng.choice(SYNTHETIC_QUESTIONS).format(**values)
+        documents.append((title, " ".join(sentence.format(**values) for sentence in sentences)))
+    return documents
+
+def legacy_extract(content: str, title: str) -> Dict:
+    """The per-field extraction data_collector.py used before KeywordExtractor: one regex scan per pattern"""
+    from data_collector import (
+        SPECIES_TERMS, CATEGORY_TERMS, SYMPTOM_TERMS, TREATMENT_TERMS, MEDICATION_TERMS,
+        URGENCY_TERMS, MEDICAL_TERMS, TITLE_KEYWORDS
+    )
+    import re
+
+    def pattern(terms):
+        return r'\b(' + '|'.join(terms) + r')\b'
+
+    text_lower = content.lower()
+    species = [name for name, terms in SPECIES_TERMS.items() if re.search(pattern(terms), text_lower)] or ['general']
+    category = next((name for name, terms in CATEGORY_TERMS.items() if re.search(pattern(terms), text_lower)), 'general')
+    urgency = next((level for level, terms in URGENCY_TERMS.items() if re.search(pattern(terms), text_lower)), 'low')
+
+    def find_all(groups):
+        return sorted({match for terms in groups for match in re.findall(pattern(terms), text_lower)})
+
+    score = 0.5
+    if len(content) > 500:
+        score += 0.2
+    elif len(content) > 200:
+        score += 0.1
+    if 'general' not in species:
+        score += 0.1
+    if any(keyword in title.lower() for keyword in TITLE_KEYWORDS):
+        score += 0.1
+    score += min(len(re.findall(pattern(MEDICAL_TERMS), text_lower)) * 0.02, 0.1)
+
+    return {
+        'species': species,
+        'category': category,
+        'symptoms': find_all(SYMPTOM_TERMS),
+        'treatments': find_all(TREATMENT_TERMS),
+        'medications': find_all(MEDICATION_TERMS),
+        'urgency': urgency,
+        'confidence': min(score, 1.0),
+    }
+
+def benchmark_extraction(args):
+    from data_collector import KeywordExtractor
+
+    documents = synthetic_documents(args.documents, args.seed)
+    # Real pages too: any JSONL with title/content fields, e.g. an export of the knowledge table
+    for path in args.corpus or []:
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                row = json.loads(line)
+                documents.append((row.get('title', ''), row.get('content', '')))
+
+    extractor = KeywordExtractor()
+    implementations = {
+        'per_field_regex': legacy_extract,
+        'keyword_extractor': extractor.extract,
+    }
+
+    results = {
+        'timestamp': datetime.now().isoformat(),
+        'benchmark': 'extraction',
+        'documents': len(documents),
+        'characters': sum(len(content) for _, content in documents),
+        'runs': {},
+    }
+    outputs = {}
+    for name, extract in implementations.items():
+        extract(*documents[0])  # Warm the re module cache
+        start = time.perf_counter()
+        outputs[name] = [extract(content, title) for title, content in documents]
+        elapsed = time.perf_counter() - start
+        results['runs'][name] = {
+            'seconds': elapsed,
+            'docs_per_second': len(documents) / elapsed if elapsed else 0.0,
+            'mb_per_second': results['characters'] / elapsed / 1e6 if elapsed else 0.0,
+        }
+        logger.info(f"⏱️ {name}: {results['runs'][name]['docs_per_second']:.0f} docs/s")
+
+    mismatches = [
+        {'title': title, 'expected': expected, 'actual': actual}
+        for (title, _), expected, actual in zip(documents, outputs['per_field_regex'], outputs['keyword_extractor'])
+        if expected != actual
+    ]
+    results['identical_outputs'] = not mismatches
+    results['mismatches'] = mismatches[:20]
+    results['speedup'] = (
+        results['runs']['per_field_regex']['seconds'] / results['runs']['keyword_extractor']['seconds']
+        if results['runs']['keyword_extractor']['seconds'] else 0.0
+    )
+
+    path = write_results(results, args.output)
+    if mismatches:
+        logger.warning(f"⚠️ {len(mismatches)} documents extracted differently, see {path}")
+    logger.info(f"✅ {results['speedup']:.1f}x faster, identical outputs: {results['identical_outputs']}")
+    logger.info(f"📄 Results written to {path}")
+
+def synthetic_entries(count: int, seed: int, revision: int) -> List:
+    """Seeded knowledge entries; the same documents with new content for every revision"""
+    from data_collector import VeterinaryKnowledge, content_digest, make_entry_id
+
+    rng = random.Random(seed)
+    entries = []
+    for i in range(count):
+        species = rng.choice(SYNTHETIC_SPECIES)
+        symptoms = rng.sample(SYNTHETIC_SYMPTOMS, 3)
+        values = {'species': species, 'symptom': symptoms[0], 'Symptom': symptoms[0].capitalize(), 'category': 'digestive'}
+        title = f"Synthetic article {i}"
+        url = f"https://example.org/health/{i}"
+        content = " ".join(sentence.format(**values) for sentence in rng.sample(SYNTHETIC_SENTENCES, 5))
+        content += f" Revision {revision}."
+        entries.append(VeterinaryKnowledge(
+            id=make_entry_id('web', 'en', url, title),
+            title=title,
+            content=content,
+            species=[species],
+            category='digestive',
+            source='example.org',
+            url=url,
+            language='en',
+            confidence=round(rng.uniform(0.6, 1.0), 3),
+            symptoms=symptoms,
+            treatments=['fluid therapy', 'rest'],
+            medications=[],
+            urgency='medium',
+            timestamp=datetime.now().isoformat(),
+            content_hash=content_digest(title, content)
+        ))
+    return entries
+
+def benchmark_storage(args):
+    from data_collector import VeterinaryDataCollector
+
+    db_path = Path(args.data_dir) / "storage_benchmark.db"
+    db_path.parent.mkdir(parents=True, exist_ok=True)
+    for suffix in ('', '-wal', '-shm'):
+        Path(f"{db_path}{suffix}").unlink(missing_ok=True)
+
+    collector = VeterinaryDataCollector(db_path=str(db_path), use_http_cache=False, incremental_stats=args.incremental_stats)
+    results = {
+        'timestamp': datetime.now().isoformat(),
+        'benchmark': 'storage',
+        'entries': args.entries,
+        'batch_size': args.batch_size,
+        'incremental_stats': args.incremental_stats,
+        'runs': [],
+    }
+
+    # Second pass: every document changed, so each batch also deletes the old rows and pairs
+    for revision, name in enumerate(['insert', 'replace']):
+        entries = synthetic_entries(args.entries, args.seed, revision)
+        collector.write_stats = {'entries': 0, 'pairs': 0, 'replaced': 0}
+
+        start = time.perf_counter()
+        for i in range(0, len(entries), args.batch_size):
+            collector.store_knowledge_entries(entries[i:i + args.batch_size])
+        elapsed = time.perf_counter() - start
+
+        stats = collector.write_stats
+        rows = stats['entries'] + stats['pairs']
+        run = {
+            'pass': name,
+            'entries': stats['entries'],
+            'pairs': stats['pairs'],
+            'replaced': stats['replaced'],
+            'rows': rows,
+            'seconds': elapsed,
+            'rows_per_second': rows / elapsed if elapsed else 0.0,
+            'entries_per_second': stats['entries'] / elapsed if elapsed else 0.0,
+            'database_mb': sum(Path(f"{db_path}{suffix}").stat().st_size for suffix in ('', '-wal') if Path(f"{db_path}{suffix}").exists()) / 1e6,
+            'peak_rss_mb': peak_rss_mb(),
+        }
+        results['runs'].append(run)
+        logger.info(f"⏱️ {name}: {rows} rows in {elapsed:.1f}s, {run['rows_per_second']:.0f} rows/s")
+
+    start = time.perf_counter()
+    exported = collector.export_training_data(str(db_path.parent / "storage_benchmark_export.jsonl"))
+    elapsed = time.perf_counter() - start
+    results['export'] = {
+        'rows': exported,
+        'seconds': elapsed,
+        'rows_per_second': exported / elapsed if elapsed else 0.0,
+        'peak_rss_mb': peak_rss_mb(),
+    }
+
+    start = time.perf_counter()
+    collector.get_statistics()
+    results['statistics_seconds'] = time.perf_counter() - start
+    logger.info(
+        f"⏱️ export: {exported} rows in {results['export']['seconds']:.1f}s, "
+        f"statistics in {results['statistics_seconds']:.3f}s"
+    )
+
+    collector.close()
+    path = write_results(results, args.output)
+    logger.info(f"📄 Results written to {path}")
+
+def main():
+    """Main function"""
+    parser = argparse.ArgumentParser(description="Veterinary AI performance benchmarks")
+    subparsers = parser.add_subparsers(dest='benchmark', required=True)
+
+    inference = subparsers.add_parser('inference', help="Latency/throughput of the exported model")
+    inference.add_argument('model_path', help="Model directory passed to inference_server.py")
+    inference.add_argument('--mode', choices=['protocol', 'direct'], default='protocol')
+    inference.add_argument('--concurrency', type=int, default=1)
+    inference.add_argument('--num-requests', type=int, default=len(BENCHMARK_PROMPTS))
+    inference.add_argument('--warmup', type=int, default=2)
+    inference.add_argument('--seed', type=int, default=42)
+    inference.add_argument('--output', help="Result JSON path (default: benchmarks/inference_<timestamp>.json)")
+    inference.set_defaults(func=benchmark_inference)
+
+    pipeline = subparsers.add_parser('data-pipeline', help="Load/tokenize/collate/epoch throughput of the training data path")
+    pipeline.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000, 1000000])
+    pipeline.add_argument('--workers', type=int, nargs='+', default=[0, 2])
+    pipeline.add_argument('--padding', nargs='+', choices=['dynamic', 'max_length'], default=['dynamic', 'max_length'])
+    pipeline.add_argument('--packing', type=lambda v: v.lower() in ('1', 'true', 'yes'), nargs='+', default=[False, True])
+    pipeline.add_argument('--base-model', default="microsoft/DialoGPT-small", help="Tokenizer to benchmark with")
+    pipeline.add_argument('--max-length', type=int, default=512)
+    pipeline.add_argument('--batch-size', type=int, default=8)
+    pipeline.add_argument('--collate-batches', type=int, default=200)
+    pipeline.add_argument('--data-dir', default="benchmarks/data")
+    pipeline.add_argument('--seed', type=int, default=42)
+    pipeline.add_argument('--output', help="Result JSON path (default: benchmarks/data_pipeline_<timestamp>.json)")
+    pipeline.set_defaults(func=benchmark_data_pipeline)
+
+    extraction = subparsers.add_parser('extraction', help="Docs/sec of the collector's keyword extraction")
+    extraction.add_argument('--documents', type=int, default=20000, help="Synthetic documents to generate")
+    extraction.add_argument('--corpus', nargs='*', help="Additional JSONL files with title/content fields")
+    extraction.add_argument('--seed', type=int, default=42)
+    extraction.add_argument('--output', help="Result JSON path (default: benchmarks/extraction_<timestamp>.json)")
+    extraction.set_defaults(func=benchmark_extraction)
+
+    storage = subparsers.add_parser('storage', help="Rows/sec of the collector's SQLite writes")
+    storage.add_argument('--entries', type=int, default=100000, help="Knowledge entries per pass (about 11 rows each)")
+    storage.add_argument('--batch-size', type=int, default=500, help="Entries per transaction")
+    storage.add_argument('--incremental-stats', action='store_true',
+                         help="Use the trigger-maintained statistics tables instead of GROUP BY")
+    storage.add_argument('--data-dir', default="benchmarks/data")
+    storage.add_argument('--seed', type=int, default=42)
+    storage.add_argument('--output', help="Result JSON path (default: benchmarks/storage_<timestamp>.json)")
+    storage.set_defaults(func=benchmark_storage)
+
+    args = parser.parse_args()
+    args.func(args)
+
+if __name__ == "__main__":
+    main()
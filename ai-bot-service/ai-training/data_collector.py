@@ -5,21 +5,35 @@ Scrapes and processes veterinary information from multiple sources
 to create training data for our custom AI model.
 """
 
+import os
 import asyncio
 import aiohttp
+import argparse
+import hashlib
 import json
+import random
 import sqlite3
 import time
 import logging
-from typing import List, Dict, Any, Optional
+import operator
+from array import array
+from typing import List, Dict, Any, Iterator, Optional
 from dataclasses import dataclass, asdict
 from pathlib import Path
 import pandas as pd
 from bs4 import BeautifulSoup
 import requests
-from urllib.parse import urljoin, urlparse
+from urllib.parse import urljoin, urlparse, urlencode
 import re
 from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from xml.etree import ElementTree
+
+try:
+    import lxml  # noqa: F401 - only used as BeautifulSoup's (much faster) HTML parser
+    HTML_PARSER = 'lxml'
+except ImportError:
+    HTML_PARSER = 'html.parser'
 
 # Setup logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -42,17 +56,472 @@ class VeterinaryKnowledge:
     medications: List[str]
     urgency: str
     timestamp: str
+    content_hash: str = ''
+
+# Extraction vocabularies. Every entry is a list of alternatives that must match as whole
+# words in the lowercased text (the regex equivalent is r'\b(alt1|alt2|...)\b').
+SPECIES_TERMS = {
+    'dog': ['dog', 'canine', 'puppy', 'puppies'],
+    'cat': ['cat', 'feline', 'kitten', 'kittens'],
+    'bird': ['bird', 'avian', 'parrot', 'canary', 'budgie'],
+    'rabbit': ['rabbit', 'bunny', 'hare'],
+    'hamster': ['hamster', 'gerbil'],
+    'guinea_pig': ['guinea pig', 'cavy'],
+    'fish': ['fish', 'aquatic', 'goldfish'],
+    'reptile': ['reptile', 'snake', 'lizard', 'turtle', 'gecko']
+}
+CATEGORY_TERMS = {  # First matching category wins
+    'skin': ['skin', 'dermat', 'itch', 'scratch', 'rash', 'fur', 'hair', 'coat'],
+    'digestive': ['digest', 'stomach', 'intestin', 'diarrhea', 'vomit', 'nausea'],
+    'respiratory': ['breath', 'lung', 'cough', 'sneez', 'respiratory', 'pneumonia'],
+    'cardiac': ['heart', 'cardiac', 'circulation', 'blood', 'pulse'],
+    'neurological': ['brain', 'neuro', 'seizure', 'paralysis', 'behavior'],
+    'orthopedic': ['bone', 'joint', 'muscle', 'ligament', 'fracture', 'arthritis'],
+    'ophthalmologic': ['eye', 'vision', 'blind', 'cataract', 'cornea'],
+    'urinary': ['kidney', 'bladder', 'urin', 'nephro', 'cystitis'],
+    'reproductive': ['reproduct', 'pregnan', 'birth', 'mating', 'estrus'],
+    'infectious': ['infect', 'virus', 'bacteria', 'parasit', 'vaccine'],
+    'nutrition': ['diet', 'food', 'nutrition', 'feed', 'eating'],
+    'emergency': ['emergency', 'urgent', 'critical', 'poison', 'trauma']
+}
+SYMPTOM_TERMS = [
+    ['vomiting', 'vomit'], ['diarrhea', 'loose stool'],
+    ['coughing', 'cough'], ['sneezing', 'sneeze'],
+    ['lethargy', 'tired', 'weak'], ['fever', 'temperature'],
+    ['loss of appetite', 'not eating'], ['limping', 'lameness'],
+    ['scratching', 'itching'], ['hair loss', 'balding'],
+    ['bleeding', 'blood'], ['swelling', 'swollen'],
+    ['difficulty breathing', 'dyspnea'], ['seizure', 'convulsion']
+]
+TREATMENT_TERMS = [
+    ['surgery', 'surgical'], ['medication', 'medicine', 'drug'],
+    ['therapy', 'treatment'], ['antibiotic', 'antimicrobial'],
+    ['pain relief', 'analgesic'], ['rest', 'bed rest'],
+    ['diet change', 'dietary'], ['exercise', 'physical therapy'],
+    ['vaccination', 'vaccine'], ['fluid therapy', 'IV']
+]
+MEDICATION_TERMS = [  # Common veterinary medications
+    ['amoxicillin', 'penicillin', 'cephalexin'],
+    ['prednisone', 'prednisolone', 'dexamethasone'],
+    ['metacam', 'rimadyl', 'carprofen'],
+    ['tramadol', 'gabapentin', 'buprenorphine'],
+    ['furosemide', 'enalapril', 'pimobendan'],
+    ['metronidazole', 'sulfasalazine']
+]
+URGENCY_TERMS = {  # Checked in order, 'low' if none match
+    'emergency': ['emergency', 'urgent', 'critical', 'immediate', 'life-threatening', 'toxic', 'poison'],
+    'high': ['serious', 'severe', 'concerning', 'worrying', 'painful'],
+    'medium': ['monitor', 'watch', 'observe', 'check']
+}
+MEDICAL_TERMS = ['treatment', 'diagnosis', 'symptom', 'medication', 'therapy', 'condition']
+TITLE_KEYWORDS = ['veterinary', 'animal', 'pet', 'disease', 'health']
+
+class KeywordExtractor:
+    """Extracts species, category, symptoms, treatments, medications, urgency and confidence in one pass.
+
+    All vocabularies are compiled once into a single alternation over their first words.
+    One finditer over the lowercased text yields every candidate position, multi-word
+    phrases are confirmed with startswith, and each alternative group then keeps
+    re.findall's leftmost, first-alternative, non-overlapping matches, so the results
+    are the same as running every group's regex separately.
+    """
+    
+    def __init__(self):
+        # (field, label, alternatives) for every regex the per-field extractors used to run
+        self.groups = (
+            [('species', name, terms) for name, terms in SPECIES_TERMS.items()] +
+            [('category', name, terms) for name, terms in CATEGORY_TERMS.items()] +
+            [('symptoms', None, terms) for terms in SYMPTOM_TERMS] +
+            [('treatments', None, terms) for terms in TREATMENT_TERMS] +
+            [('medications', None, terms) for terms in MEDICATION_TERMS] +
+            [('urgency', level, terms) for level, terms in URGENCY_TERMS.items()] +
+            [('medical_terms', None, MEDICAL_TERMS)]
+        )
+        
+        self.phrases_by_first_word: Dict[str, List[tuple]] = {}
+        for group_index, (_, _, terms) in enumerate(self.groups):
+            for alternative, phrase in enumerate(terms):
+                first_word = re.match(r'\w+', phrase).group()
+                self.phrases_by_first_word.setdefault(first_word, []).append((group_index, alternative, phrase))
+        
+        first_words = sorted(self.phrases_by_first_word, key=len, reverse=True)
+        self.pattern = re.compile(r'\b(?:' + '|'.join(map(re.escape, first_words)) + r')\b')
+    
+    def match_groups(self, text_lower: str) -> List[List[str]]:
+        """Matched phrases per group, as re.findall(r'\b(alternatives)\b') would return them"""
+        candidates = [[] for _ in self.groups]
+        for match in self.pattern.finditer(text_lower):
+            start = match.start()
+            for group_index, alternative, phrase in self.phrases_by_first_word[match.group()]:
+                end = start + len(phrase)
+                if len(phrase) > match.end() - start:
+                    # Multi-word phrase: the rest must follow literally and end on a word boundary
+                    if not text_lower.startswith(phrase, start):
+                        continue
+                    if end < len(text_lower) and (text_lower[end].isalnum() or text_lower[end] == '_'):
+                        continue
+                candidates[group_index].append((start, alternative, end, phrase))
+        
+        matches = []
+        for group_candidates in candidates:
+            found = []
+            position = -1
+            for start, _, end, phrase in sorted(group_candidates):
+                # Sorted by (start, alternative): the first alternative wins at a position, no overlaps
+                if start >= position:
+                    found.append(phrase)
+                    position = end if end > start else start + 1
+            matches.append(found)
+        return matches
+    
+    def extract(self, content: str, title: str) -> Dict[str, Any]:
+        """All extracted fields of a document"""
+        matches = self.match_groups(content.lower())
+        by_field: Dict[str, List[tuple]] = {}
+        for (field_name, label, _), found in zip(self.groups, matches):
+            by_field.setdefault(field_name, []).append((label, found))
+        
+        species = [label for label, found in by_field['species'] if found] or ['general']
+        category = next((label for label, found in by_field['category'] if found), 'general')
+        urgency = next((label for label, found in by_field['urgency'] if found), 'low')
+        
+        # Calculate confidence based on content quality
+        score = 0.5  # Base score
+        if len(content) > 500:
+            score += 0.2
+        elif len(content) > 200:
+            score += 0.1
+        if 'general' not in species:
+            score += 0.1
+        if any(keyword in title.lower() for keyword in TITLE_KEYWORDS):
+            score += 0.1
+        score += min(len(by_field['medical_terms'][0][1]) * 0.02, 0.1)
+        
+        return {
+            'species': species,
+            'category': category,
+            'symptoms': sorted({phrase for _, found in by_field['symptoms'] for phrase in found}),
+            'treatments': sorted({phrase for _, found in by_field['treatments'] for phrase in found}),
+            'medications': sorted({phrase for _, found in by_field['medications'] for phrase in found}),
+            'urgency': urgency,
+            'confidence': min(score, 1.0),
+        }
+
+def make_entry_id(source: str, language: str, url: str, title: str) -> str:
+    """Deterministic entry ID for a document (Python's hash() is salted per process, so it changes every run)"""
+    if source == 'wikipedia':
+        key, prefix = url, f"wiki_{language}"
+    elif source == 'pubmed':
+        key, prefix = title, "pubmed"
+    else:
+        key, prefix = url, "web"
+    return f"{prefix}_{hashlib.sha1(key.encode('utf-8')).hexdigest()[:16]}"
+
+def content_digest(title: str, content: str) -> str:
+    """Stable hash of what extraction reads, so unchanged documents can be skipped"""
+    return hashlib.sha256(f"{title}\n{content}".encode('utf-8')).hexdigest()
+
+def find_article_links(soup: BeautifulSoup, base_url: str) -> List[str]:
+    """Find relevant article links on a veterinary website"""
+    links = []
+    
+    # Common patterns for veterinary article links
+    patterns = [
+        'a[href*="disease"]',
+        'a[href*="health"]',
+        'a[href*="treatment"]',
+        'a[href*="condition"]',
+        'a[href*="symptom"]',
+        '.article-link',
+        '.health-article'
+    ]
+    
+    for pattern in patterns:
+        elements = soup.select(pattern)
+        for elem in elements:
+            href = elem.get('href')
+            if href:
+                full_url = urljoin(base_url, href)
+                if is_relevant_veterinary_url(full_url):
+                    links.append(full_url)
+    
+    return list(set(links))  # Remove duplicates
+
+def is_relevant_veterinary_url(url: str) -> bool:
+    """Check if URL is relevant to veterinary content"""
+    relevant_keywords = [
+        'health', 'disease', 'treatment', 'condition', 'symptom',
+        'care', 'medical', 'veterinary', 'pet', 'animal'
+    ]
+    
+    url_lower = url.lower()
+    return any(keyword in url_lower for keyword in relevant_keywords)
+
+def extract_title(soup: BeautifulSoup) -> str:
+    """Extract title from HTML"""
+    title_selectors = ['h1', 'title', '.article-title', '.page-title']
+    
+    for selector in title_selectors:
+        element = soup.select_one(selector)
+        if element and element.get_text().strip():
+            return element.get_text().strip()
+    
+    return ''
+
+def extract_article_content(soup: BeautifulSoup) -> str:
+    """Extract main content from HTML"""
+    # Remove unwanted elements
+    for element in soup(['script', 'style', 'nav', 'footer', 'header', 'aside']):
+        element.decompose()
+    
+    # Try different content selectors
+    content_selectors = [
+        '.article-content', '.post-content', '.entry-content',
+        'article', 'main', '.content', '#content'
+    ]
+    
+    for selector in content_selectors:
+        element = soup.select_one(selector)
+        if element:
+            text = element.get_text(separator=' ', strip=True)
+            if len(text) > 100:
+                return text
+    
+    # Fallback: get all paragraph text
+    paragraphs = soup.find_all('p')
+    content = ' '.join([p.get_text(strip=True) for p in paragraphs])
+    
+    return content if len(content) > 100 else ''
+
+# Parsing and extraction run in worker processes, so everything they call is module-level
+_extractor: Optional[KeywordExtractor] = None
+PARSE_CHUNK_SIZE = 1 << 16  # Characters of XML fed to the parser at a time
+
+def read_document(title: str, content: str) -> Dict[str, Any]:
+    """A document with its content hash, before any extraction"""
+    return {'title': title, 'content': content, 'content_hash': content_digest(title, content)}
+
+def analyze_documents(documents: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """The documents with all extracted fields added"""
+    global _extractor
+    if _extractor is None:
+        _extractor = KeywordExtractor()  # Compiled once per worker process
+    return [{**document, **_extractor.extract(document['content'], document['title'])} for document in documents]
+
+def parse_index_page(html: str, base_url: str) -> List[str]:
+    """Article links of a website's landing page"""
+    return find_article_links(BeautifulSoup(html, HTML_PARSER), base_url)
+
+def parse_article_page(html: str) -> Optional[Dict[str, Any]]:
+    """An article with its content hash, or None if the page has no usable content"""
+    soup = BeautifulSoup(html, HTML_PARSER)
+    title = extract_title(soup)
+    content = extract_article_content(soup)
+    if title and content and len(content) > 100:
+        return read_document(title, content)
+    return None
+
+def parse_pubmed_articles(xml_data: str) -> List[Dict[str, Any]]:
+    """Title/abstract documents of an efetch response, with their content hashes.
+
+    The response text is fed to the parser in chunks, without an encoded copy, and every
+    article is dropped once it has been read, so only one article's element tree exists
+    at a time next to the response itself.
+    """
+    documents = []
+    parser = ElementTree.XMLPullParser(events=('start', 'end'))
+    root = None
+    for offset in range(0, len(xml_data), PARSE_CHUNK_SIZE):
+        parser.feed(xml_data[offset:offset + PARSE_CHUNK_SIZE])
+        for event, element in parser.read_events():
+            if root is None:
+                root = element
+            if event != 'end' or element.tag != 'PubmedArticle':
+                continue
+            
+            title_elem = element.find('.//ArticleTitle')
+            title = ''.join(title_elem.itertext()).strip() if title_elem is not None else ''
+            
+            # Structured abstracts have one AbstractText per section (BACKGROUND, METHODS, ...)
+            sections = []
+            for section in element.iterfind('.//Abstract/AbstractText'):
+                text = ''.join(section.itertext()).strip()
+                if text:
+                    label = section.get('Label')
+                    sections.append(f"{label}: {text}" if label else text)
+            
+            root.clear()
+            if title and sections:
+                documents.append(read_document(title, ' '.join(sections)))
+    parser.close()
+    return documents
+
+class NearDuplicateIndex:
+    """MinHash LSH index for finding near-duplicate texts.
+
+    Texts become sets of word shingles. Signatures use one-permutation hashing: every
+    shingle is hashed once into one of num_perm bins, which keeps signing cheap in pure
+    Python, and empty bins borrow from the next filled one. Signatures are cut into
+    bands; texts sharing at least two bands are candidates, confirmed when the share of
+    equal signature slots (an estimate of their Jaccard similarity) reaches the threshold.
+    With the defaults a pair at similarity 0.8 becomes a candidate 99.7% of the time,
+    while pairs far below the threshold rarely cost a comparison.
+
+    Texts must be added best first, the first text of a cluster is its representative.
+    """
+    
+    MASK = (1 << 64) - 1
+    
+    def __init__(self, threshold: float = 0.8, num_perm: int = 64, bands: int = 16, shingle_size: int = 3):
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.shingle_size = shingle_size
+        self.buckets: Dict[tuple, List[Any]] = {}
+        self.signatures: Dict[Any, array] = {}
+    
+    def signature(self, text: str) -> array:
+        words = re.findall(r'\w+', text.lower())
+        k = self.shingle_size
+        shingles = {' '.join(words[i:i + k]) for i in range(max(1, len(words) - k + 1))}
+        
+        bins = [None] * self.num_perm
+        for shingle in shingles:
+            h = int.from_bytes(hashlib.blake2b(shingle.encode('utf-8'), digest_size=8).digest(), 'big')
+            slot, value = h % self.num_perm, h // self.num_perm
+            if bins[slot] is None or value < bins[slot]:
+                bins[slot] = value
+        
+        signature = array('Q', bytes(8 * self.num_perm))
+        for i in range(self.num_perm):
+            # Next filled bin (wrapping around), offset by the distance so borrowed slots stay distinct
+            distance = 0
+            while bins[(i + distance) % self.num_perm] is None:
+                distance += 1
+            signature[i] = (bins[(i + distance) % self.num_perm] + distance * 0x9E3779B97F4A7C15) & self.MASK
+        return signature
+    
+    def add(self, key, text: str) -> Optional[Any]:
+        """Key of the indexed near-duplicate of text, or None after indexing text as a new representative"""
+        signature = self.signature(text)
+        band_keys = [
+            (band, hash(tuple(signature[band * self.rows:(band + 1) * self.rows])))
+            for band in range(self.bands)
+        ]
+        
+        hits: Dict[Any, int] = {}
+        for band_key in band_keys:
+            for candidate in self.buckets.get(band_key, ()):
+                hits[candidate] = hits.get(candidate, 0) + 1
+        
+        needed = self.threshold * self.num_perm
+        for candidate, count in sorted(hits.items(), key=lambda item: -item[1]):
+            if count < 2:
+                break
+            if sum(map(operator.eq, signature, self.signatures[candidate])) >= needed:
+                return candidate
+        
+        self.signatures[key] = signature
+        for band_key in band_keys:
+            self.buckets.setdefault(band_key, []).append(key)
+        return None
+
+class TokenBucket:
+    """Async token bucket: `rate` requests per second with bursts of up to `capacity`"""
+    
+    def __init__(self, rate: float, capacity: float = 1.0):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+    
+    async def acquire(self):
+        # Waiters queue on the lock, so tokens are handed out in arrival order
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+class HttpCache:
+    """On-disk HTTP response cache (SQLite) with the validators needed for conditional GETs"""
+    
+    def __init__(self, path: Path):
+        self.conn = sqlite3.connect(path)
+        # put/touch commit once per response on the event loop, so commits must not wait for an fsync
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                body TEXT NOT NULL,
+                etag TEXT,
+                last_modified TEXT,
+                fetched_at REAL NOT NULL
+            )
+        ''')
+        self.conn.commit()
+        self.stats = {'fresh': 0, 'revalidated': 0, 'downloaded': 0, 'bytes_downloaded': 0}
+    
+    @staticmethod
+    def make_key(url: str, params: Optional[Dict] = None) -> str:
+        return f"{url}?{urlencode(sorted(params.items()))}" if params else url
+    
+    def get(self, key: str) -> Optional[Dict]:
+        row = self.conn.execute(
+            'SELECT body, etag, last_modified, fetched_at FROM responses WHERE key = ?', (key,)
+        ).fetchone()
+        if not row:
+            return None
+        return {'body': row[0], 'etag': row[1], 'last_modified': row[2], 'fetched_at': row[3]}
+    
+    def put(self, key: str, body: str, etag: Optional[str], last_modified: Optional[str]):
+        self.conn.execute(
+            'INSERT OR REPLACE INTO responses (key, body, etag, last_modified, fetched_at) VALUES (?, ?, ?, ?, ?)',
+            (key, body, etag, last_modified, time.time())
+        )
+        self.conn.commit()
+    
+    def touch(self, key: str):
+        """A 304 confirmed the cached body, so it is fresh again"""
+        self.conn.execute('UPDATE responses SET fetched_at = ? WHERE key = ?', (time.time(), key))
+        self.conn.commit()
+    
+    def close(self):
+        self.conn.close()
 
 class VeterinaryDataCollector:
     """Collects veterinary knowledge from multiple sources"""
     
-    def __init__(self, db_path: str = "data/veterinary_knowledge.db"):
+    def __init__(self, db_path: str = "data/veterinary_knowledge.db", use_http_cache: bool = True,
+                 incremental_stats: bool = False):
         self.db_path = Path(db_path)
         self.db_path.parent.mkdir(exist_ok=True)
         self.session = None
-        self.knowledge_entries: List[VeterinaryKnowledge] = []
+        self.http_cache = HttpCache(self.db_path.parent / "http_cache.db") if use_http_cache else None
+        self.known_hashes = set()  # Content hashes already in the database, loaded per crawl
+        self.unchanged_count = 0
+        
+        # Entries are written in batches while the crawl runs instead of being kept until the end
+        self.pending_entries: List[VeterinaryKnowledge] = []
+        self.write_batch_size = 500
+        self.write_stats = {'entries': 0, 'pairs': 0, 'replaced': 0}
+        # During a crawl a single writer thread stores the batches, fetchers wait while two are queued
+        self.write_queue_size = 2
+        self.write_queue = None
+        self.export_chunk_size = 10000  # Rows fetched and written at a time by export_training_data
+        self.dedup_threshold = 0.8  # Estimated Jaccard similarity of word shingles that counts as a near-duplicate
+        # Per-group counts kept up to date by triggers: instant statistics, slower bulk writes
+        self.incremental_stats = incremental_stats
         
         # Initialize database
+        self.conn = self.connect()
         self.init_database()
         
         # Define source configurations
@@ -75,7 +544,9 @@ class VeterinaryDataCollector:
                     'canine disease', 'feline disease', 'avian disease',
                     'small animal medicine', 'veterinary treatment',
                     'animal pharmacology', 'pet nutrition'
-                ]
+                ],
+                'max_articles_per_term': 1000,
+                'efetch_batch_size': 200  # Articles per efetch request, bounds the XML held in memory
             },
             'open_sources': [
                 'https://www.merckvetmanual.com',
@@ -84,10 +555,55 @@ class VeterinaryDataCollector:
                 'https://www.aspca.org'
             ]
         }
+        
+        # Crawl politeness: requests/second (and burst) per host, shared across all sources
+        self.host_rate_limits = {
+            'en.wikipedia.org': (5.0, 5),
+            'ru.wikipedia.org': (5.0, 5),
+            'eutils.ncbi.nlm.nih.gov': (3.0, 3),  # NCBI allows 3 requests/s without an API key
+        }
+        self.default_host_rate = (1.0, 2)  # Vet websites
+        self.max_concurrency = 16  # Requests in flight across all hosts
+        self.max_retries = 4
+        self.backoff_base = 1.0  # Seconds, doubled on every retry
+        self.buckets: Dict[str, TokenBucket] = {}
+        self.concurrency = None
+        
+        # Seconds a cached response is used without asking the server again, per host
+        self.cache_ttl = {
+            'en.wikipedia.org': 7 * 86400,
+            'ru.wikipedia.org': 7 * 86400,
+            'eutils.ncbi.nlm.nih.gov': 86400,  # New articles show up in searches daily
+        }
+        self.default_cache_ttl = 86400
+        
+        # HTML/XML parsing and extraction are CPU-bound, so they run in worker processes.
+        # Fetchers wait for a free queue slot, which bounds the fetched documents waiting to be parsed.
+        self.parse_workers = os.cpu_count() or 1
+        self.parse_queue_size = 2 * self.parse_workers
+        self.parse_pool = None
+        self.parse_queue = None
+
+    def connect(self, check_same_thread: bool = True) -> sqlite3.Connection:
+        """A connection tuned for bulk writes"""
+        conn = sqlite3.connect(self.db_path, check_same_thread=check_same_thread)
+        conn.execute('PRAGMA journal_mode=WAL')  # Exports and stats can read while a crawl writes
+        conn.execute('PRAGMA synchronous=NORMAL')  # Durable with WAL, syncs at checkpoints instead of every commit
+        conn.execute('PRAGMA temp_store=MEMORY')
+        conn.execute('PRAGMA cache_size=-65536')  # 64 MB page cache
+        conn.execute('PRAGMA mmap_size=268435456')
+        conn.execute('PRAGMA recursive_triggers=ON')  # INSERT OR REPLACE must fire the statistics delete triggers
+        return conn
+
+    def close(self):
+        self.flush_entries()
+        self.conn.close()
+        if self.http_cache:
+            self.http_cache.close()
 
     def init_database(self):
         """Initialize SQLite database for storing collected knowledge"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self.conn
         cursor = conn.cursor()
         
         cursor.execute('''
@@ -124,56 +640,310 @@ class VeterinaryDataCollector:
             )
         ''')
         
+        # Databases from before change detection have no content_hash column yet
+        columns = [row[1] for row in cursor.execute('PRAGMA table_info(veterinary_knowledge)')]
+        if 'content_hash' not in columns:
+            cursor.execute('ALTER TABLE veterinary_knowledge ADD COLUMN content_hash TEXT')
+        if 'duplicate_of' not in columns:
+            cursor.execute('ALTER TABLE veterinary_knowledge ADD COLUMN duplicate_of TEXT')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_knowledge_content_hash ON veterinary_knowledge (content_hash)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_pairs_source_id ON training_pairs (source_id)')
+        # Lookups of a document's previous version when it is replaced
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_knowledge_source_url ON veterinary_knowledge (source, url)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_knowledge_source_title ON veterinary_knowledge (source, title)')
+        # Export reads pairs in confidence order straight from the index, without a sort
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_pairs_confidence ON training_pairs (confidence)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_pairs_category_language ON training_pairs (category, language)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_knowledge_category_language ON veterinary_knowledge (category, language, source)')
+        
+        self.init_statistics(cursor)
         conn.commit()
-        conn.close()
         logger.info(f"Database initialized at {self.db_path}")
 
+    def init_statistics(self, cursor: sqlite3.Cursor):
+        """Per-group counts for get_statistics, kept current by triggers on every insert and delete"""
+        groups = {
+            'knowledge_stats': ('veterinary_knowledge', ['category', 'language', 'source']),
+            'pair_stats': ('training_pairs', ['category', 'language']),
+        }
+        
+        for stats_table, (table, columns) in groups.items():
+            if not self.incremental_stats:
+                # Stale counts are worse than none, get_statistics falls back to GROUP BY
+                cursor.execute(f'DROP TRIGGER IF EXISTS {stats_table}_insert')
+                cursor.execute(f'DROP TRIGGER IF EXISTS {stats_table}_delete')
+                cursor.execute(f'DROP TABLE IF EXISTS {stats_table}')
+                continue
+            
+            exists = cursor.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (stats_table,)
+            ).fetchone()
+            key = ', '.join(columns)
+            cursor.execute(f'''
+                CREATE TABLE IF NOT EXISTS {stats_table} (
+                    {', '.join(f'{column} TEXT NOT NULL' for column in columns)},
+                    count INTEGER NOT NULL,
+                    confidence_sum REAL NOT NULL,
+                    PRIMARY KEY ({key})
+                )
+            ''')
+            if not exists:
+                # First run on an existing database: start from the current contents
+                cursor.execute(f'''
+                    INSERT INTO {stats_table} ({key}, count, confidence_sum)
+                    SELECT {key}, COUNT(*), SUM(confidence) FROM {table} GROUP BY {key}
+                ''')
+            
+            cursor.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS {stats_table}_insert AFTER INSERT ON {table} BEGIN
+                    INSERT INTO {stats_table} ({key}, count, confidence_sum)
+                    VALUES ({', '.join(f'NEW.{column}' for column in columns)}, 1, NEW.confidence)
+                    ON CONFLICT ({key}) DO UPDATE SET
+                        count = count + 1, confidence_sum = confidence_sum + excluded.confidence_sum;
+                END
+            ''')
+            cursor.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS {stats_table}_delete AFTER DELETE ON {table} BEGIN
+                    UPDATE {stats_table} SET count = count - 1, confidence_sum = confidence_sum - OLD.confidence
+                    WHERE {' AND '.join(f'{column} = OLD.{column}' for column in columns)};
+                END
+            ''')
+
     async def collect_all_data(self):
         """Main method to collect data from all sources"""
         logger.info("🚀 Starting comprehensive veterinary data collection...")
+        start = time.monotonic()
         
-        async with aiohttp.ClientSession() as session:
-            self.session = session
+        self.known_hashes = {
+            row[0] for row in self.conn.execute('SELECT content_hash FROM veterinary_knowledge WHERE content_hash IS NOT NULL')
+        }
+        self.unchanged_count = 0
+        self.write_stats = {'entries': 0, 'pairs': 0, 'replaced': 0}
+        
+        self.concurrency = asyncio.Semaphore(self.max_concurrency)
+        self.parse_queue = asyncio.Queue(maxsize=self.parse_queue_size)
+        self.write_queue = asyncio.Queue(maxsize=self.write_queue_size)
+        writer = asyncio.create_task(self.write_worker())
+        connector = aiohttp.TCPConnector(limit=self.max_concurrency)
+        timeout = aiohttp.ClientTimeout(total=60)
+        with ProcessPoolExecutor(max_workers=self.parse_workers) as pool:
+            self.parse_pool = pool
+            parsers = [asyncio.create_task(self.parse_worker()) for _ in range(self.parse_workers)]
             
-            # Collect from different sources
-            await self.collect_wikipedia_data()
-            await self.collect_pubmed_data()
-            await self.collect_open_source_data()
+            async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+                self.session = session
+                
+                # All sources crawl concurrently, each host is paced by its own token bucket
+                await asyncio.gather(
+                    self.collect_wikipedia_data(),
+                    self.collect_pubmed_data(),
+                    self.collect_open_source_data()
+                )
             
-        # Process and store collected data
-        self.store_knowledge_entries()
-        self.generate_training_pairs()
+            # Every fetcher waited for its own parse results, so the queue is already drained
+            for task in parsers:
+                task.cancel()
+            await asyncio.gather(*parsers, return_exceptions=True)
+        
+        logger.info(f"🕸️ Crawl finished in {time.monotonic() - start:.1f}s")
+        if self.http_cache:
+            stats = self.http_cache.stats
+            logger.info(
+                f"🗄️ HTTP cache: {stats['fresh']} fresh, {stats['revalidated']} revalidated (304), "
+                f"{stats['downloaded']} downloaded ({stats['bytes_downloaded'] / 1e6:.1f} MB)"
+            )
         
-        logger.info(f"✅ Data collection complete! Collected {len(self.knowledge_entries)} knowledge entries")
+        # Store the last new and changed documents together with their training pairs
+        await self.queue_entries()
+        await self.write_queue.join()
+        writer.cancel()
+        await asyncio.gather(writer, return_exceptions=True)
+        self.write_queue = None
+        
+        stats = self.write_stats
+        logger.info(
+            f"✅ Data collection complete! {stats['entries']} new or changed knowledge entries "
+            f"({stats['replaced']} replaced changed documents) with {stats['pairs']} training pairs, "
+            f"{self.unchanged_count} unchanged ones skipped"
+        )
+
+    async def parse(self, func, *args):
+        """Run a module-level parse function in the worker pool and return its result"""
+        future = asyncio.get_running_loop().create_future()
+        await self.parse_queue.put((func, args, future))  # Blocks while the queue is full
+        return await future
+
+    async def write_worker(self):
+        """Stores queued batches on a thread with its own connection, so the event loop keeps crawling"""
+        loop = asyncio.get_running_loop()
+        conn = self.connect(check_same_thread=False)  # Only ever used by the one writer thread
+        try:
+            with ThreadPoolExecutor(max_workers=1) as pool:
+                while True:
+                    entries = await self.write_queue.get()
+                    try:
+                        await loop.run_in_executor(pool, self.store_knowledge_entries, entries, conn)
+                    except Exception as e:
+                        logger.error(f"Error storing {len(entries)} knowledge entries: {e}")
+                    finally:
+                        self.write_queue.task_done()
+        finally:
+            conn.close()
+
+    async def queue_entries(self):
+        """Hand the buffered entries to the writer"""
+        if self.pending_entries:
+            entries, self.pending_entries = self.pending_entries, []
+            await self.write_queue.put(entries)  # Blocks while the writer is behind
+
+    async def parse_worker(self):
+        """Feeds queued documents to one pool process at a time"""
+        loop = asyncio.get_running_loop()
+        while True:
+            func, args, future = await self.parse_queue.get()
+            try:
+                result = await loop.run_in_executor(self.parse_pool, func, *args)
+                if not future.done():
+                    future.set_result(result)
+            except Exception as e:
+                if not future.done():
+                    future.set_exception(e)
+            finally:
+                self.parse_queue.task_done()
+
+    async def analyze_new(self, documents: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Extract the fields of the documents whose content is not stored yet"""
+        # Unchanged content was already extracted and has its training pairs, so it never reaches the pool
+        documents = [document for document in documents if not self.is_unchanged(document['content_hash'])]
+        return await self.parse(analyze_documents, documents) if documents else []
+
+    async def add_document(self, document: Dict[str, Any], source: str, language: str, url: str,
+                           id_source: Optional[str] = None):
+        """Keep an analyzed document as a knowledge entry"""
+        self.pending_entries.append(VeterinaryKnowledge(
+            id=make_entry_id(id_source or source, language, url, document['title']),
+            title=document['title'],
+            content=document['content'],
+            species=document['species'],
+            category=document['category'],
+            source=source,
+            url=url,
+            language=language,
+            confidence=document['confidence'],
+            symptoms=document['symptoms'],
+            treatments=document['treatments'],
+            medications=document['medications'],
+            urgency=document['urgency'],
+            timestamp=datetime.now().isoformat(),
+            content_hash=document['content_hash']
+        ))
+        if len(self.pending_entries) >= self.write_batch_size:
+            await self.queue_entries()
+
+    def is_unchanged(self, content_hash: str) -> bool:
+        """True if this exact content is already stored (or was already seen in this crawl)"""
+        if content_hash in self.known_hashes:
+            self.unchanged_count += 1
+            return True
+        self.known_hashes.add(content_hash)
+        return False
+
+    def get_bucket(self, host: str) -> TokenBucket:
+        if host not in self.buckets:
+            rate, burst = self.host_rate_limits.get(host, self.default_host_rate)
+            self.buckets[host] = TokenBucket(rate, burst)
+        return self.buckets[host]
+
+    async def fetch(self, url: str, params: Optional[Dict] = None) -> Optional[str]:
+        """GET a URL politely: per-host token bucket, global concurrency cap, retry with backoff on 429/5xx.
+
+        Responses are cached on disk; within the host's TTL no request is made, after it
+        the cached ETag/Last-Modified turn the request into a conditional GET.
+        """
+        host = urlparse(url).netloc
+        cache_key = HttpCache.make_key(url, params)
+        cached = self.http_cache.get(cache_key) if self.http_cache else None
+        if cached and time.time() - cached['fetched_at'] < self.cache_ttl.get(host, self.default_cache_ttl):
+            self.http_cache.stats['fresh'] += 1
+            return cached['body']
+        
+        headers = {}
+        if cached and cached['etag']:
+            headers['If-None-Match'] = cached['etag']
+        if cached and cached['last_modified']:
+            headers['If-Modified-Since'] = cached['last_modified']
+        
+        bucket = self.get_bucket(host)
+        
+        for attempt in range(self.max_retries + 1):
+            await bucket.acquire()
+            delay = self.backoff_base * 2 ** attempt
+            
+            async with self.concurrency:
+                try:
+                    async with self.session.get(url, params=params, headers=headers) as response:
+                        if response.status == 304 and cached:
+                            self.http_cache.touch(cache_key)
+                            self.http_cache.stats['revalidated'] += 1
+                            return cached['body']
+                        if response.status == 200:
+                            body = await response.text()
+                            if self.http_cache:
+                                self.http_cache.put(
+                                    cache_key, body,
+                                    response.headers.get('ETag'),
+                                    response.headers.get('Last-Modified')
+                                )
+                                self.http_cache.stats['downloaded'] += 1
+                                self.http_cache.stats['bytes_downloaded'] += len(body.encode('utf-8'))
+                            return body
+                        if response.status != 429 and response.status < 500:
+                            return None
+                        
+                        # Honour the server's Retry-After (seconds form) when it sends one
+                        retry_after = response.headers.get('Retry-After', '')
+                        if retry_after.isdigit():
+                            delay = max(delay, float(retry_after))
+                        reason = f"HTTP {response.status}"
+                except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                    reason = f"{type(e).__name__}: {e}"
+            
+            if attempt < self.max_retries:
+                # Back off outside the semaphore so other hosts keep crawling meanwhile
+                logger.debug(f"Retrying {url} in {delay:.1f}s ({reason})")
+                await asyncio.sleep(delay * random.uniform(1.0, 1.5))
+        
+        logger.warning(f"Giving up on {url} after {self.max_retries + 1} attempts ({reason})")
+        # A stale copy beats no copy when the server is down
+        return cached['body'] if cached else None
 
     async def collect_wikipedia_data(self):
         """Collect veterinary information from Wikipedia"""
         logger.info("📚 Collecting data from Wikipedia...")
         
-        for lang in self.sources['wikipedia']['languages']:
-            base_url = f"https://{lang}.wikipedia.org/api/rest_v1"
+        await asyncio.gather(*(
+            self.collect_wikipedia_topic(lang, topic)
+            for lang in self.sources['wikipedia']['languages']
+            for topic in self.sources['wikipedia']['topics']
+        ))
+
+    async def collect_wikipedia_topic(self, lang: str, topic: str):
+        """Collect a topic's summary and its related pages"""
+        base_url = f"https://{lang}.wikipedia.org/api/rest_v1"
+        try:
+            # Get page summary
+            data = await self.fetch(f"{base_url}/page/summary/{topic}")
+            if data:
+                await self.process_wikipedia_page(json.loads(data), lang)
             
-            for topic in self.sources['wikipedia']['topics']:
-                try:
-                    # Get page summary
-                    url = f"{base_url}/page/summary/{topic}"
-                    async with self.session.get(url) as response:
-                        if response.status == 200:
-                            data = await response.json()
-                            await self.process_wikipedia_page(data, lang)
-                    
-                    # Get related pages
-                    related_url = f"{base_url}/page/related/{topic}"
-                    async with self.session.get(related_url) as response:
-                        if response.status == 200:
-                            related_data = await response.json()
-                            for page in related_data.get('pages', [])[:5]:  # Limit to 5 related pages
-                                await self.process_wikipedia_page(page, lang)
-                    
-                    await asyncio.sleep(1)  # Rate limiting
-                    
-                except Exception as e:
-                    logger.warning(f"Error collecting Wikipedia data for {topic}: {e}")
+            # Get related pages
+            related_data = await self.fetch(f"{base_url}/page/related/{topic}")
+            if related_data:
+                for page in json.loads(related_data).get('pages', [])[:5]:  # Limit to 5 related pages
+                    await self.process_wikipedia_page(page, lang)
+            
+        except Exception as e:
+            logger.warning(f"Error collecting Wikipedia data for {topic}: {e}")
 
     async def process_wikipedia_page(self, page_data: Dict, language: str):
         """Process a Wikipedia page and extract veterinary knowledge"""
@@ -185,41 +955,9 @@ class VeterinaryDataCollector:
             content = page_data.get('extract', '')
             url = page_data.get('content_urls', {}).get('desktop', {}).get('page', '')
             
-            # Extract species mentioned
-            species = self.extract_species(content)
-            
-            # Categorize content
-            category = self.categorize_content(content)
-            
-            # Extract symptoms, treatments, medications
-            symptoms = self.extract_symptoms(content)
-            treatments = self.extract_treatments(content)
-            medications = self.extract_medications(content)
-            
-            # Determine urgency
-            urgency = self.determine_urgency(content)
-            
-            # Calculate confidence based on content quality
-            confidence = self.calculate_confidence(content, title, species)
-            
-            knowledge_entry = VeterinaryKnowledge(
-                id=f"wiki_{language}_{hash(url)}",
-                title=title,
-                content=content,
-                species=species,
-                category=category,
-                source='wikipedia',
-                url=url,
-                language=language,
-                confidence=confidence,
-                symptoms=symptoms,
-                treatments=treatments,
-                medications=medications,
-                urgency=urgency,
-                timestamp=datetime.now().isoformat()
-            )
-            
-            self.knowledge_entries.append(knowledge_entry)
+            # Species, category, symptoms, treatments, medications, urgency and confidence
+            for document in await self.analyze_new([read_document(title, content)]):
+                await self.add_document(document, 'wikipedia', language, url)
             
         except Exception as e:
             logger.warning(f"Error processing Wikipedia page: {e}")
@@ -228,91 +966,66 @@ class VeterinaryDataCollector:
         """Collect veterinary research data from PubMed"""
         logger.info("🔬 Collecting data from PubMed...")
         
-        for search_term in self.sources['pubmed']['search_terms']:
-            try:
-                # Search for articles
-                search_url = f"{self.sources['pubmed']['base_url']}/esearch.fcgi"
-                params = {
-                    'db': 'pubmed',
-                    'term': search_term,
-                    'retmax': 20,  # Limit results
-                    'retmode': 'json'
-                }
-                
-                async with self.session.get(search_url, params=params) as response:
-                    if response.status == 200:
-                        search_data = await response.json()
-                        pmids = search_data.get('esearchresult', {}).get('idlist', [])
-                        
-                        # Fetch article details
-                        if pmids:
-                            await self.fetch_pubmed_articles(pmids)
-                
-                await asyncio.sleep(2)  # Rate limiting for PubMed
-                
-            except Exception as e:
-                logger.warning(f"Error collecting PubMed data for {search_term}: {e}")
+        await asyncio.gather(*(
+            self.collect_pubmed_term(search_term)
+            for search_term in self.sources['pubmed']['search_terms']
+        ))
 
-    async def fetch_pubmed_articles(self, pmids: List[str]):
-        """Fetch detailed information for PubMed articles"""
+    async def collect_pubmed_term(self, search_term: str):
+        """Search PubMed for one term and fetch the matching articles"""
         try:
-            fetch_url = f"{self.sources['pubmed']['base_url']}/efetch.fcgi"
+            # Search for the article IDs; cached for the eutils TTL like the batches fetched with them
+            search_url = f"{self.sources['pubmed']['base_url']}/esearch.fcgi"
             params = {
                 'db': 'pubmed',
-                'id': ','.join(pmids[:10]),  # Limit to 10 articles
-                'retmode': 'xml'
+                'term': search_term,
+                'retmax': self.sources['pubmed']['max_articles_per_term'],
+                'retmode': 'json'
             }
             
-            async with self.session.get(fetch_url, params=params) as response:
-                if response.status == 200:
-                    xml_data = await response.text()
-                    # Process XML data (simplified for this example)
+            search_data = await self.fetch(search_url, params=params)
+            if search_data:
+                result = json.loads(search_data).get('esearchresult', {})
+                pmids = result.get('idlist', [])
+                
+                # Fetch article details
+                if pmids:
+                    logger.info(f"🔬 PubMed '{search_term}': fetching {len(pmids)} of {result.get('count')} articles")
+                    await self.fetch_pubmed_articles(pmids)
+            
+        except Exception as e:
+            logger.warning(f"Error collecting PubMed data for {search_term}: {e}")
+
+    async def fetch_pubmed_articles(self, pmids: List[str]):
+        """Fetch articles by PMID, one efetch batch at a time"""
+        fetch_url = f"{self.sources['pubmed']['base_url']}/efetch.fcgi"
+        batch_size = self.sources['pubmed']['efetch_batch_size']
+        
+        # A batch's cache key is its sorted PMID list, so a cached batch always holds exactly the articles asked for.
+        # Batches are fetched and parsed one after another, so memory stays at one batch per term.
+        pmids = sorted(set(pmids), key=int)
+        for start in range(0, len(pmids), batch_size):
+            try:
+                params = {
+                    'db': 'pubmed',
+                    'id': ','.join(pmids[start:start + batch_size]),
+                    'retmode': 'xml'
+                }
+                
+                xml_data = await self.fetch(fetch_url, params=params)
+                if xml_data:
                     await self.process_pubmed_xml(xml_data)
                     
-        except Exception as e:
-            logger.warning(f"Error fetching PubMed articles: {e}")
+            except Exception as e:
+                logger.warning(f"Error fetching PubMed articles {start}-{start + batch_size}: {e}")
 
     async def process_pubmed_xml(self, xml_data: str):
         """Process PubMed XML data and extract knowledge"""
         try:
-            soup = BeautifulSoup(xml_data, 'xml')
-            articles = soup.find_all('PubmedArticle')
-            
-            for article in articles:
-                title_elem = article.find('ArticleTitle')
-                abstract_elem = article.find('AbstractText')
-                
-                if title_elem and abstract_elem:
-                    title = title_elem.get_text()
-                    abstract = abstract_elem.get_text()
-                    
-                    # Extract veterinary knowledge from research abstract
-                    species = self.extract_species(abstract)
-                    category = self.categorize_content(abstract)
-                    symptoms = self.extract_symptoms(abstract)
-                    treatments = self.extract_treatments(abstract)
-                    medications = self.extract_medications(abstract)
-                    urgency = self.determine_urgency(abstract)
-                    confidence = self.calculate_confidence(abstract, title, species)
-                    
-                    knowledge_entry = VeterinaryKnowledge(
-                        id=f"pubmed_{hash(title)}",
-                        title=title,
-                        content=abstract,
-                        species=species,
-                        category=category,
-                        source='pubmed',
-                        url='',
-                        language='en',
-                        confidence=confidence,
-                        symptoms=symptoms,
-                        treatments=treatments,
-                        medications=medications,
-                        urgency=urgency,
-                        timestamp=datetime.now().isoformat()
-                    )
-                    
-                    self.knowledge_entries.append(knowledge_entry)
+            # Extract veterinary knowledge from research abstracts
+            documents = await self.parse(parse_pubmed_articles, xml_data)
+            for document in await self.analyze_new(documents):
+                await self.add_document(document, 'pubmed', 'en', '')
                     
         except Exception as e:
             logger.warning(f"Error processing PubMed XML: {e}")
@@ -321,365 +1034,125 @@ class VeterinaryDataCollector:
         """Collect data from open veterinary websites"""
         logger.info("🌐 Collecting data from open sources...")
         
-        for source_url in self.sources['open_sources']:
-            try:
-                await self.scrape_website(source_url)
-                await asyncio.sleep(3)  # Rate limiting
-                
-            except Exception as e:
-                logger.warning(f"Error collecting data from {source_url}: {e}")
+        await asyncio.gather(*(
+            self.scrape_website(source_url)
+            for source_url in self.sources['open_sources']
+        ))
 
     async def scrape_website(self, base_url: str):
         """Scrape veterinary information from a website"""
         try:
-            async with self.session.get(base_url) as response:
-                if response.status == 200:
-                    html = await response.text()
-                    soup = BeautifulSoup(html, 'html.parser')
-                    
-                    # Find article links
-                    article_links = self.find_article_links(soup, base_url)
-                    
-                    # Process each article
-                    for link in article_links[:10]:  # Limit to 10 articles per site
-                        await self.scrape_article(link, base_url)
-                        await asyncio.sleep(1)
-                        
+            html = await self.fetch(base_url)
+            if html:
+                # Find article links
+                article_links = await self.parse(parse_index_page, html, base_url)
+                
+                # Process each article (the host's token bucket paces them)
+                await asyncio.gather(*(
+                    self.scrape_article(link, base_url)
+                    for link in article_links[:10]  # Limit to 10 articles per site
+                ))
+                
         except Exception as e:
             logger.warning(f"Error scraping website {base_url}: {e}")
 
-    def find_article_links(self, soup: BeautifulSoup, base_url: str) -> List[str]:
-        """Find relevant article links on a veterinary website"""
-        links = []
-        
-        # Common patterns for veterinary article links
-        patterns = [
-            'a[href*="disease"]',
-            'a[href*="health"]',
-            'a[href*="treatment"]',
-            'a[href*="condition"]',
-            'a[href*="symptom"]',
-            '.article-link',
-            '.health-article'
-        ]
-        
-        for pattern in patterns:
-            elements = soup.select(pattern)
-            for elem in elements:
-                href = elem.get('href')
-                if href:
-                    full_url = urljoin(base_url, href)
-                    if self.is_relevant_veterinary_url(full_url):
-                        links.append(full_url)
-        
-        return list(set(links))  # Remove duplicates
-
     async def scrape_article(self, url: str, source_domain: str):
         """Scrape content from a veterinary article"""
         try:
-            async with self.session.get(url) as response:
-                if response.status == 200:
-                    html = await response.text()
-                    soup = BeautifulSoup(html, 'html.parser')
-                    
-                    # Extract article content
-                    title = self.extract_title(soup)
-                    content = self.extract_article_content(soup)
+            html = await self.fetch(url)
+            if html:
+                # Extract and process the article content
+                document = await self.parse(parse_article_page, html)
+                for document in await self.analyze_new([document] if document else []):
+                    await self.add_document(document, urlparse(source_domain).netloc, 'en', url, id_source='web')
                     
-                    if title and content and len(content) > 100:
-                        # Process the article
-                        species = self.extract_species(content)
-                        category = self.categorize_content(content)
-                        symptoms = self.extract_symptoms(content)
-                        treatments = self.extract_treatments(content)
-                        medications = self.extract_medications(content)
-                        urgency = self.determine_urgency(content)
-                        confidence = self.calculate_confidence(content, title, species)
-                        
-                        knowledge_entry = VeterinaryKnowledge(
-                            id=f"web_{hash(url)}",
-                            title=title,
-                            content=content,
-                            species=species,
-                            category=category,
-                            source=urlparse(source_domain).netloc,
-                            url=url,
-                            language='en',
-                            confidence=confidence,
-                            symptoms=symptoms,
-                            treatments=treatments,
-                            medications=medications,
-                            urgency=urgency,
-                            timestamp=datetime.now().isoformat()
-                        )
-                        
-                        self.knowledge_entries.append(knowledge_entry)
-                        
         except Exception as e:
             logger.warning(f"Error scraping article {url}: {e}")
 
-    def extract_species(self, text: str) -> List[str]:
-        """Extract animal species mentioned in text"""
-        species_patterns = {
-            'dog': r'\b(dog|canine|puppy|puppies)\b',
-            'cat': r'\b(cat|feline|kitten|kittens)\b',
-            'bird': r'\b(bird|avian|parrot|canary|budgie)\b',
-            'rabbit': r'\b(rabbit|bunny|hare)\b',
-            'hamster': r'\b(hamster|gerbil)\b',
-            'guinea_pig': r'\b(guinea pig|cavy)\b',
-            'fish': r'\b(fish|aquatic|goldfish)\b',
-            'reptile': r'\b(reptile|snake|lizard|turtle|gecko)\b'
-        }
-        
-        found_species = []
-        text_lower = text.lower()
-        
-        for species, pattern in species_patterns.items():
-            if re.search(pattern, text_lower):
-                found_species.append(species)
-        
-        return found_species if found_species else ['general']
-
-    def categorize_content(self, text: str) -> str:
-        """Categorize veterinary content"""
-        categories = {
-            'skin': r'\b(skin|dermat|itch|scratch|rash|fur|hair|coat)\b',
-            'digestive': r'\b(digest|stomach|intestin|diarrhea|vomit|nausea)\b',
-            'respiratory': r'\b(breath|lung|cough|sneez|respiratory|pneumonia)\b',
-            'cardiac': r'\b(heart|cardiac|circulation|blood|pulse)\b',
-            'neurological': r'\b(brain|neuro|seizure|paralysis|behavior)\b',
-            'orthopedic': r'\b(bone|joint|muscle|ligament|fracture|arthritis)\b',
-            'ophthalmologic': r'\b(eye|vision|blind|cataract|cornea)\b',
-            'urinary': r'\b(kidney|bladder|urin|nephro|cystitis)\b',
-            'reproductive': r'\b(reproduct|pregnan|birth|mating|estrus)\b',
-            'infectious': r'\b(infect|virus|bacteria|parasit|vaccine)\b',
-            'nutrition': r'\b(diet|food|nutrition|feed|eating)\b',
-            'emergency': r'\b(emergency|urgent|critical|poison|trauma)\b'
-        }
-        
-        text_lower = text.lower()
-        for category, pattern in categories.items():
-            if re.search(pattern, text_lower):
-                return category
-        
-        return 'general'
-
-    def extract_symptoms(self, text: str) -> List[str]:
-        """Extract symptoms mentioned in text"""
-        symptom_patterns = [
-            r'\b(vomiting|vomit)\b', r'\b(diarrhea|loose stool)\b',
-            r'\b(coughing|cough)\b', r'\b(sneezing|sneeze)\b',
-            r'\b(lethargy|tired|weak)\b', r'\b(fever|temperature)\b',
-            r'\b(loss of appetite|not eating)\b', r'\b(limping|lameness)\b',
-            r'\b(scratching|itching)\b', r'\b(hair loss|balding)\b',
-            r'\b(bleeding|blood)\b', r'\b(swelling|swollen)\b',
-            r'\b(difficulty breathing|dyspnea)\b', r'\b(seizure|convulsion)\b'
-        ]
-        
-        symptoms = []
-        text_lower = text.lower()
-        
-        for pattern in symptom_patterns:
-            matches = re.findall(pattern, text_lower)
-            symptoms.extend(matches)
-        
-        return list(set(symptoms))  # Remove duplicates
-
-    def extract_treatments(self, text: str) -> List[str]:
-        """Extract treatments mentioned in text"""
-        treatment_patterns = [
-            r'\b(surgery|surgical)\b', r'\b(medication|medicine|drug)\b',
-            r'\b(therapy|treatment)\b', r'\b(antibiotic|antimicrobial)\b',
-            r'\b(pain relief|analgesic)\b', r'\b(rest|bed rest)\b',
-            r'\b(diet change|dietary)\b', r'\b(exercise|physical therapy)\b',
-            r'\b(vaccination|vaccine)\b', r'\b(fluid therapy|IV)\b'
-        ]
-        
-        treatments = []
-        text_lower = text.lower()
-        
-        for pattern in treatment_patterns:
-            matches = re.findall(pattern, text_lower)
-            treatments.extend(matches)
-        
-        return list(set(treatments))
-
-    def extract_medications(self, text: str) -> List[str]:
-        """Extract medications mentioned in text"""
-        # Common veterinary medications
-        medication_patterns = [
-            r'\b(amoxicillin|penicillin|cephalexin)\b',
-            r'\b(prednisone|prednisolone|dexamethasone)\b',
-            r'\b(metacam|rimadyl|carprofen)\b',
-            r'\b(tramadol|gabapentin|buprenorphine)\b',
-            r'\b(furosemide|enalapril|pimobendan)\b',
-            r'\b(metronidazole|sulfasalazine)\b'
-        ]
-        
-        medications = []
-        text_lower = text.lower()
-        
-        for pattern in medication_patterns:
-            matches = re.findall(pattern, text_lower)
-            medications.extend(matches)
-        
-        return list(set(medications))
-
-    def determine_urgency(self, text: str) -> str:
-        """Determine urgency level based on content"""
-        emergency_keywords = r'\b(emergency|urgent|critical|immediate|life-threatening|toxic|poison)\b'
-        high_keywords = r'\b(serious|severe|concerning|worrying|painful)\b'
-        medium_keywords = r'\b(monitor|watch|observe|check)\b'
-        
-        text_lower = text.lower()
-        
-        if re.search(emergency_keywords, text_lower):
-            return 'emergency'
-        elif re.search(high_keywords, text_lower):
-            return 'high'
-        elif re.search(medium_keywords, text_lower):
-            return 'medium'
-        else:
-            return 'low'
-
-    def calculate_confidence(self, content: str, title: str, species: List[str]) -> float:
-        """Calculate confidence score for the knowledge entry"""
-        score = 0.5  # Base score
-        
-        # Content length bonus
-        if len(content) > 500:
-            score += 0.2
-        elif len(content) > 200:
-            score += 0.1
-        
-        # Species specificity bonus
-        if len(species) > 0 and 'general' not in species:
-            score += 0.1
-        
-        # Title relevance bonus
-        if any(keyword in title.lower() for keyword in ['veterinary', 'animal', 'pet', 'disease', 'health']):
-            score += 0.1
-        
-        # Medical terminology bonus
-        medical_terms = len(re.findall(r'\b(treatment|diagnosis|symptom|medication|therapy|condition)\b', content.lower()))
-        score += min(medical_terms * 0.02, 0.1)
-        
-        return min(score, 1.0)
-
-    def is_relevant_veterinary_url(self, url: str) -> bool:
-        """Check if URL is relevant to veterinary content"""
-        relevant_keywords = [
-            'health', 'disease', 'treatment', 'condition', 'symptom',
-            'care', 'medical', 'veterinary', 'pet', 'animal'
-        ]
-        
-        url_lower = url.lower()
-        return any(keyword in url_lower for keyword in relevant_keywords)
+    def flush_entries(self):
+        """Write the buffered entries outside of a crawl"""
+        if self.pending_entries:
+            self.store_knowledge_entries(self.pending_entries)
+            self.pending_entries = []
 
-    def extract_title(self, soup: BeautifulSoup) -> str:
-        """Extract title from HTML"""
-        title_selectors = ['h1', 'title', '.article-title', '.page-title']
-        
-        for selector in title_selectors:
-            element = soup.select_one(selector)
-            if element and element.get_text().strip():
-                return element.get_text().strip()
-        
-        return ''
-
-    def extract_article_content(self, soup: BeautifulSoup) -> str:
-        """Extract main content from HTML"""
-        # Remove unwanted elements
-        for element in soup(['script', 'style', 'nav', 'footer', 'header', 'aside']):
-            element.decompose()
-        
-        # Try different content selectors
-        content_selectors = [
-            '.article-content', '.post-content', '.entry-content',
-            'article', 'main', '.content', '#content'
-        ]
-        
-        for selector in content_selectors:
-            element = soup.select_one(selector)
-            if element:
-                text = element.get_text(separator=' ', strip=True)
-                if len(text) > 100:
-                    return text
-        
-        # Fallback: get all paragraph text
-        paragraphs = soup.find_all('p')
-        content = ' '.join([p.get_text(strip=True) for p in paragraphs])
-        
-        return content if len(content) > 100 else ''
+    def store_knowledge_entries(self, entries: List[VeterinaryKnowledge], conn: Optional[sqlite3.Connection] = None):
+        """Store knowledge entries and their training pairs in one transaction.
 
-    def store_knowledge_entries(self):
-        """Store collected knowledge entries in database"""
-        logger.info(f"💾 Storing {len(self.knowledge_entries)} knowledge entries in database...")
-        
-        conn = sqlite3.connect(self.db_path)
+        Previous versions of the same documents and their pairs are replaced in the
+        same transaction, so a failed batch leaves the database as it was.
+        """
+        # A document seen twice in one batch keeps its later version, as if written one by one
+        entries = list({entry.id: entry for entry in entries}.values())
+        conn = conn or self.conn
         cursor = conn.cursor()
         
-        for entry in self.knowledge_entries:
-            cursor.execute('''
+        with conn:
+            old_ids = set()
+            for entry in entries:
+                if entry.url:
+                    cursor.execute('SELECT id FROM veterinary_knowledge WHERE source = ? AND url = ?', (entry.source, entry.url))
+                else:
+                    cursor.execute('SELECT id FROM veterinary_knowledge WHERE source = ? AND title = ?', (entry.source, entry.title))
+                found = [row[0] for row in cursor.fetchall()]
+                self.write_stats['replaced'] += bool(found)
+                old_ids.update(found)
+            
+            cursor.executemany('DELETE FROM training_pairs WHERE source_id = ?', [(old_id,) for old_id in old_ids])
+            cursor.executemany('DELETE FROM veterinary_knowledge WHERE id = ?', [(old_id,) for old_id in old_ids])
+            
+            cursor.executemany('''
                 INSERT OR REPLACE INTO veterinary_knowledge 
                 (id, title, content, species, category, source, url, language, 
-                 confidence, symptoms, treatments, medications, urgency, timestamp)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                 confidence, symptoms, treatments, medications, urgency, timestamp, content_hash)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
             ''', (
-                entry.id, entry.title, entry.content, json.dumps(entry.species),
-                entry.category, entry.source, entry.url, entry.language,
-                entry.confidence, json.dumps(entry.symptoms), 
-                json.dumps(entry.treatments), json.dumps(entry.medications),
-                entry.urgency, entry.timestamp
+                (
+                    entry.id, entry.title, entry.content, json.dumps(entry.species),
+                    entry.category, entry.source, entry.url, entry.language,
+                    entry.confidence, json.dumps(entry.symptoms), 
+                    json.dumps(entry.treatments), json.dumps(entry.medications),
+                    entry.urgency, entry.timestamp, entry.content_hash
+                )
+                for entry in entries
             ))
-        
-        conn.commit()
-        conn.close()
-        logger.info("✅ Knowledge entries stored successfully")
-
-    def generate_training_pairs(self):
-        """Generate question-answer pairs for training"""
-        logger.info("🧠 Generating training question-answer pairs...")
-        
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        training_pairs = []
-        
-        for entry in self.knowledge_entries:
-            # Generate different types of questions
-            questions = self.generate_questions_for_entry(entry)
             
-            for question in questions:
-                answer = self.generate_answer_for_question(question, entry)
-                
-                training_pairs.append({
-                    'question': question,
-                    'answer': answer,
-                    'species': json.dumps(entry.species),
-                    'category': entry.category,
-                    'language': entry.language,
-                    'confidence': entry.confidence,
-                    'source_id': entry.id,
-                    'timestamp': datetime.now().isoformat()
-                })
-        
-        # Store training pairs
-        for pair in training_pairs:
-            cursor.execute('''
+            # Pairs are generated while SQLite consumes them, never as one big list
+            cursor.executemany('''
                 INSERT INTO training_pairs 
                 (question, answer, species, category, language, confidence, source_id, timestamp)
                 VALUES (?, ?, ?, ?, ?, ?, ?, ?)
             ''', (
-                pair['question'], pair['answer'], pair['species'],
-                pair['category'], pair['language'], pair['confidence'],
-                pair['source_id'], pair['timestamp']
+                (
+                    pair['question'], pair['answer'], pair['species'],
+                    pair['category'], pair['language'], pair['confidence'],
+                    pair['source_id'], pair['timestamp']
+                )
+                for entry in entries
+                for pair in self.generate_training_pairs(entry)
             ))
+            pair_count = cursor.rowcount
         
-        conn.commit()
-        conn.close()
-        
-        logger.info(f"✅ Generated {len(training_pairs)} training pairs")
+        self.write_stats['entries'] += len(entries)
+        self.write_stats['pairs'] += pair_count
+        logger.info(f"💾 Stored {len(entries)} knowledge entries with {pair_count} training pairs")
+
+    def generate_training_pairs(self, entry: VeterinaryKnowledge) -> Iterator[Dict]:
+        """Generate question-answer pairs for training from one knowledge entry"""
+        timestamp = datetime.now().isoformat()
+        species = json.dumps(entry.species)
+        
+        # Generate different types of questions
+        for question in self.generate_questions_for_entry(entry):
+            yield {
+                'question': question,
+                'answer': self.generate_answer_for_question(question, entry),
+                'species': species,
+                'category': entry.category,
+                'language': entry.language,
+                'confidence': entry.confidence,
+                'source_id': entry.id,
+                'timestamp': timestamp
+            }
 
     def generate_questions_for_entry(self, entry: VeterinaryKnowledge) -> List[str]:
         """Generate relevant questions for a knowledge entry"""
@@ -748,15 +1221,148 @@ class VeterinaryDataCollector:
         
         return " ".join(answer_parts)
 
-    def export_training_data(self, output_path: str = "data/training_data.jsonl"):
-        """Export training data in JSONL format for model training"""
-        logger.info("📤 Exporting training data...")
+    def compact_database(self):
+        """One-off cleanup of databases written with hash()-based IDs: one row per document, no duplicate pairs"""
+        logger.info("🧹 Compacting knowledge database...")
+        size_before = self.db_path.stat().st_size
         
-        conn = sqlite3.connect(self.db_path)
+        conn = self.conn
         cursor = conn.cursor()
+        entries_before = cursor.execute('SELECT COUNT(*) FROM veterinary_knowledge').fetchone()[0]
+        pairs_before = cursor.execute('SELECT COUNT(*) FROM training_pairs').fetchone()[0]
+        
+        # Group every stored row under its stable ID, newest first
+        groups: Dict[str, List[str]] = {}
+        for row_id, source, language, url, title in cursor.execute('''
+            SELECT id, source, language, url, title FROM veterinary_knowledge ORDER BY timestamp DESC
+        ''').fetchall():
+            source = source if source in ('wikipedia', 'pubmed') else 'web'
+            groups.setdefault(make_entry_id(source, language, url or '', title), []).append(row_id)
+        
+        with conn:
+            # Drop the older copies first so renaming the kept row cannot collide with them
+            for stable_id, row_ids in groups.items():
+                for old_id in row_ids[1:]:
+                    cursor.execute('DELETE FROM training_pairs WHERE source_id = ?', (old_id,))
+                    cursor.execute('DELETE FROM veterinary_knowledge WHERE id = ?', (old_id,))
+            
+            for stable_id, row_ids in groups.items():
+                if row_ids[0] != stable_id:
+                    cursor.execute('UPDATE veterinary_knowledge SET id = ? WHERE id = ?', (stable_id, row_ids[0]))
+                    cursor.execute('UPDATE training_pairs SET source_id = ? WHERE source_id = ?', (stable_id, row_ids[0]))
+            
+            # Pairs inserted again by repeated runs for the same entry
+            cursor.execute('''
+                DELETE FROM training_pairs WHERE id NOT IN (
+                    SELECT MIN(id) FROM training_pairs GROUP BY source_id, question, answer
+                )
+            ''')
+        
+        entries_after = cursor.execute('SELECT COUNT(*) FROM veterinary_knowledge').fetchone()[0]
+        pairs_after = cursor.execute('SELECT COUNT(*) FROM training_pairs').fetchone()[0]
+        conn.execute('VACUUM')
+        
+        logger.info(
+            f"✅ Compaction complete: entries {entries_before} -> {entries_after}, "
+            f"pairs {pairs_before} -> {pairs_after}, "
+            f"database {size_before / 1e6:.1f} MB -> {self.db_path.stat().st_size / 1e6:.1f} MB"
+        )
+
+    def deduplicate_database(self) -> Dict[str, int]:
+        """Collapse near-duplicate knowledge entries and training pairs to their most confident member.
+
+        Entries with near-identical content (the same condition from several sites, or
+        a related page repeating a summary) are marked duplicate_of their representative
+        and lose their training pairs; the row stays so the crawler still knows its
+        content hash. Pairs asking the same question with a near-identical answer are
+        deleted. Every run starts over, so an entry whose representative changed gets
+        its pairs back.
+        """
+        logger.info("🧬 Detecting near-duplicates...")
+        conn = self.conn
+        
+        # Entries, most confident first so each cluster keeps its best member
+        index = NearDuplicateIndex(self.dedup_threshold)
+        changed = []  # (id, new duplicate_of)
+        representatives = set()
+        entry_count = 0
+        for entry_id, content, duplicate_of in conn.execute(
+            'SELECT id, content, duplicate_of FROM veterinary_knowledge ORDER BY confidence DESC, id'
+        ):
+            entry_count += 1
+            representative = index.add(entry_id, content)
+            if representative:
+                representatives.add(representative)
+            if representative != duplicate_of:
+                changed.append((entry_id, representative))
+        
+        duplicates = [(representative, entry_id) for entry_id, representative in changed if representative]
+        revived = [entry_id for entry_id, representative in changed if not representative]
+        with conn:
+            conn.executemany('UPDATE veterinary_knowledge SET duplicate_of = ? WHERE id = ?', duplicates)
+            conn.executemany('DELETE FROM training_pairs WHERE source_id = ?', [(entry_id,) for _, entry_id in duplicates])
+        
+        # No longer duplicates: store them again, which regenerates their pairs
+        for i in range(0, len(revived), self.write_batch_size):
+            chunk = revived[i:i + self.write_batch_size]
+            rows = conn.execute(f'''
+                SELECT id, title, content, species, category, source, url, language, confidence,
+                       symptoms, treatments, medications, urgency, timestamp, content_hash
+                FROM veterinary_knowledge WHERE id IN ({', '.join('?' * len(chunk))})
+            ''', chunk).fetchall()
+            self.store_knowledge_entries([
+                VeterinaryKnowledge(
+                    id=row[0], title=row[1], content=row[2], species=json.loads(row[3]),
+                    category=row[4], source=row[5], url=row[6], language=row[7], confidence=row[8],
+                    symptoms=json.loads(row[9]), treatments=json.loads(row[10]),
+                    medications=json.loads(row[11]), urgency=row[12], timestamp=row[13], content_hash=row[14]
+                )
+                for row in rows
+            ])
         
-        cursor.execute('''
-            SELECT question, answer, species, category, language, confidence
+        # Pairs: the templated questions repeat across entries, so group by question and
+        # cluster the answers within each group. Sorted by question, one group is in memory at a time.
+        duplicate_pairs = []
+        pair_count = 0
+        question = None
+        for pair_id, pair_question, answer in conn.execute(
+            'SELECT id, question, answer FROM training_pairs ORDER BY lower(question), confidence DESC, id'
+        ):
+            pair_count += 1
+            normalized = ' '.join(re.findall(r'\w+', pair_question.lower()))
+            if normalized != question:
+                question = normalized
+                index = NearDuplicateIndex(self.dedup_threshold)
+            if index.add(pair_id, answer) is not None:
+                duplicate_pairs.append(pair_id)
+        
+        with conn:
+            conn.executemany('DELETE FROM training_pairs WHERE id = ?', [(pair_id,) for pair_id in duplicate_pairs])
+        
+        duplicate_entries = conn.execute(
+            'SELECT COUNT(*) FROM veterinary_knowledge WHERE duplicate_of IS NOT NULL'
+        ).fetchone()[0]
+        stats = {
+            'entries': entry_count,
+            'duplicate_entries': duplicate_entries,
+            'entry_clusters': len(representatives),
+            'revived_entries': len(revived),
+            'pairs': pair_count,
+            'duplicate_pairs': len(duplicate_pairs),
+        }
+        logger.info(
+            f"✅ Near-duplicates: {duplicate_entries}/{entry_count} entries in {len(representatives)} clusters "
+            f"({len(revived)} restored), {len(duplicate_pairs)}/{pair_count} training pairs removed"
+        )
+        return stats
+
+    def export_training_data(self, output_path: str = "data/training_data.jsonl") -> int:
+        """Export training data in JSONL format for model training"""
+        logger.info("📤 Exporting training data...")
+        
+        # Rows are streamed from the confidence index in chunks, so memory stays flat at any table size
+        cursor = self.conn.execute('''
+            SELECT question, answer, species, category, language, confidence, timestamp
             FROM training_pairs
             WHERE confidence > 0.6
             ORDER BY confidence DESC
@@ -764,66 +1370,104 @@ class VeterinaryDataCollector:
         
         output_path = Path(output_path)
         output_path.parent.mkdir(exist_ok=True)
+        exported = 0
         
         with open(output_path, 'w', encoding='utf-8') as f:
-            for row in cursor.fetchall():
-                question, answer, species, category, language, confidence = row
-                
-                training_example = {
-                    "instruction": "You are a veterinary AI assistant. Provide helpful and accurate veterinary advice.",
-                    "input": question,
-                    "output": answer,
-                    "metadata": {
-                        "species": json.loads(species),
-                        "category": category,
-                        "language": language,
-                        "confidence": confidence
-                    }
-                }
+            while True:
+                rows = cursor.fetchmany(self.export_chunk_size)
+                if not rows:
+                    break
                 
-                f.write(json.dumps(training_example, ensure_ascii=False) + '\n')
-        
-        conn.close()
-        logger.info(f"✅ Training data exported to {output_path}")
+                f.writelines(
+                    json.dumps({
+                        "instruction": "You are a veterinary AI assistant. Provide helpful and accurate veterinary advice.",
+                        "input": question,
+                        "output": answer,
+                        "metadata": {
+                            "species": json.loads(species),
+                            "category": category,
+                            "language": language,
+                            "confidence": confidence,
+                            "timestamp": timestamp  # Lets model_trainer.py --incremental pick up only new pairs
+                        }
+                    }, ensure_ascii=False) + '\n'
+                    for question, answer, species, category, language, confidence, timestamp in rows
+                )
+                exported += len(rows)
+        
+        logger.info(f"✅ {exported} training examples exported to {output_path}")
+        return exported
 
     def get_statistics(self):
         """Get collection statistics"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self.conn
+        
+        if self.incremental_stats:
+            # Maintained by triggers, so this reads a few rows instead of scanning both tables
+            knowledge_query = '''
+                SELECT category, language, source, count, confidence_sum / count as avg_confidence
+                FROM knowledge_stats WHERE count > 0 ORDER BY category, language, source
+            '''
+            training_query = '''
+                SELECT category, language, count, confidence_sum / count as avg_confidence
+                FROM pair_stats WHERE count > 0 ORDER BY category, language
+            '''
+        else:
+            knowledge_query = '''
+                SELECT category, language, source, COUNT(*) as count, AVG(confidence) as avg_confidence
+                FROM veterinary_knowledge
+                GROUP BY category, language, source
+            '''
+            training_query = '''
+                SELECT category, language, COUNT(*) as count, AVG(confidence) as avg_confidence
+                FROM training_pairs
+                GROUP BY category, language
+            '''
         
         # Knowledge entries stats
-        knowledge_df = pd.read_sql_query('''
-            SELECT category, language, source, COUNT(*) as count, AVG(confidence) as avg_confidence
-            FROM veterinary_knowledge
-            GROUP BY category, language, source
-        ''', conn)
+        knowledge_df = pd.read_sql_query(knowledge_query, conn)
         
         # Training pairs stats
-        training_df = pd.read_sql_query('''
-            SELECT category, language, COUNT(*) as count, AVG(confidence) as avg_confidence
-            FROM training_pairs
-            GROUP BY category, language
-        ''', conn)
-        
-        conn.close()
+        training_df = pd.read_sql_query(training_query, conn)
         
         logger.info("📊 Collection Statistics:")
         logger.info(f"Knowledge entries by category:\n{knowledge_df}")
         logger.info(f"Training pairs by category:\n{training_df}")
 
-async def main():
+async def main(incremental_stats: bool = False):
     """Main function to run the data collection"""
-    collector = VeterinaryDataCollector()
+    collector = VeterinaryDataCollector(incremental_stats=incremental_stats)
     
     # Collect all data
     await collector.collect_all_data()
     
+    # Keep one copy of every near-duplicate document and pair
+    collector.deduplicate_database()
+    
     # Export training data
     collector.export_training_data()
     
     # Show statistics
     collector.get_statistics()
+    collector.close()
     
     logger.info("🎉 Veterinary knowledge collection complete!")
 
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Collect veterinary knowledge and export training data")
+    parser.add_argument('command', nargs='?', choices=['collect', 'compact', 'dedup'], default='collect',
+                        help="'compact' deduplicates a database written by older versions and exits, "
+                             "'dedup' only runs near-duplicate detection")
+    parser.add_argument('--incremental-stats', action='store_true',
+                        help="Maintain statistics tables with triggers instead of GROUP BY over the full tables")
+    args = parser.parse_args()
+    
+    if args.command in ('compact', 'dedup'):
+        collector = VeterinaryDataCollector(incremental_stats=args.incremental_stats)
+        if args.command == 'compact':
+            collector.compact_database()
+        else:
+            collector.deduplicate_database()
+        collector.close()
+    else:
+        asyncio.run(main(args.incremental_stats))
\ No newline at end of file
@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+"""
+Veterinary AI Evaluation Harness
+Batched perplexity and generation evaluation for an in-memory model.
+Produces a JSON report with quality metrics and latency/throughput numbers
+so runs can be compared with each other.
+"""
+
+import json
+import math
+import time
+import logging
+import torch
+import numpy as np
+from pathlib import Path
+from typing import Dict, List, Tuple
+from datetime import datetime
+from collections import Counter
+
+from transformers import DataCollatorForSeq2Seq
+
+from prompt_template import PromptTemplate, right_padded
+
+logger = logging.getLogger(__name__)
+
+def split_example(example: Dict) -> Tuple[str, str, Dict]:
+    """Return (question, answer, metadata) for both the exported and the sample data layouts"""
+    # Exported data keeps the question in 'input' and a fixed system text in 'instruction'
+    question = example.get('input') or example.get('instruction', '')
+    answer = example.get('output') or example.get('response', '')
+    return question, answer, example.get('metadata')
+
+def load_jsonl(path: str) -> List[Dict]:
+    """Load a JSONL file into a list of dicts"""
+    with open(path, 'r', encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+def token_f1(prediction: str, reference: str) -> float:
+    """Bag-of-words F1 between a generated and a reference answer"""
+    pred_tokens = prediction.lower().split()
+    ref_tokens = reference.lower().split()
+    if not pred_tokens or not ref_tokens:
+        return 0.0
+
+    common = Counter(pred_tokens) & Counter(ref_tokens)
+    overlap = sum(common.values())
+    if overlap == 0:
+        return 0.0
+
+    precision = overlap / len(pred_tokens)
+    recall = overlap / len(ref_tokens)
+    return 2 * precision * recall / (precision + recall)
+
+def latency_summary(latencies: List[float]) -> Dict:
+    """p50/p95/p99/mean of a list of latencies in seconds"""
+    if not latencies:
+        return {}
+    values = np.array(latencies)
+    return {
+        'p50': float(np.percentile(values, 50)),
+        'p95': float(np.percentile(values, 95)),
+        'p99': float(np.percentile(values, 99)),
+        'mean': float(values.mean()),
+    }
+
+class VeterinaryEvaluator:
+    """Evaluates a model that is already loaded in memory"""
+
+    def __init__(self, model, template: PromptTemplate,
+                 batch_size: int = 8, max_new_tokens: int = 128, max_prompt_length: int = 512):
+        self.model = model
+        self.template = template
+        self.tokenizer = template.tokenizer
+        self.batch_size = batch_size
+        self.max_new_tokens = max_new_tokens
+        self.max_prompt_length = max_prompt_length
+        self.collator = DataCollatorForSeq2Seq(
+            tokenizer=right_padded(self.tokenizer),  # Generation keeps the tokenizer's left padding
+            padding=True,
+            label_pad_token_id=-100,
+            pad_to_multiple_of=8
+        )
+
+    @property
+    def device(self):
+        return next(self.model.parameters()).device
+
+    @torch.no_grad()
+    def evaluate_perplexity(self, features: List[Dict]) -> Dict:
+        """Token-level loss and perplexity over the labelled tokens, in batched forward passes"""
+        total_loss = 0.0
+        total_tokens = 0
+        start = time.perf_counter()
+
+        for i in range(0, len(features), self.batch_size):
+            batch = self.collator(features[i:i + self.batch_size])
+            batch = {k: v.to(self.device) for k, v in batch.items()}
+            labels = batch.pop('labels')
+
+            logits = self.model(**batch).logits
+            shift_logits = logits[:, :-1, :].float()
+            shift_labels = labels[:, 1:]
+
+            total_loss += torch.nn.functional.cross_entropy(
+                shift_logits.reshape(-1, shift_logits.size(-1)),
+                shift_labels.reshape(-1),
+                ignore_index=-100,
+                reduction='sum'
+            ).item()
+            total_tokens += int((shift_labels != -100).sum())
+
+        elapsed = time.perf_counter() - start
+        mean_loss = total_loss / total_tokens if total_tokens else float('nan')
+        return {
+            'loss': mean_loss,
+            'perplexity': math.exp(mean_loss) if total_tokens else float('nan'),
+            'tokens': total_tokens,
+            'seconds': elapsed,
+            'tokens_per_second': total_tokens / elapsed if elapsed else 0.0,
+        }
+
+    @torch.no_grad()
+    def evaluate_generation(self, examples: List[Dict]) -> Dict:
+        """Greedy batched generation scored against the reference answers"""
+        samples = []
+        batch_latencies = []
+        generated_tokens = 0
+        start = time.perf_counter()
+
+        for i in range(0, len(examples), self.batch_size):
+            batch_examples = [split_example(ex) for ex in examples[i:i + self.batch_size]]
+            prompts = [self.template.encode_prompt(q, m, max_length=self.max_prompt_length) for q, _, m in batch_examples]
+            inputs = self.template.pad_prompts(prompts).to(self.device)
+
+            batch_start = time.perf_counter()
+            outputs = self.model.generate(
+                **inputs,
+                max_new_tokens=self.max_new_tokens,
+                do_sample=False,
+                use_cache=True,
+                pad_token_id=self.tokenizer.pad_token_id,
+                eos_token_id=self.tokenizer.eos_token_id
+            )
+            batch_latency = time.perf_counter() - batch_start
+            batch_latencies.append(batch_latency)
+
+            # With left padding every prompt ends at the same column
+            new_tokens = outputs[:, inputs['input_ids'].shape[1]:]
+            generated_tokens += int((new_tokens != self.tokenizer.pad_token_id).sum())
+            predictions = self.tokenizer.batch_decode(new_tokens, skip_special_tokens=True)
+
+            for (question, reference, _), prediction in zip(batch_examples, predictions):
+                prediction = prediction.strip()
+                samples.append({
+                    'question': question,
+                    'reference': reference,
+                    'prediction': prediction,
+                    'token_f1': token_f1(prediction, reference),
+                    'exact_match': prediction == reference.strip(),
+                })
+
+        elapsed = time.perf_counter() - start
+        count = len(samples)
+        return {
+            'samples': count,
+            'token_f1': sum(s['token_f1'] for s in samples) / count if count else 0.0,
+            'exact_match': sum(s['exact_match'] for s in samples) / count if count else 0.0,
+            'mean_answer_words': sum(len(s['prediction'].split()) for s in samples) / count if count else 0.0,
+            'seconds': elapsed,
+            'samples_per_second': count / elapsed if elapsed else 0.0,
+            'generated_tokens_per_second': generated_tokens / elapsed if elapsed else 0.0,
+            'batch_latency_seconds': latency_summary(batch_latencies),
+            # Samples share a generate() call, so only the per-batch mean is a real per-sample number
+            'mean_sample_latency_seconds': sum(batch_latencies) / count if count else 0.0,
+            'examples': samples,
+        }
+
+    def run(self, examples: List[Dict], features: List[Dict], report_path: Path, run_info: Dict = None) -> Dict:
+        """Run perplexity and generation evaluation and write the JSON report"""
+        was_training = self.model.training
+        self.model.eval()
+
+        try:
+            logger.info(f"📏 Computing perplexity on {len(features)} held-out examples...")
+            perplexity = self.evaluate_perplexity(features)
+
+            logger.info(f"🧪 Generating answers for {len(examples)} held-out questions...")
+            generation = self.evaluate_generation(examples)
+        finally:
+            if was_training:
+                self.model.train()
+
+        report = {
+            'timestamp': datetime.now().isoformat(),
+            'run': run_info or {},
+            'batch_size': self.batch_size,
+            'max_new_tokens': self.max_new_tokens,
+            'perplexity': perplexity,
+            'generation': generation,
+        }
+
+        report_path = Path(report_path)
+        report_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(report_path, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+
+        logger.info(
+            f"✅ Evaluation: perplexity {perplexity['perplexity']:.2f}, token F1 {generation['token_f1']:.3f}, "
+            f"{generation['samples_per_second']:.2f} samples/s, report written to {report_path}"
+        )
+        return report
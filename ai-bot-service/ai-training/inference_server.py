@@ -5,6 +5,7 @@ Standalone Python server for veterinary AI model inference.
 Communicates with Node.js via stdin/stdout for integration.
 """
 
+import os
 import sys
 import json
 import logging
@@ -16,42 +17,66 @@ import signal
 import threading
 import time
 
+from artifact_registry import ArtifactRegistry
+from prompt_template import PromptTemplate
+
 # Setup logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
 class VeterinaryAIInferenceServer:
-    def __init__(self, model_path: str):
-        self.model_path = Path(model_path)
-        self.config = None
-        self.tokenizer = None
-        self.model = None
+    def __init__(self, model_path: str, variant: str = None):
+        self.root_path = Path(model_path)
+        self.variant = variant or os.environ.get("VETERINARY_AI_VARIANT")
+        self.poll_seconds = float(os.environ.get("VETERINARY_AI_POLL_SECONDS", "30"))
+        self.registry = ArtifactRegistry(self.root_path) if ArtifactRegistry.exists(self.root_path) else None
+        self.version = None
+        self.pending = None  # Next version, warmed up by the watcher thread
         self.is_running = True
         
-        # Load configuration
-        self.load_config()
+        # Resolve the served version and load its configuration
+        self.version, self.model_path = self.resolve_model_path()
+        self.config = self.load_config(self.model_path)
         
         # Load model and tokenizer
-        self.load_model()
+        self.tokenizer, self.model = self.load_model(self.config, self.model_path)
+        self.template = PromptTemplate(self.tokenizer)  # Same prompt format the model was trained on
         
         logger.info("Model loaded successfully")
         print("Model loaded successfully", flush=True)  # Signal to Node.js
     
-    def load_config(self):
+    def resolve_model_path(self):
+        """(version, directory) to serve: the registry's current version, or the plain model directory"""
+        if not self.registry:
+            return None, self.root_path
+        
+        version = self.registry.current()
+        version_dir = self.registry.version_dir(version)
+        if not version_dir.is_dir():
+            raise FileNotFoundError(f"CURRENT points at version {version}, but {version_dir} does not exist")
+        
+        variant = self.variant
+        if variant is None and (version_dir / "variants" / "merged").exists():
+            variant = "merged"  # No adapter overhead on CPU
+        return version, version_dir / "variants" / variant if variant else version_dir
+    
+    def load_config(self, model_path: Path) -> dict:
         """Load inference configuration"""
-        config_path = self.model_path / "inference" / "config.json"
+        config_path = model_path / "inference" / "config.json"
         
         if config_path.exists():
             with open(config_path, 'r') as f:
-                self.config = json.load(f)
+                config = json.load(f)
+            config["model_path"] = self.resolve_config_path(model_path, config["model_path"])
+            config["tokenizer_path"] = self.resolve_config_path(model_path, config["tokenizer_path"])
         else:
             # Default configuration
-            self.config = {
+            config = {
                 "model_type": "veterinary-ai",
                 "base_model": "microsoft/DialoGPT-small",
                 "use_lora": True,
-                "model_path": str(self.model_path),
-                "tokenizer_path": str(self.model_path),
+                "model_path": str(model_path),
+                "tokenizer_path": str(model_path),
                 "generation_config": {
                     "max_new_tokens": 200,
                     "temperature": 0.7,
@@ -68,72 +93,108 @@ class VeterinaryAIInferenceServer:
                     "eos_token": "<|endoftext|>"
                 }
             }
+        
+        return config
+    
+    def resolve_config_path(self, model_path: Path, value: str) -> str:
+        """Registry versions store paths relative to their own directory, legacy exports relative to the cwd"""
+        path = Path(value)
+        if path.is_absolute():
+            return value
+        candidate = model_path / path
+        return str(candidate) if self.registry is not None or candidate.exists() else value
     
-    def load_model(self):
-        """Load the trained veterinary AI model"""
-        logger.info(f"Loading model from {self.model_path}")
+    def load_model(self, config: dict, model_path: Path):
+        """Load the trained veterinary AI model, returns (tokenizer, model)"""
+        logger.info(f"Loading model from {model_path}")
         
         # Load tokenizer
-        self.tokenizer = AutoTokenizer.from_pretrained(
-            self.config["tokenizer_path"],
+        tokenizer = AutoTokenizer.from_pretrained(
+            config["tokenizer_path"],
             padding_side="left"
         )
         
         # Ensure pad token is set
-        if self.tokenizer.pad_token is None:
-            self.tokenizer.pad_token = self.tokenizer.eos_token
+        if tokenizer.pad_token is None:
+            tokenizer.pad_token = tokenizer.eos_token
         
         # Load model
-        if self.config["use_lora"]:
+        if config.get("backend") == "onnx":
+            from optimum.onnxruntime import ORTModelForCausalLM
+            model = ORTModelForCausalLM.from_pretrained(config["model_path"])
+        elif config["use_lora"]:
             # Load base model first
             base_model = AutoModelForCausalLM.from_pretrained(
-                self.config["base_model"],
+                config["base_model"],
                 torch_dtype=torch.float16 if torch.cuda.is_available() else torch.float32,
                 device_map="auto" if torch.cuda.is_available() else None,
                 low_cpu_mem_usage=True
             )
             
             # Load LoRA adapter
-            self.model = PeftModel.from_pretrained(base_model, self.config["model_path"])
+            model = PeftModel.from_pretrained(base_model, config["model_path"])
         else:
-            self.model = AutoModelForCausalLM.from_pretrained(
-                self.config["model_path"],
+            model = AutoModelForCausalLM.from_pretrained(
+                config["model_path"],
                 torch_dtype=torch.float16 if torch.cuda.is_available() else torch.float32,
                 device_map="auto" if torch.cuda.is_available() else None
             )
         
-        self.model.eval()
+        if hasattr(model, "eval"):
+            model.eval()
         logger.info("✅ Model loaded and ready for inference")
+        return tokenizer, model
+    
+    def watch_current_version(self):
+        """Load and warm up a newly promoted version in the background, run() swaps it in between requests"""
+        while self.is_running:
+            time.sleep(self.poll_seconds)
+            try:
+                version = self.registry.current()
+                if not version or version == self.version or (self.pending and self.pending[0] == version):
+                    continue
+                
+                logger.info(f"🔥 Warming up version {version}...")
+                _, model_path = self.resolve_model_path()
+                config = self.load_config(model_path)
+                tokenizer, model = self.load_model(config, model_path)
+                template = PromptTemplate(tokenizer)
+                
+                # One short generation so the first real request does not pay for lazy initialisation
+                with torch.no_grad():
+                    model.generate(
+                        input_ids=torch.tensor([template.encode_prompt("warmup")]),
+                        max_new_tokens=1,
+                        pad_token_id=tokenizer.pad_token_id
+                    )
+                
+                self.pending = (version, model_path, config, tokenizer, template, model)
+            except Exception as e:
+                logger.error(f"Failed to warm up the next version: {e}")
+    
+    def apply_pending_version(self):
+        """Switch to the warmed-up version, if there is one"""
+        if not self.pending:
+            return
+        previous = self.version
+        self.version, self.model_path, self.config, self.tokenizer, self.template, self.model = self.pending
+        self.pending = None
+        logger.info(f"🔀 Switched from version {previous} to {self.version}")
     
-    def generate_response(self, request: dict) -> dict:
-        """Generate veterinary advice response"""
+    def generate_response(self, request: dict, streamer=None) -> dict:
+        """Generate veterinary advice response (streamer is passed through to model.generate)"""
         try:
             query = request.get('query', '')
             species = request.get('species', 'general')
             language = request.get('language', 'en')
             context = request.get('context', '')
             
-            # Format input with veterinary context
-            species_info = ""
-            if species and species != 'general':
-                species_info = f"<|species|>{species}<|species|> "
-            
-            # Create the formatted prompt
-            formatted_input = (
-                f"{self.config['special_tokens']['vet_start']}"
-                f"You are a veterinary AI assistant. {species_info}"
-                f"\n{self.config['special_tokens']['human_prefix']} {query}"
-                f"\n{self.config['special_tokens']['assistant_prefix']} "
-            )
-            
-            # Tokenize input
-            inputs = self.tokenizer(
-                formatted_input,
-                return_tensors="pt",
-                truncation=True,
-                max_length=512,
-                padding=True
-            )
+            # Assemble the training prompt from pre-tokenized segments, only the query is tokenized here
+            prompt_ids = self.template.encode_prompt(query, {'species': species}, max_length=512)
+            inputs = {
+                'input_ids': torch.tensor([prompt_ids]),
+                'attention_mask': torch.ones(1, len(prompt_ids), dtype=torch.long)
+            }
             
             # Move to GPU if available
             if torch.cuda.is_available():
@@ -150,16 +211,15 @@ class VeterinaryAIInferenceServer:
                     repetition_penalty=self.config["generation_config"]["repetition_penalty"],
                     pad_token_id=self.tokenizer.pad_token_id,
                     eos_token_id=self.tokenizer.eos_token_id,
-                    use_cache=True
+                    use_cache=True,
+                    streamer=streamer
                 )
             
-            # Decode response
-            response_text = self.tokenizer.decode(outputs[0], skip_special_tokens=True)
+            prompt_tokens = len(prompt_ids)
+            completion_tokens = int((outputs[0][prompt_tokens:] != self.tokenizer.pad_token_id).sum())
             
-            # Extract only the generated part (remove the input prompt)
-            assistant_start = f"{self.config['special_tokens']['assistant_prefix']} "
-            if assistant_start in response_text:
-                response_text = response_text.split(assistant_start, 1)[1].strip()
+            # Decode only the generated part
+            response_text = self.tokenizer.decode(outputs[0][prompt_tokens:], skip_special_tokens=True).strip()
             
             # Clean up the response
             response_text = self.clean_response(response_text)
@@ -174,7 +234,12 @@ class VeterinaryAIInferenceServer:
                 'model_info': {
                     'model_type': self.config['model_type'],
                     'base_model': self.config['base_model'],
-                    'use_lora': self.config['use_lora']
+                    'use_lora': self.config['use_lora'],
+                    'version': self.version
+                },
+                'usage': {
+                    'prompt_tokens': prompt_tokens,
+                    'completion_tokens': completion_tokens
                 }
             }
             
@@ -255,6 +320,10 @@ class VeterinaryAIInferenceServer:
         signal.signal(signal.SIGTERM, self.signal_handler)
         signal.signal(signal.SIGINT, self.signal_handler)
         
+        # Follow the registry's CURRENT pointer so promotions and rollbacks need no restart
+        if self.registry:
+            threading.Thread(target=self.watch_current_version, daemon=True).start()
+        
         try:
             while self.is_running:
                 try:
@@ -275,6 +344,7 @@ class VeterinaryAIInferenceServer:
                         continue
                     
                     # Generate response
+                    self.apply_pending_version()
                     response = self.generate_response(request)
                     
                     # Send response to stdout
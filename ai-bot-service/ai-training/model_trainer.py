@@ -3,32 +3,57 @@
 Veterinary AI Model Trainer
 Fine-tunes a language model on veterinary knowledge for our custom AI bot.
 Uses state-of-the-art techniques like LoRA, QLoRA, and parameter-efficient training.
+
+CPU data-parallel training:
+    Set ``num_processes`` in ModelConfig (e.g. 4) and run ``python model_trainer.py``.
+    The script relaunches itself through ``torch.distributed.run`` with one worker per
+    process, each joined to a gloo process group and pinned to ``threads_per_process``
+    intra-op threads. Gradient accumulation is divided by the process count so the
+    effective batch size stays the same as a single-process run. Throughput for each
+    process count is appended to ``output_dir/scaling_log.jsonl`` together with the
+    scaling efficiency against the single-process baseline.
 """
 
 import os
+import sys
 import json
+import re
+import copy
+import random
+import shutil
+import argparse
+import functools
+import hashlib
+import time
 import logging
+import resource
+import subprocess
 import torch
 import pandas as pd
 from pathlib import Path
 from typing import Dict, List, Optional, Tuple
-from dataclasses import dataclass, field
+from dataclasses import asdict, dataclass, field, replace
 from datetime import datetime
 from torch.utils.tensorboard import SummaryWriter
 
 # Transformers and training
 from transformers import (
     AutoTokenizer, AutoModelForCausalLM, TrainingArguments, Trainer,
-    DataCollatorForLanguageModeling
+    DataCollatorForSeq2Seq, TrainerCallback
 )
-from datasets import Dataset, load_dataset
-from peft import LoraConfig, get_peft_model, TaskType
+from transformers.trainer_utils import get_last_checkpoint
+from datasets import Dataset, load_dataset, load_from_disk
+from peft import LoraConfig, get_peft_model, TaskType, PeftModel
 import wandb
 from accelerate import Accelerator
 
 # Evaluation
 from sklearn.metrics import accuracy_score, f1_score
 import numpy as np
+from evaluation import VeterinaryEvaluator, load_jsonl, split_example
+from prompt_template import PromptTemplate, right_padded, VET_TOKEN, SPECIES_TOKEN, EOS_TOKEN, HUMAN_PREFIX, ASSISTANT_PREFIX
+from pruning import compute_importance, prune_model
+from artifact_registry import ArtifactRegistry
 
 # Setup logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -70,42 +95,202 @@ class ModelConfig:
     save_steps: int = 500
     logging_steps: int = 100
     
+    # Resuming and time budget
+    resume_from_checkpoint: bool = True  # Continue from the latest checkpoint-* in output_dir
+    max_wall_clock_minutes: Optional[float] = None  # Save a checkpoint and stop once exceeded
+    
+    # Memory-lean CPU training - low_memory switches on everything below
+    low_memory: bool = False
+    gradient_checkpointing: bool = False
+    bf16: bool = False  # CPU bf16 autocast, only applied when the CPU supports bf16 natively
+    optim: str = "adamw_torch"  # "adafactor", or "adamw_bnb_8bit"/"paged_adamw_8bit" with bitsandbytes
+    freeze_embeddings: bool = False  # Keep the resized token embeddings out of the optimizer
+    
+    # Profiling
+    enable_profiling: bool = True
+    profile_window_steps: int = 50  # Optimizer steps per profiling window
+    profile_trace_steps: Optional[Tuple[int, int]] = None  # (first, last) step to capture with torch.profiler
+    
+    # CPU data parallelism (see module docstring)
+    num_processes: int = 1
+    threads_per_process: Optional[int] = None  # None splits os.cpu_count() evenly between processes
+    ddp_backend: str = "gloo"
+    
     # Data
     train_data_path: str = "data/training_data.jsonl"
     validation_split: float = 0.1
     max_samples: Optional[int] = None  # None for all data
+    response_only_loss: bool = True  # Mask prompt/pad labels so only the answer is trained on
+    padding: str = "dynamic"  # "dynamic" pads to the longest example in a batch, "max_length" to model_max_length
+    pack_sequences: bool = False  # Concatenate training examples into model_max_length blocks
+    preprocessing_num_workers: Optional[int] = None  # Processes for tokenization
+    dataloader_num_workers: int = 0
+    tokenized_cache_dir: Optional[str] = None  # Reuse tokenized datasets across runs with the same data settings
+    
+    # Incremental refresh - continue from the last exported model on pairs newer than the last run
+    incremental: bool = False
+    base_adapter_path: Optional[str] = None  # Defaults to output_dir
+    replay_ratio: float = 0.5  # Old examples replayed per new example
+    incremental_epochs: int = 1
+    
+    # Knowledge distillation into a smaller student for serving
+    distill: bool = False
+    student_model_name: Optional[str] = None  # e.g. "distilgpt2"; None keeps every n-th teacher layer
+    student_num_layers: int = 6
+    distill_temperature: float = 2.0
+    distill_alpha: float = 0.5  # Weight of the KL term, the rest goes to the usual LM loss
+    distill_epochs: int = 2
+    student_output_dir: Optional[str] = None  # Defaults to "<output_dir>-student"
+    
+    # Structured pruning of heads and MLP channels for serving
+    prune: bool = False
+    prune_sparsity_levels: List[float] = field(default_factory=lambda: [0.1, 0.25, 0.4])
+    prune_calibration_samples: int = 64  # Validation examples used to score importance
+    prune_recovery_steps: int = 0  # Short fine-tune after pruning, 0 disables it
+    
+    # Versioned export (see artifact_registry.py)
+    export_variants: List[str] = field(default_factory=lambda: ["merged"])  # Also available: "onnx" (needs optimum)
+    
+    # Held-out evaluation harness
+    eval_data_path: Optional[str] = None  # Held-out JSONL, defaults to the validation split
+    eval_max_samples: int = 200
+    eval_batch_size: int = 8
+    eval_max_new_tokens: int = 128
     
     # Monitoring (Wandb removed)
     # use_wandb: bool = False
     # wandb_project: str = "veterinary-ai-training"
     # wandb_run_name: Optional[str] = None
+    
+    def __post_init__(self):
+        if self.low_memory:
+            self.gradient_checkpointing = True
+            self.bf16 = True
+            self.freeze_embeddings = True
+            if self.optim == "adamw_torch":
+                self.optim = "adafactor"
+
+# Settings that change nothing a checkpoint has computed, so a run may resume across changes to them
+RESUME_INDEPENDENT_FIELDS = {
+    "resume_from_checkpoint", "max_wall_clock_minutes", "enable_profiling", "profile_window_steps",
+    "profile_trace_steps", "threads_per_process", "preprocessing_num_workers", "dataloader_num_workers",
+    "tokenized_cache_dir", "distill", "student_model_name", "student_num_layers", "distill_temperature",
+    "distill_alpha", "distill_epochs", "student_output_dir", "prune", "prune_sparsity_levels",
+    "prune_calibration_samples", "prune_recovery_steps", "export_variants", "eval_data_path",
+    "eval_max_samples", "eval_batch_size", "eval_max_new_tokens",
+}
+FINGERPRINT_FILE = "run_fingerprint.json"
+
+def cpu_supports_bf16() -> bool:
+    """Check whether the CPU has native bf16 instructions (AVX512-BF16 or AMX)"""
+    try:
+        with open("/proc/cpuinfo", 'r') as f:
+            flags = f.read()
+    except OSError:
+        return False
+    return "avx512_bf16" in flags or "amx_bf16" in flags
+
+# Tokenization lives at module level so datasets can pickle it for multi-process map()
+def example_timestamp(example: Dict) -> Optional[str]:
+    return (example.get('metadata') or {}).get('timestamp')
+
+def tokenize_example(example: Dict, template: PromptTemplate, max_length: int, response_only_loss: bool = True) -> Dict:
+    """Tokenize one example into input_ids/attention_mask/labels without padding"""
+    question, answer, metadata = split_example(example)
+    
+    # Always leave room for the answer so no example ends up fully masked
+    prompt_ids = template.encode_prompt(question, metadata, max_length=max_length // 2)
+    answer_ids = template.encode_answer(answer)
+    input_ids = (prompt_ids + answer_ids)[:max_length]
+    
+    if response_only_loss:
+        labels = ([-100] * len(prompt_ids) + answer_ids)[:max_length]
+    else:
+        labels = list(input_ids)
+    
+    return {'input_ids': input_ids, 'attention_mask': [1] * len(input_ids), 'labels': labels}
+
+def tokenize_batch(examples, template: PromptTemplate, max_length: int, response_only_loss: bool = True) -> Dict:
+    """Batched datasets.map() wrapper around tokenize_example"""
+    columns = list(examples.keys())
+    tokenized = [
+        tokenize_example({column: examples[column][i] for column in columns}, template, max_length, response_only_loss)
+        for i in range(len(examples[columns[0]]))
+    ]
+    
+    # Padding is left to the data collator so each batch is only as long as its longest example
+    return {key: [t[key] for t in tokenized] for key in ('input_ids', 'attention_mask', 'labels')}
+
+def pack_batch(examples, block_size: int) -> Dict:
+    """Concatenate tokenized examples and cut them into block_size chunks (labels keep their -100 masking)"""
+    packed = {key: [] for key in ('input_ids', 'attention_mask', 'labels')}
+    buffer = {key: [] for key in packed}
+    
+    for i in range(len(examples['input_ids'])):
+        for key in packed:
+            buffer[key].extend(examples[key][i])
+        while len(buffer['input_ids']) >= block_size:
+            for key in packed:
+                packed[key].append(buffer[key][:block_size])
+                buffer[key] = buffer[key][block_size:]
+    
+    # Keep the remainder of the batch as one shorter block instead of dropping it
+    if buffer['input_ids']:
+        for key in packed:
+            packed[key].append(buffer[key])
+    
+    return packed
 
 class VeterinaryModelTrainer:
     """Trains a custom veterinary AI model"""
     
     def __init__(self, config: ModelConfig):
         self.config = config
-        self.accelerator = Accelerator()
+        self.world_size = int(os.environ.get("WORLD_SIZE", 1))
+        
+        if self.world_size > 1:
+            # Join the gloo group ourselves so Accelerator and Trainer reuse it instead of picking a backend
+            threads = config.threads_per_process or max(1, (os.cpu_count() or 1) // self.world_size)
+            torch.set_num_threads(threads)
+            if not torch.distributed.is_initialized():
+                torch.distributed.init_process_group(backend=config.ddp_backend)
+        elif config.threads_per_process:
+            torch.set_num_threads(config.threads_per_process)
+        
+        self.accelerator = Accelerator(cpu=self.world_size > 1)
         self.tokenizer = None
+        self.prompt_template = None
         self.model = None
         self.train_dataset = None
         self.eval_dataset = None
+        self.eval_examples = []
+        self.data_watermark = None
         
         # Setup directories
         Path(config.output_dir).mkdir(parents=True, exist_ok=True)
         
+        self.state_path = Path(config.output_dir) / "training_state.json"
+        self.previous_state = {}
+        if self.state_path.exists():
+            with open(self.state_path, 'r') as f:
+                self.previous_state = json.load(f)
+        
+        # Incremental refresh needs a previous model and a watermark, otherwise fall back to full training
+        self.incremental = False
+        if config.incremental:
+            model_dir = Path(config.base_adapter_path or config.output_dir)
+            marker = "adapter_config.json" if config.use_lora else "config.json"
+            if (model_dir / marker).exists() and self.previous_state.get("data_watermark"):
+                self.incremental = True
+                self.previous_model_dir = model_dir
+            else:
+                logger.warning("⚠️ No previous model or data watermark found, running full training instead")
+        
         # TensorBoard writer
         self.writer = SummaryWriter(log_dir=os.path.join(config.output_dir, "tensorboard"))
     
-    def load_and_prepare_model(self):
-        """Load base model and prepare for training"""
-        logger.info(f"🤖 Loading base model: {self.config.base_model_name}")
-        
-        # Configure quantization if enabled (disabled for CPU-only training)
-        quantization_config = None
-        # Note: 4-bit quantization disabled for CPU compatibility
-        
-        # Load tokenizer
+    def load_tokenizer(self):
+        """Load the base tokenizer and add the veterinary special tokens"""
         self.tokenizer = AutoTokenizer.from_pretrained(
             self.config.base_model_name,
             trust_remote_code=True,
@@ -129,23 +314,58 @@ class VeterinaryModelTrainer:
         num_added_tokens = self.tokenizer.add_special_tokens(special_tokens)
         logger.info(f"Added {num_added_tokens} special tokens")
         
-        # Load model
+        # Static prompt segments are tokenized once here and reused for every example
+        self.prompt_template = PromptTemplate(self.tokenizer)
+        return self.tokenizer
+    
+    def load_and_prepare_model(self):
+        """Load base model and prepare for training"""
+        logger.info(f"🤖 Loading base model: {self.config.base_model_name}")
+        
+        # Configure quantization if enabled (disabled for CPU-only training)
+        quantization_config = None
+        # Note: 4-bit quantization disabled for CPU compatibility
+        
+        self.load_tokenizer()
+        
+        # Load model (a full fine-tune continues from its own previous export)
+        model_source = self.config.base_model_name
+        if self.incremental and not self.config.use_lora:
+            model_source = str(self.previous_model_dir)
+        
         self.model = AutoModelForCausalLM.from_pretrained(
-            self.config.base_model_name,
+            model_source,
             quantization_config=quantization_config,
             device_map="auto" if torch.cuda.is_available() else None,
             trust_remote_code=True,
-            torch_dtype=torch.float16 if torch.cuda.is_available() else torch.float32
+            torch_dtype=torch.float16 if torch.cuda.is_available() else torch.float32,
+            low_cpu_mem_usage=True
         )
         
         # Resize token embeddings for new tokens
         self.model.resize_token_embeddings(len(self.tokenizer))
         
+        if self.config.freeze_embeddings:
+            # GPT-2 ties input and output embeddings, so this drops the largest matrix from the optimizer
+            for param in self.model.get_input_embeddings().parameters():
+                param.requires_grad = False
+        
+        if self.config.gradient_checkpointing:
+            logger.info("🧮 Enabling gradient checkpointing")
+            self.model.gradient_checkpointing_enable()
+            # Frozen embeddings produce inputs without grad, which checkpointed blocks need
+            self.model.enable_input_require_grads()
+            self.model.config.use_cache = False
+        
         # Prepare model for k-bit training if using quantization (disabled for CPU)
         # Note: 4-bit quantization disabled for CPU compatibility
         
         # Configure LoRA if enabled
-        if self.config.use_lora:
+        if self.config.use_lora and self.incremental:
+            logger.info(f"🔁 Continuing from LoRA adapter in {self.previous_model_dir}")
+            self.model = PeftModel.from_pretrained(self.model, str(self.previous_model_dir), is_trainable=True)
+            self.model.print_trainable_parameters()
+        elif self.config.use_lora:
             logger.info("🔧 Configuring LoRA for parameter-efficient training")
             
             peft_config = LoraConfig(
@@ -163,8 +383,8 @@ class VeterinaryModelTrainer:
         
         logger.info("✅ Model loaded and configured successfully")
     
-    def load_and_prepare_data(self):
-        """Load and prepare training data"""
+    def load_raw_examples(self) -> List[Dict]:
+        """Read the training JSONL, creating a small sample file if it does not exist yet"""
         logger.info(f"📚 Loading training data from {self.config.train_data_path}")
         
         # Check if training data file exists
@@ -203,11 +423,169 @@ class VeterinaryModelTrainer:
                 for line in f:
                     data.append(json.loads(line))
         
-        # Limit samples if specified
-        if self.config.max_samples:
-            data = data[:self.config.max_samples]
+        # Limit samples if specified (incremental runs cap their new examples, oldest first)
+        dropped = []
+        if self.incremental:
+            data, dropped = self.select_incremental_examples(data)
+        elif self.config.max_samples:
+            data, dropped = data[:self.config.max_samples], data[self.config.max_samples:]
+        
+        # Remember how far the data has been trained on so the next incremental run can start after it.
+        # Rows dropped by the cap have to stay newer than the watermark, or they would never be trained on.
+        timestamps = [ts for ts in map(example_timestamp, data) if ts]
+        dropped_timestamps = [ts for ts in map(example_timestamp, dropped) if ts]
+        if dropped_timestamps:
+            oldest_dropped = min(dropped_timestamps)
+            timestamps = [ts for ts in timestamps if ts < oldest_dropped]
+        self.data_watermark = max(timestamps) if timestamps else self.previous_state.get("data_watermark")
         
         logger.info(f"Loaded {len(data)} training examples")
+        return data
+    
+    def select_incremental_examples(self, data: List[Dict]) -> Tuple[List[Dict], List[Dict]]:
+        """(new examples since the last run's watermark plus a seeded replay sample of older ones,
+        new examples left for a later run by max_samples)"""
+        watermark = self.previous_state["data_watermark"]
+        new_examples, old_examples = [], []
+        for example in data:
+            timestamp = example_timestamp(example)
+            if timestamp and timestamp > watermark:
+                new_examples.append(example)
+            else:
+                old_examples.append(example)
+        
+        # The oldest new examples go first, so what the cap leaves out is newer than the next watermark
+        dropped = []
+        if self.config.max_samples:
+            new_examples.sort(key=example_timestamp)
+            limit = max(1, int(self.config.max_samples / (1 + self.config.replay_ratio)))
+            new_examples, dropped = new_examples[:limit], new_examples[limit:]
+        
+        replay_count = min(len(old_examples), int(len(new_examples) * self.config.replay_ratio))
+        replay = random.Random(42).sample(old_examples, replay_count)
+        
+        logger.info(
+            f"🆕 Incremental refresh: {len(new_examples)} examples newer than {watermark}, "
+            f"{len(replay)} replayed from {len(old_examples)} older ones"
+            + (f", {len(dropped)} newer ones left for the next run" if dropped else "")
+        )
+        return (new_examples + replay, dropped) if new_examples else ([], [])
+    
+    def tokenize_dataset(self, dataset: Dataset, pack: bool = False) -> Dataset:
+        """Tokenize a raw dataset and optionally pack it into model_max_length blocks"""
+        tokenized = dataset.map(
+            functools.partial(
+                tokenize_batch,
+                template=self.prompt_template,
+                max_length=self.config.model_max_length,
+                response_only_loss=self.config.response_only_loss
+            ),
+            batched=True,
+            num_proc=self.config.preprocessing_num_workers,
+            remove_columns=dataset.column_names
+        )
+        
+        return self.pack_dataset(tokenized) if pack else tokenized
+    
+    def pack_dataset(self, tokenized: Dataset) -> Dataset:
+        """Pack a tokenized dataset into model_max_length blocks to avoid training on padding"""
+        return tokenized.map(
+            functools.partial(pack_batch, block_size=self.config.model_max_length),
+            batched=True,
+            batch_size=1000,
+            num_proc=self.config.preprocessing_num_workers,
+            remove_columns=tokenized.column_names
+        )
+    
+    def build_data_collator(self):
+        """Data collator that pads labels with -100 and keeps the prompt masking from tokenize_example"""
+        # The tokenizer pads on the left for generation, training batches pad on the right
+        tokenizer = right_padded(self.tokenizer)
+        if self.config.padding == "max_length":
+            return DataCollatorForSeq2Seq(
+                tokenizer=tokenizer,
+                padding="max_length",
+                max_length=self.config.model_max_length,
+                label_pad_token_id=-100
+            )
+        
+        return DataCollatorForSeq2Seq(
+            tokenizer=tokenizer,
+            padding=True,
+            label_pad_token_id=-100,
+            pad_to_multiple_of=8
+        )
+    
+    def tokenized_cache_path(self) -> Optional[Path]:
+        """Cache directory for the tokenized datasets, keyed by everything that changes tokenization"""
+        # Incremental runs select their data from the previous run's state, so they are never cached
+        if not self.config.tokenized_cache_dir or self.incremental or not os.path.exists(self.config.train_data_path):
+            return None
+        data_stat = os.stat(self.config.train_data_path)
+        key = json.dumps({
+            "base_model": self.config.base_model_name,
+            "model_max_length": self.config.model_max_length,
+            "response_only_loss": self.config.response_only_loss,
+            "pack_sequences": self.config.pack_sequences,
+            "max_samples": self.config.max_samples,
+            "validation_split": self.config.validation_split,
+            "prompt_format": [VET_TOKEN, SPECIES_TOKEN, HUMAN_PREFIX, ASSISTANT_PREFIX, EOS_TOKEN],
+            "train_data": [os.path.abspath(self.config.train_data_path), data_stat.st_size, data_stat.st_mtime],
+        }, sort_keys=True)
+        return Path(self.config.tokenized_cache_dir) / hashlib.sha256(key.encode()).hexdigest()[:16]
+    
+    def run_fingerprint(self) -> str:
+        """Hash of the training settings and data a checkpoint belongs to"""
+        data = None
+        if os.path.exists(self.config.train_data_path):
+            data_stat = os.stat(self.config.train_data_path)
+            data = [os.path.abspath(self.config.train_data_path), data_stat.st_size, data_stat.st_mtime]
+        key = json.dumps({
+            "config": {k: v for k, v in asdict(self.config).items() if k not in RESUME_INDEPENDENT_FIELDS},
+            "train_data": data,
+            "incremental_from": self.previous_state.get("data_watermark") if self.incremental else None,
+            "data_watermark": self.data_watermark,
+            "examples": [len(self.train_dataset), len(self.eval_dataset)],
+        }, sort_keys=True, default=str)
+        return hashlib.sha256(key.encode()).hexdigest()
+    
+    def resumable_checkpoint(self, fingerprint: str) -> Optional[str]:
+        """The latest checkpoint-* if it was written for this exact run, stale ones are removed"""
+        last_checkpoint = get_last_checkpoint(self.config.output_dir)
+        if not last_checkpoint:
+            return None
+        
+        fingerprint_path = Path(last_checkpoint) / FINGERPRINT_FILE
+        if fingerprint_path.exists():
+            with open(fingerprint_path, 'r') as f:
+                if json.load(f).get("fingerprint") == fingerprint:
+                    return last_checkpoint
+        
+        logger.info(f"🆕 {last_checkpoint} was written for different settings or data, starting fresh")
+        self.accelerator.wait_for_everyone()  # Every rank has decided before the checkpoints go away
+        if self.accelerator.is_main_process:
+            for checkpoint in Path(self.config.output_dir).glob("checkpoint-*"):
+                shutil.rmtree(checkpoint, ignore_errors=True)
+        self.accelerator.wait_for_everyone()
+        return None
+    
+    def load_and_prepare_data(self) -> bool:
+        """Load and prepare training data, returns False if there is nothing to train on"""
+        cache_path = self.tokenized_cache_path()
+        if cache_path and (cache_path / "meta.json").exists():
+            with open(cache_path / "meta.json", 'r') as f:
+                meta = json.load(f)
+            self.train_dataset = load_from_disk(str(cache_path / "train"))
+            self.eval_dataset = load_from_disk(str(cache_path / "eval"))
+            self.eval_examples = meta["eval_examples"]
+            self.data_watermark = meta["data_watermark"]
+            logger.info(f"♻️ Reusing tokenized datasets from {cache_path}")
+            return True
+        
+        data = self.load_raw_examples()
+        if not data:
+            logger.info("✅ No new training examples since the last run, nothing to do")
+            return False
         
         # Convert to dataset
         df = pd.DataFrame(data)
@@ -221,127 +599,131 @@ class VeterinaryModelTrainer:
         
         self.train_dataset = train_test_split['train']
         self.eval_dataset = train_test_split['test']
+        self.eval_examples = self.eval_dataset.to_list()
         
-        # Tokenize datasets
-        self.train_dataset = self.train_dataset.map(
-            self.tokenize_function,
-            batched=True,
-            remove_columns=self.train_dataset.column_names
-        )
+        # Tokenize datasets (eval stays unpacked so metrics stay per example)
+        self.train_dataset = self.tokenize_dataset(self.train_dataset, pack=self.config.pack_sequences)
+        self.eval_dataset = self.tokenize_dataset(self.eval_dataset)
         
-        self.eval_dataset = self.eval_dataset.map(
-            self.tokenize_function,
-            batched=True,
-            remove_columns=self.eval_dataset.column_names
-        )
+        if cache_path and self.accelerator.is_main_process:
+            self.train_dataset.save_to_disk(str(cache_path / "train"))
+            self.eval_dataset.save_to_disk(str(cache_path / "eval"))
+            # Written last, so a half-written cache is never picked up
+            with open(cache_path / "meta.json", 'w') as f:
+                json.dump({"eval_examples": self.eval_examples, "data_watermark": self.data_watermark}, f)
         
         logger.info(f"✅ Prepared {len(self.train_dataset)} training and {len(self.eval_dataset)} validation examples")
+        return True
     
-    def tokenize_function(self, examples):
-        """Tokenize training examples with veterinary-specific formatting"""
-        tokenized_inputs = []
-        tokenized_labels = []
-        
-        for i in range(len(examples['instruction'])):
-            # Format input with veterinary context
-            species_info = ""
-            if 'metadata' in examples and examples['metadata'][i]:
-                metadata = examples['metadata'][i]
-                if isinstance(metadata, str):
-                    metadata = json.loads(metadata)
-                
-                species = metadata.get('species', [])
-                category = metadata.get('category', 'general')
-                
-                if species and species != ['general']:
-                    species_info = f"<|species|>{', '.join(species)}<|species|>"
-                
-                if category != 'general':
-                    species_info += f" Category: {category}."
-            
-            # Create formatted conversation
-            conversation = (
-                f"<|vet|>{examples['instruction'][i]} "
-                f"{species_info}\n"
-                f"Human: {examples['instruction'][i]}\n"
-                f"Veterinarian: {examples['response'][i]}<|endoftext|>"
-            )
-            
-            # Tokenize
-            tokenized = self.tokenizer(
-                conversation,
-                truncation=True,
-                max_length=self.config.model_max_length,
-                padding="max_length",
-                return_tensors="pt"
-            )
-            
-            tokenized_inputs.append(tokenized['input_ids'].squeeze())
-            tokenized_labels.append(tokenized['input_ids'].squeeze())  # For causal LM, labels = input_ids
+    def compute_metrics(self, eval_pred):
+        """Compute token-level loss, perplexity and accuracy from the per-sequence sums of VeterinaryTrainer"""
+        predictions, _ = eval_pred
+        nll_sum, correct, tokens = np.asarray(predictions, dtype=np.float64).sum(axis=0)
         
+        token_loss = nll_sum / tokens if tokens else float('nan')
         return {
-            'input_ids': tokenized_inputs,
-            'attention_mask': [torch.ones_like(ids) for ids in tokenized_inputs],
-            'labels': tokenized_labels
+            'token_loss': token_loss,
+            'perplexity': float(np.exp(token_loss)) if tokens else float('nan'),
+            'token_accuracy': correct / tokens if tokens else 0.0,
+            'tokens': int(tokens)
         }
     
-    def compute_metrics(self, eval_pred):
-        """Compute evaluation metrics"""
-        predictions, labels = eval_pred
-        
-        # Decode predictions and labels
-        decoded_preds = self.tokenizer.batch_decode(predictions, skip_special_tokens=True)
-        decoded_labels = self.tokenizer.batch_decode(labels, skip_special_tokens=True)
+    def build_training_arguments(self, output_dir: Optional[str] = None,
+                                 num_train_epochs: Optional[float] = None,
+                                 max_steps: int = -1, checkpoints: bool = True) -> TrainingArguments:
+        """TrainingArguments shared by the main, distillation and pruning recovery runs and sweep trials (sweep.py)
+
+        checkpoints=False turns off evaluation, checkpointing and best-model loading for short runs without an eval set
+        """
+        # Keep the effective batch size of a single-process run when training data-parallel
+        gradient_accumulation_steps = self.config.gradient_accumulation_steps
+        if self.world_size > 1:
+            gradient_accumulation_steps = max(1, round(gradient_accumulation_steps / self.world_size))
+            if gradient_accumulation_steps * self.world_size != self.config.gradient_accumulation_steps:
+                logger.warning(
+                    f"⚠️ gradient_accumulation_steps={self.config.gradient_accumulation_steps} does not divide "
+                    f"across {self.world_size} processes, effective batch size changes to "
+                    f"{gradient_accumulation_steps * self.world_size * self.config.per_device_train_batch_size}"
+                )
+            logger.info(
+                f"🧵 Data-parallel on {self.world_size} CPU processes ({self.config.ddp_backend}), "
+                f"{torch.get_num_threads()} threads each, gradient accumulation {gradient_accumulation_steps}"
+            )
         
-        # Simple accuracy based on exact match (for evaluation purposes)
-        exact_matches = sum(pred.strip() == label.strip() for pred, label in zip(decoded_preds, decoded_labels))
-        accuracy = exact_matches / len(decoded_preds)
+        optim = self.config.optim
+        if "bnb" in optim or "paged" in optim:
+            try:
+                import bitsandbytes  # noqa: F401
+            except ImportError:
+                logger.warning(f"⚠️ bitsandbytes not installed, using adafactor instead of {optim}")
+                optim = "adafactor"
         
-        return {
-            'accuracy': accuracy,
-            'exact_matches': exact_matches,
-            'total_samples': len(decoded_preds)
-        }
-    
-    def train_model(self):
-        """Train the veterinary AI model"""
-        logger.info("🚀 Starting model training...")
+        bf16 = self.config.bf16 and not torch.cuda.is_available() and cpu_supports_bf16()
+        if self.config.bf16 and not bf16:
+            logger.warning("⚠️ CPU has no native bf16 support, training in float32")
         
-        # Training arguments
-        training_args = TrainingArguments(
-            output_dir=self.config.output_dir,
-            num_train_epochs=self.config.num_train_epochs,
+        return TrainingArguments(
+            output_dir=output_dir or self.config.output_dir,
+            num_train_epochs=num_train_epochs or self.config.num_train_epochs,
+            max_steps=max_steps,
             per_device_train_batch_size=self.config.per_device_train_batch_size,
             per_device_eval_batch_size=self.config.per_device_eval_batch_size,
-            gradient_accumulation_steps=self.config.gradient_accumulation_steps,
+            gradient_accumulation_steps=gradient_accumulation_steps,
             learning_rate=self.config.learning_rate,
             weight_decay=self.config.weight_decay,
-            warmup_steps=self.config.warmup_steps,
+            # The previous adapter is already trained, a short refresh does not need warmup
+            warmup_steps=0 if self.incremental else self.config.warmup_steps,
             max_grad_norm=self.config.max_grad_norm,
-            evaluation_strategy=self.config.evaluation_strategy,
+            evaluation_strategy=self.config.evaluation_strategy if checkpoints else "no",
             eval_steps=self.config.eval_steps,
+            save_strategy="steps" if checkpoints else "no",
             save_steps=self.config.save_steps,
             logging_steps=self.config.logging_steps,
             save_total_limit=3,
-            load_best_model_at_end=True,
+            load_best_model_at_end=checkpoints,
             metric_for_best_model="eval_loss",
             greater_is_better=False,
             # report_to="wandb" if self.config.use_wandb else None,  # Wandb removed
             # run_name=self.config.wandb_run_name,  # Wandb removed
             fp16=torch.cuda.is_available(),
+            bf16=bf16,
+            optim=optim,
+            gradient_checkpointing=self.config.gradient_checkpointing,
             dataloader_pin_memory=False,
+            dataloader_num_workers=self.config.dataloader_num_workers,
             remove_unused_columns=False,
+            no_cuda=self.world_size > 1,
+            ddp_backend=self.config.ddp_backend if self.world_size > 1 else None,
+            ddp_find_unused_parameters=False,
         )
+    
+    def train_model(self) -> bool:
+        """Train the veterinary AI model, returns False if stopped by the wall-clock budget"""
+        logger.info("🚀 Starting model training...")
         
-        # Data collator
-        data_collator = DataCollatorForLanguageModeling(
-            tokenizer=self.tokenizer,
-            mlm=False,  # Causal LM, not masked LM
-            pad_to_multiple_of=8
+        training_args = self.build_training_arguments(
+            num_train_epochs=self.config.incremental_epochs if self.incremental else None
         )
         
+        data_collator = self.build_data_collator()
+        fingerprint = self.run_fingerprint()
+        
+        callbacks = [TensorBoardCallback(self.writer), RunFingerprintCallback(fingerprint)]
+        budget_callback = None
+        if self.config.max_wall_clock_minutes:
+            budget_callback = WallClockBudgetCallback(self.config.max_wall_clock_minutes)
+            callbacks.append(budget_callback)
+        if self.config.enable_profiling:
+            callbacks.append(StepProfilerCallback(
+                self.writer,
+                summary_path=Path(self.config.output_dir) / "profile_summary.json",
+                window_steps=self.config.profile_window_steps,
+                trace_steps=self.config.profile_trace_steps,
+                trace_dir=os.path.join(self.config.output_dir, "profiler")
+            ))
+        
         # Initialize trainer
-        trainer = Trainer(
+        trainer = VeterinaryTrainer(
             model=self.model,
             args=training_args,
             train_dataset=self.train_dataset,
@@ -349,16 +731,36 @@ class VeterinaryModelTrainer:
             tokenizer=self.tokenizer,
             data_collator=data_collator,
             compute_metrics=self.compute_metrics,
-            callbacks=[TensorBoardCallback(self.writer)]
+            callbacks=callbacks
         )
         
+        # Resume from the latest checkpoint (optimizer, scheduler, RNG and data position) of this same run
+        last_checkpoint = None
+        if self.config.resume_from_checkpoint:
+            last_checkpoint = self.resumable_checkpoint(fingerprint)
+            if last_checkpoint:
+                logger.info(f"🔁 Resuming training from {last_checkpoint}")
+        
         # Start training
         logger.info("🎯 Training started...")
-        trainer.train()
+        train_output = trainer.train(resume_from_checkpoint=last_checkpoint)
+        
+        if self.accelerator.is_main_process:
+            self.log_scaling_efficiency(train_output.metrics)
+            self.log_memory_usage(training_args)
+        
+        if budget_callback and budget_callback.budget_exhausted:
+            logger.info(
+                f"⏱️ Wall-clock budget of {self.config.max_wall_clock_minutes} minutes used up at step "
+                f"{trainer.state.global_step}; checkpoint saved, rerun to continue"
+            )
+            return False
         
         # Save final model
         logger.info("💾 Saving final model...")
         trainer.save_model()
+        if not self.accelerator.is_main_process:
+            return True
         self.tokenizer.save_pretrained(self.config.output_dir)
         
         # Save training config
@@ -366,90 +768,339 @@ class VeterinaryModelTrainer:
         with open(config_path, 'w') as f:
             json.dump(self.config.__dict__, f, indent=2)
         
+        self.save_training_state(len(self.train_dataset))
+        
         logger.info(f"✅ Training complete! Model saved to {self.config.output_dir}")
+        return True
+    
+    def save_training_state(self, num_examples: int):
+        """Record the data watermark and clear this run's checkpoints once the final model is saved"""
+        state = {
+            "data_watermark": self.data_watermark,
+            "last_run": datetime.now().isoformat(),
+            "mode": "incremental" if self.incremental else "full",
+            "train_examples": num_examples,
+        }
+        with open(self.state_path, 'w') as f:
+            json.dump(state, f, indent=2)
+        
+        # The finished model supersedes the checkpoints, and leaving them would make the next run resume a completed one
+        for checkpoint in Path(self.config.output_dir).glob("checkpoint-*"):
+            shutil.rmtree(checkpoint, ignore_errors=True)
+    
+    def log_scaling_efficiency(self, metrics: Dict):
+        """Append throughput for this process count and compare it to the single-process baseline"""
+        log_path = Path(self.config.output_dir) / "scaling_log.jsonl"
+        samples_per_second = metrics.get("train_samples_per_second", 0.0)
+        
+        baseline = None
+        if log_path.exists():
+            with open(log_path, 'r') as f:
+                for line in f:
+                    entry = json.loads(line)
+                    if entry["num_processes"] == 1:
+                        baseline = entry["train_samples_per_second"]
+        if self.world_size == 1:
+            baseline = samples_per_second
+        
+        efficiency = None
+        if baseline:
+            efficiency = samples_per_second / (baseline * self.world_size)
+        
+        entry = {
+            "timestamp": datetime.now().isoformat(),
+            "num_processes": self.world_size,
+            "threads_per_process": torch.get_num_threads(),
+            "train_samples_per_second": samples_per_second,
+            "train_runtime": metrics.get("train_runtime"),
+            "scaling_efficiency": efficiency,
+        }
+        with open(log_path, 'a') as f:
+            f.write(json.dumps(entry) + '\n')
+        
+        if efficiency is not None:
+            logger.info(
+                f"📈 {samples_per_second:.2f} samples/s on {self.world_size} process(es), "
+                f"scaling efficiency {efficiency:.0%}"
+            )
+        else:
+            logger.info(f"📈 {samples_per_second:.2f} samples/s on {self.world_size} process(es), no 1-process baseline yet")
+    
+    def log_memory_usage(self, training_args: TrainingArguments):
+        """Record peak memory for this model/memory configuration in output_dir/memory_log.jsonl"""
+        # ru_maxrss is reported in kilobytes on Linux
+        peak_rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+        optim = getattr(training_args.optim, 'value', training_args.optim)
+        bf16 = training_args.bf16
+        entry = {
+            "timestamp": datetime.now().isoformat(),
+            "base_model": self.config.base_model_name,
+            "model_max_length": self.config.model_max_length,
+            "per_device_train_batch_size": self.config.per_device_train_batch_size,
+            "use_lora": self.config.use_lora,
+            "gradient_checkpointing": self.config.gradient_checkpointing,
+            "bf16": bf16,
+            "optim": optim,
+            "freeze_embeddings": self.config.freeze_embeddings,
+            "peak_rss_mb": peak_rss_mb,
+        }
+        with open(Path(self.config.output_dir) / "memory_log.jsonl", 'a') as f:
+            f.write(json.dumps(entry) + '\n')
+        
+        logger.info(f"🧠 Peak memory {peak_rss_mb:.0f} MB for {self.config.base_model_name} ({optim}, bf16={bf16})")
     
     def evaluate_model(self):
-        """Evaluate the trained model"""
+        """Evaluate the trained in-memory model on the held-out set"""
         logger.info("📊 Evaluating model performance...")
         
-        # Load the best model
-        if self.config.use_lora:
-            # For LoRA models, we need to load the adapter
-            from peft import PeftModel
-            base_model = AutoModelForCausalLM.from_pretrained(
-                self.config.base_model_name,
-                torch_dtype=torch.float16 if torch.cuda.is_available() else torch.float32,
-                device_map="auto" if torch.cuda.is_available() else None
-            )
-            model = PeftModel.from_pretrained(base_model, self.config.output_dir)
+        if self.config.eval_data_path:
+            examples = load_jsonl(self.config.eval_data_path)
         else:
-            model = AutoModelForCausalLM.from_pretrained(self.config.output_dir)
+            examples = self.eval_examples
+        examples = examples[:self.config.eval_max_samples]
         
-        model.eval()
+        if not examples:
+            logger.warning("⚠️ No held-out examples to evaluate on")
+            return None
         
-        # Test on some sample veterinary questions
-        test_questions = [
-            "My dog is vomiting and has diarrhea. What should I do?",
-            "My cat is not eating for 2 days. Is this serious?",
-            "What are the symptoms of hip dysplasia in dogs?",
-            "My bird is plucking its feathers. What could be wrong?",
-            "How often should I feed my rabbit?"
+        evaluator = VeterinaryEvaluator(
+            self.model,
+            self.prompt_template,
+            batch_size=self.config.eval_batch_size,
+            max_new_tokens=self.config.eval_max_new_tokens,
+            max_prompt_length=self.config.model_max_length // 2
+        )
+        report = evaluator.run(
+            examples,
+            [
+                tokenize_example(example, self.prompt_template, self.config.model_max_length, self.config.response_only_loss)
+                for example in examples
+            ],
+            report_path=Path(self.config.output_dir) / "eval_report.json",
+            run_info={
+                "base_model": self.config.base_model_name,
+                "use_lora": self.config.use_lora,
+                "lora_r": self.config.lora_r,
+                "model_max_length": self.config.model_max_length,
+                "eval_data_path": self.config.eval_data_path or "validation_split",
+            }
+        )
+        
+        # Log to TensorBoard
+        self.writer.add_scalar("Evaluation/perplexity", report['perplexity']['perplexity'])
+        self.writer.add_scalar("Evaluation/token_f1", report['generation']['token_f1'])
+        self.writer.add_scalar("Evaluation/samples_per_second", report['generation']['samples_per_second'])
+        for sample in report['generation']['examples'][:5]:
+            self.writer.add_text("Evaluation/Question", sample['question'])
+            self.writer.add_text("Evaluation/Response", sample['prediction'])
+        self.writer.flush()
+        
+        return report
+    
+    def merged_model(self):
+        """The fine-tuned model as a plain dense model, merging the LoRA weights once"""
+        # Merged LoRA weights give the same logits with a cheaper forward pass
+        if isinstance(self.model, PeftModel):
+            self.model = self.model.merge_and_unload()
+        return self.model
+    
+    def build_student(self, teacher):
+        """Create the student: a small pretrained model, or the teacher with only some of its layers"""
+        if self.config.student_model_name:
+            student = AutoModelForCausalLM.from_pretrained(self.config.student_model_name, low_cpu_mem_usage=True)
+            student.resize_token_embeddings(len(self.tokenizer))
+        else:
+            # Copy evenly spaced transformer blocks (GPT-2 family layout: transformer.h.<i>.*)
+            teacher_layers = teacher.config.num_hidden_layers
+            num_layers = min(self.config.student_num_layers, teacher_layers)
+            keep = [round(i * (teacher_layers - 1) / max(num_layers - 1, 1)) for i in range(num_layers)]
+            
+            student_config = copy.deepcopy(teacher.config)
+            student_config.num_hidden_layers = num_layers
+            student = AutoModelForCausalLM.from_config(student_config)
+            
+            layer_pattern = re.compile(r"\.h\.(\d+)\.")
+            state = {}
+            for key, value in teacher.state_dict().items():
+                match = layer_pattern.search(key)
+                if not match:
+                    state[key] = value
+                elif int(match.group(1)) in keep:
+                    new_index = keep.index(int(match.group(1)))
+                    state[layer_pattern.sub(f".h.{new_index}.", key, count=1)] = value
+            
+            missing, _ = student.load_state_dict(state, strict=False)
+            if any(layer_pattern.search(key) for key in missing):
+                raise ValueError(f"Cannot derive a student from {type(teacher).__name__}, set student_model_name instead")
+            logger.info(f"🎓 Student keeps teacher layers {keep} of {teacher_layers}")
+        
+        if student.get_output_embeddings().weight.shape[0] != teacher.get_output_embeddings().weight.shape[0]:
+            raise ValueError("Student and teacher vocabularies differ, distillation needs the same tokenizer")
+        return student
+    
+    def distill_student(self) -> Optional[str]:
+        """Train a smaller student on the fine-tuned model's logits and export it for inference"""
+        if self.world_size > 1:
+            # main() only keeps the main process alive after training
+            logger.warning("⚠️ Distillation runs single-process, rerun without num_processes > 1")
+            return None
+        
+        student_dir = self.config.student_output_dir or f"{self.config.output_dir}-student"
+        logger.info(f"🎓 Distilling into a smaller student model at {student_dir}")
+        
+        teacher = self.merged_model()
+        teacher.eval()
+        for param in teacher.parameters():
+            param.requires_grad = False
+        
+        student = self.build_student(teacher)
+        teacher_params = sum(p.numel() for p in teacher.parameters())
+        student_params = sum(p.numel() for p in student.parameters())
+        logger.info(f"🎓 Teacher {teacher_params / 1e6:.1f}M parameters, student {student_params / 1e6:.1f}M")
+        
+        trainer = DistillationTrainer(
+            teacher_model=teacher,
+            temperature=self.config.distill_temperature,
+            alpha=self.config.distill_alpha,
+            model=student,
+            args=self.build_training_arguments(output_dir=student_dir, num_train_epochs=self.config.distill_epochs),
+            train_dataset=self.train_dataset,
+            eval_dataset=self.eval_dataset,
+            tokenizer=self.tokenizer,
+            data_collator=self.build_data_collator(),
+            compute_metrics=self.compute_metrics,
+            callbacks=[TensorBoardCallback(self.writer)]
+        )
+        trainer.train()
+        
+        trainer.save_model()
+        self.tokenizer.save_pretrained(student_dir)
+        self.export_for_inference(model_dir=student_dir, base_model=student_dir, use_lora=False)
+        
+        logger.info(f"✅ Student model saved to {student_dir}")
+        return student_dir
+    
+    def prune_for_serving(self) -> List[Dict]:
+        """Prune heads and MLP channels at several sparsity levels, export each and report latency vs quality"""
+        if self.world_size > 1:
+            logger.warning("⚠️ Pruning runs single-process, rerun without num_processes > 1")
+            return []
+        
+        examples = self.eval_examples[:self.config.eval_max_samples]
+        if not examples:
+            logger.warning("⚠️ No validation examples to score importance on")
+            return []
+        features = [
+            tokenize_example(example, self.prompt_template, self.config.model_max_length, self.config.response_only_loss)
+            for example in examples
         ]
+        collator = self.build_data_collator()
+        
+        base = self.merged_model()
+        for param in base.parameters():
+            param.requires_grad = False
         
-        logger.info("🧪 Testing on sample questions:")
+        logger.info(f"✂️ Scoring heads and MLP channels on {min(len(features), self.config.prune_calibration_samples)} validation examples...")
+        head_scores, mlp_scores = compute_importance(
+            base, features[:self.config.prune_calibration_samples], collator, batch_size=self.config.eval_batch_size
+        )
         
-        for question in test_questions:
-            # Format input
-            formatted_input = f"<|vet|>You are a veterinary AI assistant.\nHuman: {question}\nVeterinarian:"
+        results = []
+        for sparsity in [0.0] + sorted(self.config.prune_sparsity_levels):
+            label = f"sparsity_{round(sparsity * 100)}"
+            model = base
+            pruned_dir = None
+            prune_info = {}
             
-            # Tokenize
-            inputs = self.tokenizer(
-                formatted_input,
-                return_tensors="pt",
-                truncation=True,
-                max_length=512
-            )
+            if sparsity > 0:
+                model = copy.deepcopy(base)
+                prune_info = prune_model(model, head_scores, mlp_scores, sparsity)
+                pruned_dir = f"{self.config.output_dir}-pruned-{round(sparsity * 100)}"
+                
+                if self.config.prune_recovery_steps > 0:
+                    logger.info(f"🩹 Recovery fine-tune for {self.config.prune_recovery_steps} steps")
+                    for param in model.parameters():
+                        param.requires_grad = True
+                    recovery = Trainer(
+                        model=model,
+                        args=self.build_training_arguments(
+                            output_dir=pruned_dir,
+                            max_steps=self.config.prune_recovery_steps,
+                            checkpoints=False
+                        ),
+                        train_dataset=self.train_dataset,
+                        tokenizer=self.tokenizer,
+                        data_collator=collator,
+                        callbacks=[TensorBoardCallback(self.writer)]
+                    )
+                    recovery.train()
+                    for param in model.parameters():
+                        param.requires_grad = False
             
-            if torch.cuda.is_available():
-                inputs = {k: v.cuda() for k, v in inputs.items()}
+            evaluator = VeterinaryEvaluator(
+                model,
+                self.prompt_template,
+                batch_size=self.config.eval_batch_size,
+                max_new_tokens=self.config.eval_max_new_tokens,
+                max_prompt_length=self.config.model_max_length // 2
+            )
+            report = evaluator.run(
+                examples,
+                features,
+                report_path=Path(self.config.output_dir) / "pruning" / f"{label}.json",
+                run_info={"base_model": self.config.base_model_name, "sparsity": sparsity, **prune_info}
+            )
             
-            # Generate response
-            with torch.no_grad():
-                outputs = model.generate(
-                    **inputs,
-                    max_new_tokens=200,
-                    temperature=0.7,
-                    do_sample=True,
-                    pad_token_id=self.tokenizer.pad_token_id,
-                    eos_token_id=self.tokenizer.eos_token_id
+            if pruned_dir:
+                model.save_pretrained(pruned_dir)
+                self.tokenizer.save_pretrained(pruned_dir)
+                self.export_for_inference(
+                    model_dir=pruned_dir,
+                    base_model=pruned_dir,
+                    use_lora=False,
+                    reports={"eval": Path(self.config.output_dir) / "pruning" / f"{label}.json"}
                 )
             
-            # Decode response
-            response = self.tokenizer.decode(outputs[0], skip_special_tokens=True)
-            response = response.replace(formatted_input, "").strip()
-            
-            logger.info(f"Q: {question}")
-            logger.info(f"A: {response}")
-            logger.info("-" * 80)
-            # Log to TensorBoard
-            self.writer.add_text("Evaluation/Question", question)
-            self.writer.add_text("Evaluation/Response", response)
-        self.writer.flush()
+            results.append({
+                "sparsity": sparsity,
+                "parameters": sum(p.numel() for p in model.parameters()),
+                "perplexity": report['perplexity']['perplexity'],
+                "token_f1": report['generation']['token_f1'],
+                "mean_sample_latency": report['generation']['mean_sample_latency_seconds'],
+                "batch_latency_p95": report['generation']['batch_latency_seconds'].get('p95'),
+                "samples_per_second": report['generation']['samples_per_second'],
+                "model_dir": pruned_dir or self.config.output_dir,
+                **prune_info,
+            })
+            if model is not base:
+                del model
+        
+        with open(Path(self.config.output_dir) / "pruning_report.json", 'w') as f:
+            json.dump(results, f, indent=2)
+        
+        logger.info("✂️ Pruning results (latency vs quality):")
+        for row in results:
+            logger.info(
+                f"   {row['sparsity']:>4.0%}: {row['parameters'] / 1e6:6.1f}M params, perplexity {row['perplexity']:.2f}, "
+                f"token F1 {row['token_f1']:.3f}, {row['mean_sample_latency']:.3f}s/sample, batch p95 {row['batch_latency_p95'] or 0:.3f}s -> {row['model_dir']}"
+            )
+        return results
     
-    def export_for_inference(self):
-        """Export model for production inference"""
+    def export_for_inference(self, model_dir: Optional[str] = None, base_model: Optional[str] = None,
+                             use_lora: Optional[bool] = None,
+                             reports: Optional[Dict[str, Path]] = None) -> str:
+        """Register the saved model in model_dir as a new served version (defaults to the main model)"""
         logger.info("📦 Exporting model for inference...")
         
-        inference_dir = Path(self.config.output_dir) / "inference"
-        inference_dir.mkdir(exist_ok=True)
+        model_dir = model_dir or self.config.output_dir
+        use_lora = self.config.use_lora if use_lora is None else use_lora
         
         # Create inference configuration
         inference_config = {
             "model_type": "veterinary-ai",
-            "base_model": self.config.base_model_name,
-            "use_lora": self.config.use_lora,
-            "model_path": str(self.config.output_dir),
-            "tokenizer_path": str(self.config.output_dir),
+            "backend": "torch",
+            "base_model": base_model or self.config.base_model_name,
+            "use_lora": use_lora,
             "generation_config": {
                 "max_new_tokens": 200,
                 "temperature": 0.7,
@@ -458,130 +1109,373 @@ class VeterinaryModelTrainer:
                 "repetition_penalty": 1.1
             },
             "special_tokens": {
-                "vet_start": "<|vet|>",
-                "species_start": "<|species|>",
-                "species_end": "<|species|>",
-                "human_prefix": "Human:",
-                "assistant_prefix": "Veterinarian:",
-                "eos_token": "<|endoftext|>"
+                "vet_start": VET_TOKEN,
+                "species_start": SPECIES_TOKEN,
+                "species_end": SPECIES_TOKEN,
+                "human_prefix": HUMAN_PREFIX,
+                "assistant_prefix": ASSISTANT_PREFIX,
+                "eos_token": EOS_TOKEN
             }
         }
         
-        with open(inference_dir / "config.json", 'w') as f:
-            json.dump(inference_config, f, indent=2)
-        
-        # Create inference script
-        inference_script = '''#!/usr/bin/env python3
-"""
-Veterinary AI Model Inference Server
-Production-ready inference server for the trained veterinary AI model.
-"""
-
-import torch
-from transformers import AutoTokenizer, AutoModelForCausalLM
-from peft import PeftModel
-import json
-from pathlib import Path
-
-class VeterinaryAIInference:
-    def __init__(self, model_path: str):
-        self.config = json.load(open(Path(model_path) / "inference" / "config.json"))
-        
-        # Load tokenizer
-        self.tokenizer = AutoTokenizer.from_pretrained(self.config["tokenizer_path"])
-        
-        # Load model
-        if self.config["use_lora"]:
-            base_model = AutoModelForCausalLM.from_pretrained(
-                self.config["base_model"],
-                torch_dtype=torch.float16 if torch.cuda.is_available() else torch.float32,
-                device_map="auto" if torch.cuda.is_available() else None
-            )
-            self.model = PeftModel.from_pretrained(base_model, self.config["model_path"])
-        else:
-            self.model = AutoModelForCausalLM.from_pretrained(self.config["model_path"])
+        def write_variant_config(variant_dir: Path, **overrides):
+            (variant_dir / "inference").mkdir()
+            with open(variant_dir / "inference" / "config.json", 'w') as f:
+                json.dump({**inference_config, "use_lora": False, "model_path": ".", "tokenizer_path": ".", **overrides}, f, indent=2)
         
-        self.model.eval()
-    
-    def generate_response(self, question: str, species: str = None, context: str = None) -> str:
-        """Generate veterinary advice response"""
+        def build_merged(variant_dir: Path):
+            # LoRA merged into the base weights: no adapter overhead at serving time
+            self.merged_model().save_pretrained(variant_dir)
+            self.tokenizer.save_pretrained(variant_dir)
+            write_variant_config(variant_dir)
         
-        # Format input with veterinary context
-        species_info = ""
-        if species:
-            species_info = f"<|species|>{species}<|species|> "
+        def build_onnx(variant_dir: Path):
+            try:
+                from optimum.exporters.onnx import main_export
+            except ImportError:
+                raise RuntimeError("optimum not installed")
+            merged_dir = variant_dir.parent / "merged"
+            main_export(
+                str(merged_dir if merged_dir.exists() else model_dir),
+                output=variant_dir,
+                task="text-generation-with-past"
+            )
+            self.tokenizer.save_pretrained(variant_dir)
+            write_variant_config(variant_dir, backend="onnx")
         
-        formatted_input = (
-            f"{self.config['special_tokens']['vet_start']}"
-            f"You are a veterinary AI assistant. {species_info}"
-            f"\\n{self.config['special_tokens']['human_prefix']} {question}"
-            f"\\n{self.config['special_tokens']['assistant_prefix']}"
-        )
+        builders = {"merged": build_merged, "onnx": build_onnx}
+        variants = {}
+        for name in self.config.export_variants:
+            if name not in builders:
+                logger.warning(f"⚠️ Unknown export variant '{name}'")
+            elif name == "merged" and not use_lora:
+                continue  # Already a dense model
+            else:
+                variants[name] = builders[name]
         
-        # Tokenize
-        inputs = self.tokenizer(
-            formatted_input,
-            return_tensors="pt",
-            truncation=True,
-            max_length=512
+        registry = ArtifactRegistry(model_dir)
+        version_id = registry.publish(
+            model_dir,
+            inference_config,
+            training_config=asdict(self.config),
+            variants=variants,
+            reports=reports
         )
         
-        if torch.cuda.is_available():
-            inputs = {k: v.cuda() for k, v in inputs.items()}
-        
-        # Generate
-        with torch.no_grad():
-            outputs = self.model.generate(
-                **inputs,
-                **self.config["generation_config"],
-                pad_token_id=self.tokenizer.pad_token_id,
-                eos_token_id=self.tokenizer.eos_token_id
-            )
-        
-        # Decode
-        response = self.tokenizer.decode(outputs[0], skip_special_tokens=True)
-        response = response.replace(formatted_input, "").strip()
-        
-        return response
+        logger.info(f"✅ Version {version_id} exported to {registry.version_dir(version_id)} and set as current")
+        return version_id
 
-# Example usage
-if __name__ == "__main__":
-    model = VeterinaryAIInference(".")
+def sequence_metrics(logits, labels) -> torch.Tensor:
+    """Per-sequence [nll_sum, correct_tokens, tokens] of a causal LM batch"""
+    if isinstance(logits, tuple):
+        logits = logits[0]
     
-    while True:
-        question = input("Ask a veterinary question: ")
-        if question.lower() in ['quit', 'exit']:
-            break
+    # Causal LM: position t predicts token t + 1
+    shift_logits = logits[:, :-1, :].float()
+    shift_labels = labels[:, 1:]
+    mask = shift_labels != -100
+    
+    nll = torch.nn.functional.cross_entropy(
+        shift_logits.transpose(1, 2),
+        shift_labels,
+        ignore_index=-100,
+        reduction='none'
+    ).sum(dim=1)
+    correct = ((shift_logits.argmax(dim=-1) == shift_labels) & mask).sum(dim=1)
+    
+    return torch.stack([nll, correct.float(), mask.sum(dim=1).float()], dim=1)
+
+class VeterinaryTrainer(Trainer):
+    """Trainer whose evaluation accumulates three numbers per sequence instead of logits and labels.
+
+    Both are reduced in prediction_step, before the evaluation loop gathers them, so eval
+    memory grows with the number of examples only, not with sequence length or vocabulary.
+    """
+    
+    def prediction_step(self, model, inputs, prediction_loss_only, ignore_keys=None):
+        loss, logits, labels = super().prediction_step(model, inputs, prediction_loss_only, ignore_keys=ignore_keys)
+        if logits is None or labels is None:
+            return loss, logits, labels
+        metrics = sequence_metrics(logits, labels)
+        # compute_metrics only reads the sums, the token counts stand in for the labels it requires
+        return loss, metrics, metrics[:, 2:]
+
+class DistillationTrainer(VeterinaryTrainer):
+    """Trainer that mixes the LM loss with a KL term towards a frozen teacher's logits"""
+    
+    def __init__(self, *args, teacher_model=None, temperature: float = 2.0, alpha: float = 0.5, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.teacher_model = teacher_model
+        self.temperature = temperature
+        self.alpha = alpha
+    
+    def compute_loss(self, model, inputs, return_outputs=False, **kwargs):
+        outputs = model(**inputs)
         
-        response = model.generate_response(question)
-        print(f"Veterinarian: {response}")
-        print()
-'''
+        with torch.no_grad():
+            teacher_logits = self.teacher_model(
+                input_ids=inputs['input_ids'],
+                attention_mask=inputs['attention_mask']
+            ).logits
+        
+        # Only distill on positions that predict a labelled (answer) token
+        mask = inputs['labels'][:, 1:] != -100
+        student_logits = outputs.logits[:, :-1][mask] / self.temperature
+        teacher_logits = teacher_logits[:, :-1][mask] / self.temperature
         
-        with open(inference_dir / "inference_server.py", 'w') as f:
-            f.write(inference_script)
+        kd_loss = torch.nn.functional.kl_div(
+            torch.nn.functional.log_softmax(student_logits, dim=-1),
+            torch.nn.functional.log_softmax(teacher_logits, dim=-1),
+            log_target=True,
+            reduction='batchmean'
+        ) * self.temperature ** 2
         
-        logger.info(f"✅ Inference files exported to {inference_dir}")
+        loss = self.alpha * kd_loss + (1 - self.alpha) * outputs.loss
+        return (loss, outputs) if return_outputs else loss
 
-class TensorBoardCallback:
+class TensorBoardCallback(TrainerCallback):
     def __init__(self, writer):
         self.writer = writer
         self.global_step = 0
 
     def on_log(self, args, state, control, logs=None, **kwargs):
-        if logs is not None:
+        if logs is not None and state.is_world_process_zero:
             for k, v in logs.items():
                 self.writer.add_scalar(k, v, state.global_step)
             self.writer.flush()
 
     def on_evaluate(self, args, state, control, metrics=None, **kwargs):
-        if metrics is not None:
+        if metrics is not None and state.is_world_process_zero:
             for k, v in metrics.items():
                 self.writer.add_scalar(f"eval/{k}", v, state.global_step)
             self.writer.flush()
 
-def main():
-    """Main training function optimized for 4GB RAM VPS"""
+class StepProfilerCallback(TrainerCallback):
+    """Breaks training step time into data loading, forward, backward and optimizer time.
+    
+    Forward time comes from hooks on the model, optimizer time from hooks on the optimizer,
+    and the remaining gaps are attributed using the Trainer's substep/step callbacks:
+    data loading runs from the end of one micro-step to the next forward, backward from
+    the end of the forward to the end of the micro-step (or to the optimizer step).
+    """
+    
+    def __init__(self, writer, summary_path: Path, window_steps: int = 50,
+                 trace_steps: Optional[Tuple[int, int]] = None, trace_dir: Optional[str] = None):
+        self.writer = writer
+        self.summary_path = summary_path
+        self.window_steps = window_steps
+        self.trace_steps = trace_steps
+        self.trace_dir = trace_dir
+        self.windows = []
+        self.hooks = []
+        self.profiler = None
+        self.reset_window()
+    
+    def reset_window(self):
+        self.mark = time.perf_counter()
+        self.window_start = self.mark
+        self.forward_start = None
+        self.forward_end = None
+        self.optimizer_start = None
+        self.excluded = 0.0  # Evaluation and checkpointing between steps
+        self.timings = {'data': 0.0, 'forward': 0.0, 'backward': 0.0, 'optimizer': 0.0}
+        self.samples = 0
+        self.tokens = 0
+        self.padded_tokens = 0
+        self.steps = 0
+    
+    def forward_pre_hook(self, module, args, kwargs):
+        if not module.training:
+            return
+        now = time.perf_counter()
+        self.timings['data'] += now - self.mark
+        self.forward_start = now
+        
+        input_ids = kwargs.get('input_ids')
+        attention_mask = kwargs.get('attention_mask')
+        if input_ids is not None:
+            self.samples += input_ids.shape[0]
+            self.padded_tokens += input_ids.numel()
+            self.tokens += int(attention_mask.sum()) if attention_mask is not None else input_ids.numel()
+    
+    def forward_hook(self, module, args, kwargs, output):
+        if not module.training or self.forward_start is None:
+            return
+        self.forward_end = time.perf_counter()
+        self.timings['forward'] += self.forward_end - self.forward_start
+        self.forward_start = None
+    
+    def optimizer_pre_hook(self, optimizer, args, kwargs):
+        self.optimizer_start = time.perf_counter()
+        if self.forward_end is not None:
+            self.timings['backward'] += self.optimizer_start - self.forward_end
+            self.forward_end = None
+    
+    def on_train_begin(self, args, state, control, model=None, optimizer=None, **kwargs):
+        self.hooks.append(model.register_forward_pre_hook(self.forward_pre_hook, with_kwargs=True))
+        self.hooks.append(model.register_forward_hook(self.forward_hook, with_kwargs=True))
+        # The Trainer hands over accelerate's wrapper, hooks belong on the torch optimizer inside it
+        torch_optimizer = getattr(optimizer, 'optimizer', optimizer)
+        self.hooks.append(torch_optimizer.register_step_pre_hook(self.optimizer_pre_hook))
+        self.reset_window()
+    
+    def on_step_begin(self, args, state, control, **kwargs):
+        if self.trace_steps and state.global_step + 1 == self.trace_steps[0] and self.profiler is None:
+            self.profiler = torch.profiler.profile(
+                activities=[torch.profiler.ProfilerActivity.CPU],
+                record_shapes=True,
+                profile_memory=True,
+                on_trace_ready=torch.profiler.tensorboard_trace_handler(self.trace_dir)
+            )
+            self.profiler.start()
+    
+    def on_substep_end(self, args, state, control, **kwargs):
+        now = time.perf_counter()
+        if self.forward_end is not None:
+            self.timings['backward'] += now - self.forward_end
+            self.forward_end = None
+        self.mark = now
+    
+    def on_step_end(self, args, state, control, **kwargs):
+        now = time.perf_counter()
+        if self.optimizer_start is not None:
+            self.timings['optimizer'] += now - self.optimizer_start
+            self.optimizer_start = None
+        self.mark = now
+        self.steps += 1
+        
+        if self.profiler is not None and state.global_step >= self.trace_steps[1]:
+            self.profiler.stop()
+            self.profiler = None
+            logger.info(f"🔍 torch.profiler trace written to {self.trace_dir}")
+        
+        if self.steps >= self.window_steps:
+            self.flush_window(state)
+    
+    def skip_gap(self):
+        now = time.perf_counter()
+        self.excluded += now - self.mark
+        self.mark = now
+    
+    def on_evaluate(self, args, state, control, **kwargs):
+        self.skip_gap()
+    
+    def on_save(self, args, state, control, **kwargs):
+        self.skip_gap()
+    
+    def flush_window(self, state):
+        elapsed = time.perf_counter() - self.window_start - self.excluded
+        window = {
+            'global_step': state.global_step,
+            'steps': self.steps,
+            'elapsed_seconds': elapsed,
+            **{f'{name}_seconds': value for name, value in self.timings.items()},
+            'samples_per_second': self.samples / elapsed if elapsed else 0.0,
+            'tokens_per_second': self.tokens / elapsed if elapsed else 0.0,
+            'padding_ratio': 1 - self.tokens / self.padded_tokens if self.padded_tokens else 0.0,
+            # ru_maxrss is reported in kilobytes on Linux
+            'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        }
+        self.windows.append(window)
+        
+        if state.is_world_process_zero:
+            for k, v in window.items():
+                if k != 'global_step':
+                    self.writer.add_scalar(f"profile/{k}", v, state.global_step)
+            self.writer.flush()
+        
+        self.reset_window()
+    
+    def on_train_end(self, args, state, control, **kwargs):
+        if self.profiler is not None:
+            self.profiler.stop()
+            self.profiler = None
+        if self.steps:
+            self.flush_window(state)
+        for hook in self.hooks:
+            hook.remove()
+        self.hooks = []
+        
+        if not state.is_world_process_zero or not self.windows:
+            return
+        
+        totals = {name: sum(w[f'{name}_seconds'] for w in self.windows) for name in self.timings}
+        total_time = sum(w['elapsed_seconds'] for w in self.windows)
+        summary = {
+            'total_seconds': total_time,
+            'breakdown': {name: {'seconds': value, 'share': value / total_time if total_time else 0.0}
+                          for name, value in totals.items()},
+            'mean_tokens_per_second': sum(w['tokens_per_second'] for w in self.windows) / len(self.windows),
+            'mean_samples_per_second': sum(w['samples_per_second'] for w in self.windows) / len(self.windows),
+            'mean_padding_ratio': sum(w['padding_ratio'] for w in self.windows) / len(self.windows),
+            'peak_rss_mb': max(w['peak_rss_mb'] for w in self.windows),
+            'windows': self.windows,
+        }
+        with open(self.summary_path, 'w') as f:
+            json.dump(summary, f, indent=2)
+        
+        logger.info(
+            "⏱️ Step time breakdown: " +
+            ", ".join(f"{name} {v['share']:.0%}" for name, v in summary['breakdown'].items()) +
+            f" | {summary['mean_tokens_per_second']:.0f} tokens/s, peak RSS {summary['peak_rss_mb']:.0f} MB"
+        )
+
+class RunFingerprintCallback(TrainerCallback):
+    """Stamps every checkpoint with the run fingerprint, so only the same run resumes from it"""
+    
+    def __init__(self, fingerprint: str):
+        self.fingerprint = fingerprint
+    
+    def on_save(self, args, state, control, **kwargs):
+        checkpoint_dir = Path(args.output_dir) / f"checkpoint-{state.global_step}"
+        if state.is_world_process_zero and checkpoint_dir.exists():
+            with open(checkpoint_dir / FINGERPRINT_FILE, 'w') as f:
+                json.dump({"fingerprint": self.fingerprint}, f)
+
+class WallClockBudgetCallback(TrainerCallback):
+    """Saves a checkpoint and stops training once the wall-clock budget is used up"""
+    
+    def __init__(self, max_minutes: float):
+        self.max_seconds = max_minutes * 60
+        self.start_time = None
+        self.budget_exhausted = False
+    
+    def on_train_begin(self, args, state, control, **kwargs):
+        self.start_time = time.monotonic()
+    
+    def on_step_end(self, args, state, control, **kwargs):
+        exhausted = time.monotonic() - self.start_time >= self.max_seconds
+        if torch.distributed.is_available() and torch.distributed.is_initialized():
+            # Every rank must stop on the same step, or the others block in the next all-reduce
+            flag = torch.tensor([int(exhausted)])
+            torch.distributed.all_reduce(flag, op=torch.distributed.ReduceOp.MAX)
+            exhausted = bool(flag.item())
+        if exhausted:
+            self.budget_exhausted = True
+            control.should_save = True
+            control.should_training_stop = True
+        return control
+
+def launch_data_parallel(config: ModelConfig):
+    """Relaunch this script with one torch.distributed worker per configured CPU process"""
+    threads = config.threads_per_process or max(1, (os.cpu_count() or 1) // config.num_processes)
+    env = dict(os.environ, OMP_NUM_THREADS=str(threads))
+    
+    logger.info(f"🚀 Launching {config.num_processes} CPU training processes with {threads} threads each")
+    subprocess.run(
+        [
+            sys.executable, "-m", "torch.distributed.run",
+            "--standalone",
+            f"--nproc_per_node={config.num_processes}",
+            os.path.abspath(__file__),
+            *sys.argv[1:],
+        ],
+        env=env,
+        check=True
+    )
+
+def vps_config(**overrides) -> ModelConfig:
+    """The production configuration, also the base that sweep.py varies"""
     # Configuration optimized for low-memory VPS
     config = ModelConfig(
         base_model_name="microsoft/DialoGPT-small",  # Smaller model for 4GB RAM
@@ -601,11 +1495,30 @@ def main():
         save_steps=1000,
         logging_steps=200,
     )
+    return replace(config, **overrides)
+
+def main():
+    """Main training function optimized for 4GB RAM VPS"""
+    parser = argparse.ArgumentParser(description="Train the veterinary AI model")
+    parser.add_argument('--incremental', action='store_true',
+                        help="Refresh the last exported model on training pairs added since the previous run")
+    parser.add_argument('--distill', action='store_true',
+                        help="Also distill the fine-tuned model into a smaller student for serving")
+    parser.add_argument('--prune', action='store_true',
+                        help="Also export pruned models at several sparsity levels and report latency vs quality")
+    args = parser.parse_args()
+    
+    config = vps_config(incremental=args.incremental, distill=args.distill, prune=args.prune)
+    
+    if config.num_processes > 1 and "WORLD_SIZE" not in os.environ:
+        launch_data_parallel(config)
+        return
     
     print("🔧 VPS Configuration (2vCPU, 4GB RAM):")
     print(f"   - Model: {config.base_model_name} (small)")
     print(f"   - Batch size: {config.per_device_train_batch_size} (memory optimized)")
     print(f"   - Max samples: {config.max_samples} (for faster training)")
+    print(f"   - Low-memory mode: {config.low_memory} (set low_memory=True to fit DialoGPT-medium)")
     print(f"   - Expected training time: 3-6 hours")
     print()
     
@@ -617,16 +1530,30 @@ def main():
         trainer.load_and_prepare_model()
         
         # Load and prepare data
-        trainer.load_and_prepare_data()
+        if not trainer.load_and_prepare_data():
+            return
+        
+        # Train model (stops early and exits cleanly if the wall-clock budget runs out)
+        if not trainer.train_model():
+            return
         
-        # Train model
-        trainer.train_model()
+        # Evaluation and export only need to happen once
+        if not trainer.accelerator.is_main_process:
+            return
         
         # Evaluate model
         trainer.evaluate_model()
         
         # Export for inference
-        trainer.export_for_inference()
+        trainer.export_for_inference(reports={"eval": Path(config.output_dir) / "eval_report.json"})
+        
+        # Optionally distill a cheaper serving model (merges the LoRA weights, so this comes last)
+        if config.distill:
+            trainer.distill_student()
+        
+        # Optionally prune heads and MLP channels for cheaper serving (also works on the merged model)
+        if config.prune:
+            trainer.prune_for_serving()
         
         logger.info("🎉 Training pipeline complete!")
         
@@ -638,7 +1565,7 @@ def main():
         # Cleanup
         # if config.use_wandb: # Wandb removed
         #     wandb.finish()
-        trainer.__del__()
+        trainer.writer.close()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
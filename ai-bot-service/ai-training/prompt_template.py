@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Veterinary AI Prompt Template
+The single definition of the conversation format, shared by training
+(model_trainer.py), evaluation (evaluation.py) and serving
+(inference_server.py) so the model sees the same prompt everywhere:
+
+    <|vet|><|species|>dog, cat<|species|> Category: nutrition.
+    Human: {question}
+    Veterinarian: {answer}<|endoftext|>
+
+The static segments are tokenized once when the template is built, species
+and category headers are cached, and prompts are assembled from token ids, so
+per example only the question (and answer) text goes through the tokenizer.
+Every segment starts at a pre-tokenization boundary (a special token, a
+newline or a space), which makes the assembled ids identical to tokenizing
+the whole rendered string.
+"""
+
+import copy
+import json
+from typing import Dict, List, Optional, Tuple
+
+VET_TOKEN = "<|vet|>"
+SPECIES_TOKEN = "<|species|>"
+EOS_TOKEN = "<|endoftext|>"
+HUMAN_PREFIX = "Human:"
+ASSISTANT_PREFIX = "Veterinarian:"
+
+def parse_metadata(metadata) -> Tuple[Tuple[str, ...], str]:
+    """(species, category) from example metadata, which may arrive as a JSON string"""
+    if not metadata:
+        return (), 'general'
+    if isinstance(metadata, str):
+        metadata = json.loads(metadata)
+
+    species = metadata.get('species') or []
+    if isinstance(species, str):
+        species = [species]
+    species = tuple(s for s in species if s and s != 'general')
+    return species, metadata.get('category') or 'general'
+
+def right_padded(tokenizer):
+    """A shallow copy of the tokenizer that pads on the right, for training and scoring batches.
+
+    GPT-2 numbers positions from the first column, so left pads would shift every
+    token's position away from the one it gets at generation time.
+    """
+    tokenizer = copy.copy(tokenizer)
+    tokenizer.padding_side = "right"
+    return tokenizer
+
+class PromptTemplate:
+    """Builds prompt/answer token ids for one tokenizer"""
+
+    def __init__(self, tokenizer):
+        self.tokenizer = tokenizer
+        self.vet_ids = self.encode(VET_TOKEN)
+        self.human_ids = self.encode(f"\n{HUMAN_PREFIX}")
+        self.assistant_ids = self.encode(f"\n{ASSISTANT_PREFIX}")
+        self.eos_ids = self.encode(EOS_TOKEN)
+        self.header_cache: Dict[Tuple[Tuple[str, ...], str], List[int]] = {}
+
+    def encode(self, text: str) -> List[int]:
+        return self.tokenizer(text, add_special_tokens=False)['input_ids']
+
+    @staticmethod
+    def header_text(species: Tuple[str, ...], category: str) -> str:
+        text = f"{SPECIES_TOKEN}{', '.join(species)}{SPECIES_TOKEN}" if species else ""
+        if category != 'general':
+            text += f" Category: {category}."
+        return text
+
+    def header_ids(self, metadata) -> List[int]:
+        """<|vet|> plus the species/category header, cached per distinct combination"""
+        key = parse_metadata(metadata)
+        if key not in self.header_cache:
+            self.header_cache[key] = self.vet_ids + self.encode(self.header_text(*key))
+        return self.header_cache[key]
+
+    def encode_prompt(self, question: str, metadata=None, max_length: Optional[int] = None) -> List[int]:
+        """Prompt token ids; a long question is cut so the 'Veterinarian:' cue always stays at the end"""
+        head = self.header_ids(metadata) + self.human_ids
+        question_ids = self.encode(f" {question.strip()}")
+        if max_length is not None:
+            question_ids = question_ids[:max(0, max_length - len(head) - len(self.assistant_ids))]
+        return head + question_ids + self.assistant_ids
+
+    def encode_answer(self, answer: str) -> List[int]:
+        return self.encode(f" {answer.strip()}") + self.eos_ids
+
+    def pad_prompts(self, prompts: List[List[int]]) -> Dict:
+        """Pad a batch of prompt ids into tensors (left padding for generation, per the tokenizer)"""
+        return self.tokenizer.pad({'input_ids': prompts}, return_tensors="pt")
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+Veterinary AI Structured Pruning
+Removes the least important attention heads and MLP channels of a fine-tuned
+GPT-2 family model. Importance is a first-order Taylor score measured on our
+veterinary validation data, and the result stays a normal dense checkpoint
+that inference_server.py loads with from_pretrained.
+"""
+
+import logging
+import torch
+from typing import Dict, List, Tuple
+
+from transformers.pytorch_utils import prune_conv1d_layer
+
+logger = logging.getLogger(__name__)
+
+def compute_importance(model, features: List[Dict], collator, batch_size: int = 8) -> Tuple[torch.Tensor, torch.Tensor]:
+    """Score every attention head and MLP channel by |activation * gradient| of the LM loss.
+
+    Returns (head_scores [n_layer, n_head], mlp_scores [n_layer, n_inner]).
+    """
+    blocks = model.transformer.h
+    n_head = model.config.n_head
+    head_scores = torch.zeros(len(blocks), n_head)
+    mlp_scores = torch.zeros(len(blocks), blocks[0].mlp.c_proj.weight.shape[0])
+
+    captured = {}
+    hooks = []
+
+    def capture(name):
+        def hook(module, args):
+            args[0].retain_grad()
+            captured[name] = args[0]
+        return hook
+
+    for i, block in enumerate(blocks):
+        # c_proj inputs are the concatenated head outputs and the post-activation MLP channels
+        hooks.append(block.attn.c_proj.register_forward_pre_hook(capture(('attn', i))))
+        hooks.append(block.mlp.c_proj.register_forward_pre_hook(capture(('mlp', i))))
+
+    # Gradients are only needed for activations, so make the embeddings output require grad
+    # instead of materialising weight gradients for the whole model
+    hooks.append(model.get_input_embeddings().register_forward_hook(lambda module, args, output: output.requires_grad_(True)))
+
+    was_training = model.training
+    model.eval()
+    try:
+        for i in range(0, len(features), batch_size):
+            batch = collator(features[i:i + batch_size])
+            batch = {k: v.to(model.device) for k, v in batch.items()}
+
+            with torch.enable_grad():
+                loss = model(**batch).loss
+                loss.backward()
+
+            for (kind, layer), activation in captured.items():
+                contribution = (activation * activation.grad).detach()
+                if kind == 'attn':
+                    batch_size_, seq_len, hidden = contribution.shape
+                    per_head = contribution.view(batch_size_, seq_len, n_head, hidden // n_head).sum(dim=-1)
+                    head_scores[layer] += per_head.abs().sum(dim=(0, 1)).cpu()
+                else:
+                    mlp_scores[layer] += contribution.abs().sum(dim=(0, 1)).cpu()
+            captured.clear()
+    finally:
+        for hook in hooks:
+            hook.remove()
+        if was_training:
+            model.train()
+
+    return head_scores, mlp_scores
+
+def prune_model(model, head_scores: torch.Tensor, mlp_scores: torch.Tensor, sparsity: float) -> Dict:
+    """Prune the lowest scoring heads (globally) and MLP channels (same count per layer) in place.
+
+    MLP channels are pruned uniformly because GPT-2 configs have a single n_inner,
+    which keeps the pruned checkpoint loadable with from_pretrained.
+    """
+    n_layer, n_head = head_scores.shape
+
+    # Heads: global ranking, but always keep at least one head per layer
+    heads_to_prune = {}
+    budget = int(n_layer * n_head * sparsity)
+    for index in head_scores.flatten().argsort().tolist():
+        if budget == 0:
+            break
+        layer, head = divmod(index, n_head)
+        if len(heads_to_prune.get(layer, [])) < n_head - 1:
+            heads_to_prune.setdefault(layer, []).append(head)
+            budget -= 1
+    model.prune_heads(heads_to_prune)
+
+    # MLP channels: keep the top scoring ones in every layer
+    n_inner = mlp_scores.shape[1]
+    keep = max(1, round(n_inner * (1 - sparsity)))
+    for layer, block in enumerate(model.transformer.h):
+        index = mlp_scores[layer].topk(keep).indices.sort().values
+        block.mlp.c_fc = prune_conv1d_layer(block.mlp.c_fc, index, dim=1)
+        block.mlp.c_proj = prune_conv1d_layer(block.mlp.c_proj, index, dim=0)
+    model.config.n_inner = keep
+
+    pruned_heads = sum(len(heads) for heads in heads_to_prune.values())
+    logger.info(
+        f"✂️ Sparsity {sparsity:.0%}: pruned {pruned_heads}/{n_layer * n_head} heads, "
+        f"MLP width {n_inner} -> {keep}"
+    )
+    return {'pruned_heads': pruned_heads, 'total_heads': n_layer * n_head, 'mlp_width': keep}
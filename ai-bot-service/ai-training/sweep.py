@@ -0,0 +1,265 @@
+#!/usr/bin/env python3
+"""
+Veterinary AI Hyperparameter Sweep
+Runs trials over ModelConfig fields (LoRA r/alpha, learning rate, max length,
+target modules, ...) on top of the production config from model_trainer.py.
+
+Trials run as parallel processes that share the CPU budget, and reuse the
+tokenized datasets cached by the trainer. Poor trials are stopped early with
+successive halving: every trial trains for ``min_steps``, only the best
+1/``eta`` by eval loss continue to ``min_steps * eta``, and so on. All trials
+of a sweep share one learning-rate schedule length (the last rung), so a trial
+that is continued resumes from its checkpoint exactly where it stopped.
+
+    python sweep.py run [--space space.json] [--num-trials 12] [--parallel 2]
+    python sweep.py trial <trial_dir> --stop-at <steps>   (used internally)
+
+Results are written to ``sweeps/<name>/results.csv`` and ``results.json``.
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import itertools
+import logging
+import subprocess
+from pathlib import Path
+from typing import Dict, List
+from datetime import datetime
+from dataclasses import asdict
+
+import pandas as pd
+
+# Setup logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Searched when no --space file is given
+DEFAULT_SPACE = {
+    "lora_r": [8, 16, 32],
+    "lora_alpha": [16, 32],
+    "learning_rate": [1e-4, 2e-4, 3e-4],
+    "model_max_length": [256, 512],
+    "lora_target_modules": [["c_attn"], ["c_attn", "c_proj"]],
+}
+
+def sample_trials(space: Dict[str, List], num_trials: int, seed: int) -> List[Dict]:
+    """Random subset of the full grid (the whole grid if it is small enough)"""
+    keys = list(space)
+    grid = [dict(zip(keys, values)) for values in itertools.product(*(space[k] for k in keys))]
+    if num_trials and num_trials < len(grid):
+        grid = random.Random(seed).sample(grid, num_trials)
+    return grid
+
+def trial_config(params: Dict, trial_dir: Path, cache_dir: Path, threads: int):
+    """Production config with the trial's overrides, trimmed for short comparable runs"""
+    from model_trainer import vps_config
+
+    return vps_config(
+        **params,
+        output_dir=str(trial_dir),
+        tokenized_cache_dir=str(cache_dir),
+        threads_per_process=threads,
+        num_processes=1,
+        resume_from_checkpoint=True,
+        max_wall_clock_minutes=None,
+        enable_profiling=False,
+        incremental=False,
+    )
+
+def prepare_caches(trials: List[Dict], sweep_dir: Path, cache_dir: Path):
+    """Tokenize once per distinct data setting before trials start, so they never race on the cache"""
+    from model_trainer import VeterinaryModelTrainer
+
+    prepared = set()
+    for params in trials:
+        trainer = VeterinaryModelTrainer(trial_config(params, sweep_dir / "cache_prep", cache_dir, None))
+        cache_path = trainer.tokenized_cache_path()
+        if cache_path and cache_path not in prepared:
+            trainer.load_tokenizer()
+            trainer.load_and_prepare_data()
+            prepared.add(cache_path)
+        trainer.writer.close()
+
+def run_rung(trial_dirs: List[Path], stop_at: int, parallel: int, threads: int) -> Dict[Path, Dict]:
+    """Train the given trials up to stop_at steps, at most `parallel` at a time"""
+    env = {**os.environ, "OMP_NUM_THREADS": str(threads), "MKL_NUM_THREADS": str(threads)}
+    pending = list(trial_dirs)
+    running = []
+    results = {}
+
+    while pending or running:
+        while pending and len(running) < parallel:
+            trial_dir = pending.pop(0)
+            log = open(trial_dir / "trial.log", 'a')
+            process = subprocess.Popen(
+                [sys.executable, __file__, "trial", str(trial_dir), "--stop-at", str(stop_at)],
+                stdout=log, stderr=subprocess.STDOUT, env=env
+            )
+            running.append((trial_dir, process, log))
+
+        for entry in list(running):
+            trial_dir, process, log = entry
+            if process.poll() is None:
+                continue
+            running.remove(entry)
+            log.close()
+
+            result_path = trial_dir / f"result_{stop_at}.json"
+            if process.returncode == 0 and result_path.exists():
+                with open(result_path, 'r') as f:
+                    results[trial_dir] = json.load(f)
+            else:
+                logger.warning(f"⚠️ {trial_dir.name} failed (exit code {process.returncode}), see {trial_dir / 'trial.log'}")
+                results[trial_dir] = {"eval_loss": float('inf'), "failed": True}
+        time.sleep(1)
+
+    return results
+
+def run_sweep(args):
+    space = DEFAULT_SPACE
+    if args.space:
+        with open(args.space, 'r') as f:
+            space = json.load(f)
+
+    trials = sample_trials(space, args.num_trials, args.seed)
+    sweep_dir = Path(args.output_dir) / (args.name or datetime.now().strftime('%Y%m%d_%H%M%S'))
+    cache_dir = Path(args.cache_dir)
+    threads = max(1, args.cpus // args.parallel)
+    max_steps = args.min_steps * args.eta ** (args.rungs - 1)
+
+    logger.info(
+        f"🔬 Sweep {sweep_dir.name}: {len(trials)} trials, {args.rungs} rungs of successive halving "
+        f"(eta={args.eta}, {args.min_steps}-{max_steps} steps), {args.parallel} parallel x {threads} threads"
+    )
+
+    trial_dirs = []
+    for i, params in enumerate(trials):
+        trial_dir = sweep_dir / f"trial_{i:03d}"
+        trial_dir.mkdir(parents=True, exist_ok=True)
+        with open(trial_dir / "trial.json", 'w') as f:
+            json.dump({"params": params, "max_steps": max_steps, "cache_dir": str(cache_dir), "threads": threads}, f, indent=2)
+        trial_dirs.append(trial_dir)
+
+    prepare_caches(trials, sweep_dir, cache_dir)
+
+    rows = {trial_dir: {"trial": trial_dir.name, **params} for trial_dir, params in zip(trial_dirs, trials)}
+    alive = trial_dirs
+    for rung in range(args.rungs):
+        stop_at = args.min_steps * args.eta ** rung
+        logger.info(f"🪜 Rung {rung}: training {len(alive)} trials to step {stop_at}")
+        results = run_rung(alive, stop_at, args.parallel, threads)
+
+        for trial_dir, result in results.items():
+            rows[trial_dir].update({
+                "steps": stop_at,
+                "rung": rung,
+                "eval_loss": result["eval_loss"],
+                "eval_perplexity": result.get("eval_perplexity"),
+                "train_seconds": result.get("train_seconds"),
+            })
+
+        ranked = sorted(alive, key=lambda d: results[d]["eval_loss"])
+        alive = [d for d in ranked[:max(1, len(ranked) // args.eta)] if not results[d].get("failed")]
+        if not alive:
+            break
+
+    table = pd.DataFrame(list(rows.values())).sort_values(["rung", "eval_loss"], ascending=[False, True])
+    table.to_csv(sweep_dir / "results.csv", index=False)
+    table.to_json(sweep_dir / "results.json", orient="records", indent=2)
+
+    print(table.to_string(index=False))
+    logger.info(f"✅ Best trial {table.iloc[0]['trial']} (eval loss {table.iloc[0]['eval_loss']:.4f}), results in {sweep_dir}")
+
+def run_trial(args):
+    """Train one trial up to --stop-at steps (resuming its last checkpoint) and record eval loss"""
+    from transformers import TrainerCallback
+    from transformers.trainer_utils import get_last_checkpoint
+    from model_trainer import VeterinaryModelTrainer, VeterinaryTrainer, TensorBoardCallback
+
+    class RungStopCallback(TrainerCallback):
+        """Checkpoints and stops at the end of a rung"""
+
+        def __init__(self, stop_at: int):
+            self.stop_at = stop_at
+
+        def on_step_end(self, args, state, control, **kwargs):
+            if state.global_step >= self.stop_at:
+                control.should_save = True
+                control.should_training_stop = True
+            return control
+
+    trial_dir = Path(args.trial_dir)
+    with open(trial_dir / "trial.json", 'r') as f:
+        trial = json.load(f)
+
+    config = trial_config(trial["params"], trial_dir, Path(trial["cache_dir"]), trial["threads"])
+    # Evaluation happens once per rung below, not on the main run's schedule
+    config.eval_steps = config.save_steps = trial["max_steps"]
+
+    trainer = VeterinaryModelTrainer(config)
+    trainer.load_and_prepare_model()
+    trainer.load_and_prepare_data()
+
+    training_args = trainer.build_training_arguments(max_steps=trial["max_steps"])
+    training_args.load_best_model_at_end = False  # Rungs compare where each trial is now
+
+    hf_trainer = VeterinaryTrainer(
+        model=trainer.model,
+        args=training_args,
+        train_dataset=trainer.train_dataset,
+        eval_dataset=trainer.eval_dataset,
+        tokenizer=trainer.tokenizer,
+        data_collator=trainer.build_data_collator(),
+        compute_metrics=trainer.compute_metrics,
+        callbacks=[TensorBoardCallback(trainer.writer), RungStopCallback(args.stop_at)]
+    )
+
+    start = time.perf_counter()
+    hf_trainer.train(resume_from_checkpoint=get_last_checkpoint(str(trial_dir)))
+    train_seconds = time.perf_counter() - start
+    metrics = hf_trainer.evaluate()
+    trainer.writer.close()
+
+    result = {
+        "params": trial["params"],
+        "steps": hf_trainer.state.global_step,
+        "eval_loss": metrics["eval_loss"],
+        "eval_perplexity": metrics.get("eval_perplexity"),
+        "train_seconds": train_seconds,
+        "config": asdict(config),
+    }
+    with open(trial_dir / f"result_{args.stop_at}.json", 'w') as f:
+        json.dump(result, f, indent=2, default=str)
+
+def main():
+    parser = argparse.ArgumentParser(description="Hyperparameter sweep for the veterinary AI model")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    run = subparsers.add_parser('run', help="Run a successive-halving sweep")
+    run.add_argument('--space', help="JSON file mapping ModelConfig fields to lists of values")
+    run.add_argument('--num-trials', type=int, default=12, help="Random sample of the grid, 0 for the full grid")
+    run.add_argument('--min-steps', type=int, default=50, help="Optimizer steps in the first rung")
+    run.add_argument('--eta', type=int, default=3, help="Keep the best 1/eta trials after each rung")
+    run.add_argument('--rungs', type=int, default=3)
+    run.add_argument('--cpus', type=int, default=os.cpu_count() or 1, help="CPU threads shared by all trials")
+    run.add_argument('--parallel', type=int, default=2, help="Trials training at the same time")
+    run.add_argument('--output-dir', default="sweeps")
+    run.add_argument('--cache-dir', default="data/tokenized_cache")
+    run.add_argument('--name', help="Sweep name (default: timestamp)")
+    run.add_argument('--seed', type=int, default=42)
+    run.set_defaults(func=run_sweep)
+
+    trial = subparsers.add_parser('trial', help="Run one trial up to a step (used by 'run')")
+    trial.add_argument('trial_dir')
+    trial.add_argument('--stop-at', type=int, required=True)
+    trial.set_defaults(func=run_trial)
+
+    args = parser.parse_args()
+    args.func(args)
+
+if __name__ == "__main__":
+    main()